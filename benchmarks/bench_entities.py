@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from typing import Any, Callable
+
+from fixtures import COMMAND_UPDATE, TAGGED_UPDATE, UPDATES
+from harness import benchmark
+
+from entities import Message
+
+
+@benchmark
+def message_from_json() -> Callable[[], Any]:
+    messages = [update["message"] for update in UPDATES]
+    return lambda: [Message.from_json(message) for message in messages]
+
+
+@benchmark
+def message_command() -> Callable[[], Any]:
+    # command is a cached property, so every call parses a fresh message
+    message_json = COMMAND_UPDATE["message"]
+    return lambda: Message.from_json(message_json).command
+
+
+@benchmark
+def message_get_tags() -> Callable[[], Any]:
+    message = Message.from_json(TAGGED_UPDATE["message"])
+    return message.get_tags
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from copy import deepcopy
+from typing import Any, Callable
+
+from fixtures import COMMAND_UPDATE
+from harness import benchmark
+
+from command_handlers import CommandHandlerRegistry
+from entities import Message
+
+
+@benchmark
+def command_dispatch() -> Callable[[], Any]:
+    commands = []
+    for command_str in ("link", "help", "ping", "unknown") * 5:
+        message_json = deepcopy(COMMAND_UPDATE["message"])
+        message_json["text"] = f"/{command_str}"
+        message_json["entities"][0]["length"] = len(command_str) + 1
+        commands.append(Message.from_json(message_json).command)
+
+    def dispatch() -> None:
+        for command in commands:
+            assert command
+            handler_class = CommandHandlerRegistry.get_for_command_str(
+                command.command_str
+            )
+            if handler_class:
+                handler = handler_class(None, None, None, None)  # type: ignore
+                handler.validate(command)
+
+    return dispatch
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+from logging.handlers import QueueListener
+from typing import Any, Callable
+
+from fixtures import API_URL, COMMAND_UPDATE
+from harness import benchmark
+
+from utils.logging import CustomFormatter, JsonFormatter, NonFormattingQueueHandler
+
+LOG_FORMAT = "%(asctime)s %(levelname)-5s %(name)-16s > %(message)s"
+
+
+def _make_record() -> logging.LogRecord:
+    return logging.LogRecord(
+        "happy_bot.telegram_client",
+        logging.DEBUG,
+        __file__,
+        1,
+        "GET %s %s",
+        (API_URL, COMMAND_UPDATE),
+        None,
+    )
+
+
+@benchmark
+def custom_formatter_format() -> Callable[[], Any]:
+    formatter = CustomFormatter(LOG_FORMAT)
+    return lambda: formatter.format(_make_record())
+
+
+@benchmark
+def json_formatter_format() -> Callable[[], Any]:
+    formatter = JsonFormatter()
+    return lambda: formatter.format(_make_record())
+
+
+def _make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+@benchmark
+def log_update_sync() -> Callable[[], Any]:
+    # what a logging call costs the event loop with a stream handler
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(CustomFormatter(LOG_FORMAT))
+    logger = _make_logger("bench.sync", handler)
+    return lambda: logger.debug("Processing new update: %s", COMMAND_UPDATE)
+
+
+@benchmark
+def log_update_queue() -> Callable[[], Any]:
+    # the same call with the queue handler, formatting happens in the listener
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(CustomFormatter(LOG_FORMAT))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    QueueListener(log_queue, handler).start()
+    logger = _make_logger("bench.queue", NonFormattingQueueHandler(log_queue))
+    return lambda: logger.debug("Processing new update: %s", COMMAND_UPDATE)
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable
+
+from harness import benchmark
+
+from task_manager import TaskManager
+
+TASKS = 2000
+
+
+@benchmark
+def task_manager_throughput() -> Callable[[], Any]:
+    # TASKS short tasks through a single lane, measures scheduling overhead of the
+    # event loop and the limiter; run with --uvloop to compare loops
+    async def job() -> None:
+        await asyncio.sleep(0)
+
+    async def run() -> None:
+        task_manager = TaskManager(max_parallel_tasks=100)
+        for _ in range(TASKS):
+            await task_manager.run_task(job())
+        await task_manager.drain(10)
+
+    return lambda: asyncio.run(run())
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable
+
+from fixtures import API_URL, LOG_MESSAGES, UPDATES
+from harness import benchmark
+from legacy_privacy import redact_bot_token as legacy_redact_bot_token
+from legacy_privacy import redacted_dict_copy as legacy_redacted_dict_copy
+
+from utils.privacy import redact, redact_bot_token
+
+
+@benchmark
+def redact_updates() -> Callable[[], Any]:
+    return lambda: [redact(update) for update in UPDATES]
+
+
+@benchmark
+def redact_updates_legacy() -> Callable[[], Any]:
+    return lambda: [legacy_redacted_dict_copy(update) for update in UPDATES]
+
+
+@benchmark
+def redacted_json_updates() -> Callable[[], Any]:
+    return lambda: [json.dumps(redact(update)) for update in UPDATES]
+
+
+@benchmark
+def redacted_json_updates_legacy() -> Callable[[], Any]:
+    return lambda: [json.dumps(legacy_redacted_dict_copy(update)) for update in UPDATES]
+
+
+@benchmark
+def redact_bot_token_url() -> Callable[[], Any]:
+    urls = [API_URL] * 20
+    return lambda: [redact_bot_token(url) for url in urls]
+
+
+@benchmark
+def redact_bot_token_log_messages() -> Callable[[], Any]:
+    return lambda: [redact_bot_token(message) for message in LOG_MESSAGES]
+
+
+@benchmark
+def redact_bot_token_log_messages_legacy() -> Callable[[], Any]:
+    return lambda: [legacy_redact_bot_token(message) for message in LOG_MESSAGES]
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from typing import Any, Callable
+
+from fixtures import EVENT
+from harness import benchmark
+
+from pubsub import RedisPubSub
+
+
+@benchmark
+def pubsub_parse_event() -> Callable[[], Any]:
+    return lambda: RedisPubSub._parse_event(EVENT)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+
+from http_server import HttpServer, Request, Response
+from utils.stats import LatencyStats
+
+
+class FakeTelegram:
+    # stands in for the Bot API: updates pushed with add_update() are served from
+    # getUpdates, and replies sent back by the bot are matched to the updates that
+    # caused them to measure the latency
+    MAX_UPDATES = 100
+    MAX_POLL_TIMEOUT = 1.0
+
+    def __init__(
+        self,
+        server: HttpServer,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.updates: deque[dict] = deque()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.stats = LatencyStats(window_size=1_000_000)
+        self.calls: Counter[str] = Counter()
+        self.throttled = 0
+        # (chat id, message id) -> enqueued at, for updates that expect a reply
+        self.pending_replies: dict[tuple[int, int], float] = {}
+        # chat id -> enqueued at, for replies not tied to a message (events)
+        self.pending_posts: defaultdict[int, deque[float]] = defaultdict(deque)
+        self._updates_added = asyncio.Event()
+
+        server.add_route("/bot*", self.dispatch)
+
+    def add_update(self, message: dict, expects_reply: bool = True) -> None:
+        message = {**message, "message_id": self.next_message_id}
+        update = {"update_id": self.next_update_id, "message": message}
+        self.next_update_id += 1
+        self.next_message_id += 1
+
+        if expects_reply:
+            key = (message["chat"]["id"], message["message_id"])
+            self.pending_replies[key] = time.perf_counter()
+        self.updates.append(update)
+        self._updates_added.set()
+
+    def expect_post(self, chat_id: int) -> None:
+        self.pending_posts[chat_id].append(time.perf_counter())
+
+    def close(self) -> None:
+        # wakes up pending long polls, so the server can be stopped
+        self._updates_added.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self.pending_replies) + sum(map(len, self.pending_posts.values()))
+
+    async def dispatch(self, request: Request) -> Response:
+        _, _, method = request.path.rpartition("/")
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        if method == "getUpdates":
+            return await self.get_updates(request)
+
+        body = request.json()
+        if random.random() < self.error_rate:
+            self.throttled += 1
+            self._resolve(body, error=True)
+            return Response.json(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                },
+                429,
+            )
+
+        self._resolve(body)
+        if method == "sendMessage":
+            result = {
+                "message_id": self.next_message_id,
+                "date": int(time.time()),
+                "chat": {"id": body["chat_id"], "type": "private"},
+                "text": body.get("text"),
+            }
+            self.next_message_id += 1
+            return Response.json({"ok": True, "result": result})
+        return Response.json({"ok": True, "result": True})
+
+    def _resolve(self, body: dict, error: bool = False) -> None:
+        if (chat_id := body.get("chat_id")) is None:
+            return None
+
+        started_at = None
+        if reply_to := body.get("reply_to_message_id"):
+            started_at = self.pending_replies.pop((chat_id, reply_to), None)
+        elif self.pending_posts.get(chat_id):
+            started_at = self.pending_posts[chat_id].popleft()
+
+        if started_at is not None:
+            self.stats.observe(time.perf_counter() - started_at, error=error)
+
+    async def get_updates(self, request: Request) -> Response:
+        offset = int(request.query.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+
+        if not self.updates:
+            # long polling, capped so that the bot notices new updates quickly
+            timeout = min(float(request.query.get("timeout", 0)), self.MAX_POLL_TIMEOUT)
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        limit = int(request.query.get("limit") or self.MAX_UPDATES)
+        result = list(self.updates)[: min(limit, self.MAX_UPDATES)]
+        return Response.json({"ok": True, "result": result})
+
+
+class FakeWebapp:
+    # mints link urls like the web app's internal bot_token endpoint, and remembers
+    # the tokens so that scenarios can send matching bot_account_linked events
+    def __init__(self, server: HttpServer, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.tokens: dict[str, str] = {}
+        server.add_route("/_int/users/bot_token/", self.bot_token)
+
+    async def bot_token(self, request: Request) -> Response:
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        token = request.json()["token"]
+        url = self.tokens.setdefault(token, f"/link/{uuid.uuid4().hex}")
+        return Response.json({"url": url})
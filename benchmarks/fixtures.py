@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+
+PRIVATE_CHAT = {
+    "id": 125504090,
+    "first_name": "Alex",
+    "username": "alex",
+    "type": "private",
+}
+GROUP_CHAT = {"id": -1001172399514, "title": "Daily notes", "type": "supergroup"}
+USER = {
+    "id": 125504090,
+    "is_bot": False,
+    "first_name": "Alex",
+    "last_name": "Smith",
+    "username": "alex",
+    "language_code": "en",
+}
+
+COMMAND_UPDATE: dict[str, Any] = {
+    "update_id": 735067591,
+    "message": {
+        "message_id": 1401,
+        "from": USER,
+        "chat": PRIVATE_CHAT,
+        "date": 1641987371,
+        "text": "/link@happy_bot now",
+        "entities": [{"offset": 0, "length": 15, "type": "bot_command"}],
+    },
+}
+
+TAGGED_UPDATE: dict[str, Any] = {
+    "update_id": 735067592,
+    "message": {
+        "message_id": 1402,
+        "from": USER,
+        "chat": GROUP_CHAT,
+        "date": 1641987372,
+        "text": "Finished the report #work #Q1 and went for a run #sport #health",
+        "entities": [
+            {"offset": 20, "length": 5, "type": "hashtag"},
+            {"offset": 26, "length": 3, "type": "hashtag"},
+            {"offset": 49, "length": 6, "type": "hashtag"},
+            {"offset": 56, "length": 7, "type": "hashtag"},
+        ],
+    },
+}
+
+FORWARDED_UPDATE: dict[str, Any] = {
+    "update_id": 735067593,
+    "message": {
+        "message_id": 1403,
+        "from": USER,
+        "chat": GROUP_CHAT,
+        "date": 1641987373,
+        "forward_from_chat": {
+            "id": -1001234567890,
+            "title": "News",
+            "username": "news_channel",
+            "type": "channel",
+        },
+        "text": "Forwarded post without any entities",
+    },
+}
+
+UPDATES = [COMMAND_UPDATE, TAGGED_UPDATE, FORWARDED_UPDATE]
+
+API_URL = "https://api.telegram.org/bot1234567890:AAEhBOweik6ad9r_QXMENQjcrGbqCr4K-S0/getUpdates"
+
+LOG_MESSAGES = [
+    API_URL,
+    "Processing update 735067591 from chat 125504090",
+    "Sending message to chat -1001172399514",
+    "POST response: <Response [200 OK]>",
+] * 5
+
+EVENT = json.dumps(
+    {
+        "id": "3f0c1f4e-8a5e-4c8e-9a57-0f6e1f0b7d2a",
+        "type": "bot_account_linked",
+        "timestamp": time.time(),
+        "payload": {"chat_id": 125504090, "username": "alex"},
+    }
+).encode("utf8")
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime
+from typing import Any, Callable
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# modules read their configuration from the environment at import time
+for name, value in {
+    "TOKEN": "123456:" + "a" * 35,
+    "BOT_POSTGRES_USERNAME": "bench",
+    "BOT_POSTGRES_PASSWORD": "bench",
+    "BOT_POSTGRES_DB": "bench",
+}.items():
+    os.environ.setdefault(name, value)
+
+Benchmark = Callable[[], Callable[[], Any]]
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+REPEAT = 11
+# a noisy benchmark is allowed this many times the spread of its repeats, or
+# NOISE_FLOOR seconds per op, on top of the threshold, but never more than the
+# threshold again, or nothing would be caught
+NOISE_MULTIPLIER = 3
+NOISE_FLOOR = 0.5e-6
+
+
+def benchmark(func: Benchmark) -> Benchmark:
+    # a benchmark does its setup and returns the callable to be timed
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def _calibration_workload() -> Any:
+    data = [{"id": i, "name": str(i)} for i in range(100)]
+    return sorted((item["name"], item["id"]) for item in data)
+
+
+CALIBRATION_TIMER = timeit.Timer(_calibration_workload)
+CALIBRATION_NUMBER = 500
+
+
+def run_benchmark(setup: Benchmark) -> dict[str, Any]:
+    timer = timeit.Timer(setup())
+    number, _ = timer.autorange()
+    times = []
+    calibrations = []
+    for _ in range(REPEAT):
+        # a fixed pure python workload is timed right after every repeat, comparisons
+        # are relative to it so that a slower or busier machine doesn't show up as a
+        # regression
+        times.append(timer.timeit(number) / number)
+        calibrations.append(
+            CALIBRATION_TIMER.timeit(CALIBRATION_NUMBER) / CALIBRATION_NUMBER
+        )
+
+    best = min(times)
+    relative = sorted(
+        time / calibration for time, calibration in zip(times, calibrations)
+    )
+    return {
+        "seconds_per_op": best,
+        "ops_per_second": 1 / best,
+        "number": number,
+        "calibration": min(calibrations),
+        "relative": statistics.median(relative),
+        # how much slower the typical repeat was than the best one
+        "spread": statistics.median(relative) / relative[0] - 1,
+    }
+
+
+def run_all(selected: list[str] | None = None) -> dict[str, Any]:
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        results[name] = run_benchmark(setup)
+        print(f"{name:40} {results[name]['seconds_per_op'] * 1e6:12.2f} us/op")
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], threshold: float
+) -> list[str]:
+    regressions = []
+    for name, result in results["results"].items():
+        if not (base := baseline["results"].get(name)):
+            print(f"{name:40} {'new':>12}")
+            continue
+
+        ratio = result["relative"] / base["relative"]
+        spread = max(result.get("spread", 0), base.get("spread", 0))
+        noise = max(NOISE_MULTIPLIER * spread, NOISE_FLOOR / base["seconds_per_op"])
+        allowed = threshold + min(noise, threshold)
+        marker = ""
+        if ratio > 1 + allowed:
+            marker = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:40} {ratio:11.2f}x{marker}")
+
+    return regressions
+
+
+def load(path: str) -> dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path: str, results: dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
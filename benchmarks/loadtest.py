@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import Any, Iterable
+
+import harness
+from fake_services import FakeTelegram, FakeWebapp
+from scenarios import SCENARIOS, Step, replay
+
+from http_server import HttpServer
+
+logger = logging.getLogger("loadtest")
+
+EVENT_RETRIES = 20
+EVENT_RETRY_DELAY = 0.5
+
+
+async def send_linked_event(
+    container: Any, telegram: FakeTelegram, chat_id: int
+) -> bool:
+    # the user is created by /link, which may still be in flight
+    user_repository = container.user_repository()
+    for _ in range(EVENT_RETRIES):
+        if user := await user_repository.get_by_telegram_id(chat_id):
+            break
+        await asyncio.sleep(EVENT_RETRY_DELAY)
+    else:
+        return False
+
+    event = {
+        "id": str(uuid.uuid4()),
+        "type": "bot_account_linked",
+        "timestamp": time.time(),
+        "payload": {"token": user.token, "user_id": chat_id},
+    }
+    telegram.expect_post(chat_id)
+    redis = container.redis()
+    await redis.rpush(container.redis_pubsub().MESSAGES_LIST, json.dumps(event))
+    return True
+
+
+async def feed(container: Any, telegram: FakeTelegram, steps: Iterable[Step]) -> int:
+    started_at = time.perf_counter()
+    events: list[asyncio.Task] = []
+    sent = 0
+    for step in sorted(steps, key=lambda step: step.at):
+        if (delay := started_at + step.at - time.perf_counter()) > 0:
+            await asyncio.sleep(delay)
+
+        if step.message:
+            telegram.add_update(step.message, step.expects_reply)
+        elif step.linked_chat_id:
+            events.append(
+                asyncio.create_task(
+                    send_linked_event(container, telegram, step.linked_chat_id)
+                )
+            )
+        sent += 1
+
+    skipped = len(events) - sum(await asyncio.gather(*events))
+    if skipped:
+        logger.warning("%d event(s) skipped, their users weren't linked", skipped)
+    return sent
+
+
+async def wait_for_replies(telegram: FakeTelegram, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while telegram.pending and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    server = HttpServer(args.host, args.port)
+    telegram = FakeTelegram(server, args.telegram_latency, args.error_rate)
+    FakeWebapp(server, args.webapp_latency)
+    await server.start()
+
+    # the clients read their base urls on import
+    base_url = f"http://{args.host}:{server.port}"
+    os.environ["TELEGRAM_API_URL"] = base_url
+    os.environ["WEBAPP_URL"] = base_url
+    from containers import Container
+
+    container = Container()
+    bot = container.bot()
+    redis_pubsub = container.redis_pubsub()
+    outbox_relay = container.outbox_relay()
+    await container.db().create_database()
+
+    if args.replay:
+        steps = list(replay(args.replay, args.speed))
+    else:
+        scenario = SCENARIOS[args.scenario]
+        steps = list(scenario(args.count, args.rate, args.users))
+
+    workers = [
+        asyncio.create_task(bot.start()),
+        asyncio.create_task(redis_pubsub.run()),
+        # replies to events go through the outbox
+        asyncio.create_task(outbox_relay.run()),
+    ]
+    started_at = time.perf_counter()
+    try:
+        sent = await feed(container, telegram, steps)
+        await wait_for_replies(telegram, args.grace)
+        elapsed = time.perf_counter() - started_at
+    finally:
+        outbox_relay.stop()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await asyncio.gather(bot.shutdown(), redis_pubsub.shutdown())
+        await container.webapp_client().close()
+        telegram.close()
+        await server.stop()
+
+    latency = telegram.stats.as_dict()
+    return {
+        "scenario": args.replay or args.scenario,
+        "sent": sent,
+        "replies": latency["count"],
+        "unanswered": telegram.pending,
+        "throttled": telegram.throttled,
+        "elapsed": round(elapsed, 2),
+        "throughput": round(latency["count"] / elapsed, 1),
+        "latency_ms": {
+            key: round(latency[key] * 1000, 1) for key in ("p50", "p95", "p99", "max")
+        },
+        "calls": dict(telegram.calls),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run the bot against local stand-ins for Telegram and the web "
+        "app; Postgres and Redis are taken from POSTGRES_HOST and REDIS_URL"
+    )
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="commands")
+    parser.add_argument("--replay", help="replay a file written by UPDATE_CAPTURE_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="updates per second")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--webapp-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of 429 responses"
+    )
+    parser.add_argument("--grace", type=float, default=30, help="wait for replies")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--uvloop", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.uvloop:
+        import uvloop
+
+        uvloop.install()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        harness.save(args.output, report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
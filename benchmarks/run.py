@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import argparse
+import importlib
+import os
+import pkgutil
+import sys
+
+import harness
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+
+def load_benchmarks() -> None:
+    for module in pkgutil.iter_modules([BENCHMARKS_DIR]):
+        if module.name.startswith("bench_"):
+            importlib.import_module(module.name)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the micro-benchmarks")
+    parser.add_argument("filter", nargs="*", help="only run matching benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="overwrite the baseline with the results of this run",
+    )
+    parser.add_argument("--output", help="write the results of this run as JSON")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("BENCH_THRESHOLD", DEFAULT_THRESHOLD)),
+        help="fail when a benchmark is slower than the baseline by this fraction",
+    )
+    parser.add_argument("--uvloop", action="store_true")
+    args = parser.parse_args()
+
+    if args.uvloop:
+        import uvloop
+
+        uvloop.install()
+
+    load_benchmarks()
+    results = harness.run_all(args.filter)
+
+    if args.output:
+        harness.save(args.output, results)
+
+    if args.save_baseline:
+        harness.save(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run `make bench-baseline` first")
+        return 0
+
+    print(f"\nCompared to {args.baseline} (threshold {args.threshold:.0%}):")
+    regressions = harness.compare(results, harness.load(args.baseline), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
+from utils.privacy import MASK
+
+HASHTAG_RE = re.compile(r"#\w+")
+
+
+@dataclass
+class Step:
+    # seconds from the start of the run
+    at: float
+    message: dict | None = None
+    expects_reply: bool = True
+    # send a bot_account_linked event for the user that linked in this chat
+    linked_chat_id: int | None = None
+
+
+def make_message(user_id: int, chat_id: int, text: str) -> dict:
+    entities = []
+    if text.startswith("/"):
+        command, _, _ = text.partition(" ")
+        entities.append({"offset": 0, "length": len(command), "type": "bot_command"})
+    for match in HASHTAG_RE.finditer(text):
+        entities.append(
+            {"offset": match.start(), "length": len(match[0]), "type": "hashtag"}
+        )
+
+    chat_type = "private" if user_id == chat_id else "supergroup"
+    return {
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+        "chat": {"id": chat_id, "type": chat_type},
+        "date": int(time.time()),
+        "text": text,
+        "entities": entities,
+    }
+
+
+def commands(count: int, rate: float, users: int) -> Iterator[Step]:
+    # cheap commands from many users, so the flood limiter doesn't kick in
+    texts = [
+        ("/ping", True),
+        ("/help", True),
+        ("/unknown", True),
+        ("Finished the report #work", False),
+    ]
+    for i in range(count):
+        user_id = random.randint(1, users)
+        text, expects_reply = random.choice(texts)
+        yield Step(i / rate, make_message(user_id, user_id, text), expects_reply)
+
+
+def link(count: int, rate: float, users: int) -> Iterator[Step]:
+    # /link goes through the database and the web app, and every linked user gets a
+    # bot_account_linked event a second later
+    for i in range(count):
+        user_id = 1_000_000 + i % users
+        yield Step(i / rate, make_message(user_id, user_id, "/link"))
+        yield Step(i / rate + 1, linked_chat_id=user_id)
+
+
+SCENARIOS = {"commands": commands, "link": link}
+
+
+def _restore_message(message: dict, index: int) -> dict:
+    # captures are redacted: user ids and texts are masked, so they're replaced
+    # with synthetic ones that keep the shape of the original update
+    chat = message["chat"]
+    if message.get("from", {}).get("id") == MASK:
+        user_id = chat["id"] if chat["type"] == "private" else 2_000_000 + index
+        message["from"] = {**message["from"], "id": user_id, "is_bot": False}
+
+    if message.get("text") == MASK:
+        parts: list[str] = []
+        entities: list[dict] = []
+        position = 0
+        for entity in message.get("entities", []):
+            token = {"bot_command": "/help", "hashtag": "#tag"}.get(
+                entity["type"], "x" * entity["length"]
+            )
+            offset = position + (1 if parts else 0)
+            entities.append({**entity, "offset": offset, "length": len(token)})
+            parts.append(token)
+            position = offset + len(token)
+        message["text"] = " ".join(parts) or "text"
+        message["entities"] = entities
+
+    message["date"] = int(time.time())
+    return message
+
+
+def replay(path: str, speed: float = 1.0) -> Iterator[Step]:
+    # replays updates captured with UPDATE_CAPTURE_FILE, keeping their timing
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    started_at = records[0]["received_at"] if records else 0
+    for index, record in enumerate(records):
+        if not (message := record["update"].get("message")):
+            continue
+        message = _restore_message(message, index)
+        expects_reply = message["text"].startswith("/")
+        yield Step((record["received_at"] - started_at) / speed, message, expects_reply)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import IO, AsyncIterator
+
+import asyncpg
+from sqlalchemy import Table
+
+from db import DB_URL
+from heartbeat import get_cluster_status
+from models import ChatOrm, UserOrm
+
+logger = logging.getLogger("admin")
+
+DSN = DB_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis")
+
+# chats reference users, so users should be imported first
+TABLES: dict[str, Table] = {
+    "users": UserOrm.__table__,  # type: ignore
+    "chats": ChatOrm.__table__,  # type: ignore
+}
+KEY = "id"
+CHUNK_SIZE = 256 * 1024
+
+# JSON lines are copied as single-column CSV with quote and delimiter characters
+# that never appear in JSON, so Postgres passes them through without escaping
+JSONL_COPY_OPTIONS = {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class Progress:
+    INTERVAL = 2
+
+    def __init__(self, action: str) -> None:
+        self.action = action
+        self.rows = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        self._reported_at = self.started_at
+
+    def update(self, chunk: bytes) -> None:
+        self.rows += chunk.count(b"\n")
+        self.bytes += len(chunk)
+        if (now := time.monotonic()) - self._reported_at >= self.INTERVAL:
+            self._reported_at = now
+            self.report()
+
+    def report(self, done: bool = False) -> None:
+        elapsed = time.monotonic() - self.started_at
+        logger.info(
+            "%s: %s%d line(s), %.1f MiB in %.1fs (%.0f lines/s)",
+            self.action,
+            "done, " if done else "",
+            self.rows,
+            self.bytes / 2**20,
+            elapsed,
+            self.rows / elapsed if elapsed else 0,
+        )
+
+
+async def export_table(
+    conn: asyncpg.Connection, table: Table, output: IO[bytes], file_format: str
+) -> None:
+    columns = ", ".join(quote(column.name) for column in table.columns)
+    query = f"SELECT {columns} FROM {quote(table.name)} ORDER BY {KEY}"
+    progress = Progress(f"Exporting {table.name}")
+
+    async def write(chunk: bytes) -> None:
+        output.write(chunk)
+        progress.update(chunk)
+
+    if file_format == "csv":
+        await conn.copy_from_query(query, output=write, format="csv", header=True)
+    else:
+        await conn.copy_from_query(
+            f"SELECT row_to_json(t) FROM ({query}) t",
+            output=write,
+            **JSONL_COPY_OPTIONS,
+        )
+    progress.report(done=True)
+
+
+def get_import_columns(table: Table, header: bytes, file_format: str) -> list[str]:
+    # files may only have some of the columns, e.g. id and webapp_id to reconcile
+    # them with the web app; the other columns are left as they are
+    if file_format == "csv":
+        names = [name.strip().strip('"') for name in header.decode().split(",")]
+    else:
+        names = list(json.loads(header))
+
+    known = {column.name for column in table.columns}
+    if unknown := set(names) - known:
+        raise ValueError(f"Unknown column(s) for {table.name}: {sorted(unknown)}")
+    if KEY not in names:
+        raise ValueError(f"The {KEY!r} column is required")
+    return names
+
+
+async def read_chunks(
+    input_: IO[bytes], progress: Progress, skip: int = 0
+) -> AsyncIterator[bytes]:
+    input_.seek(skip)
+    while chunk := input_.read(CHUNK_SIZE):
+        progress.update(chunk)
+        yield chunk
+
+
+async def import_table(
+    conn: asyncpg.Connection, table: Table, input_: IO[bytes], file_format: str
+) -> None:
+    header = input_.readline()
+    columns = get_import_columns(table, header, file_format)
+    staging = f"{table.name}_staging"
+    progress = Progress(f"Importing {table.name}")
+
+    async with conn.transaction():
+        names = ", ".join(quote(name) for name in columns)
+        # rows are loaded into a staging table first and merged in one statement;
+        # it only has the imported columns and none of the constraints, so rows
+        # with some of the columns aren't rejected for the ones they leave out
+        await conn.execute(
+            f"CREATE TEMP TABLE {quote(staging)} ON COMMIT DROP AS "
+            f"SELECT {names} FROM {quote(table.name)} WITH NO DATA"
+        )
+        if file_format == "csv":
+            await conn.copy_to_table(
+                staging,
+                source=read_chunks(input_, progress, skip=len(header)),
+                columns=columns,
+                format="csv",
+            )
+        else:
+            await conn.execute(
+                "CREATE TEMP TABLE json_staging (data jsonb) ON COMMIT DROP"
+            )
+            await conn.copy_to_table(
+                "json_staging",
+                source=read_chunks(input_, progress),
+                **JSONL_COPY_OPTIONS,
+            )
+            await conn.execute(
+                f"INSERT INTO {quote(staging)} SELECT r.* FROM json_staging, "
+                f"jsonb_populate_record(NULL::{quote(staging)}, data) r"
+            )
+        progress.report(done=True)
+
+        updates = ", ".join(
+            f"{quote(name)} = EXCLUDED.{quote(name)}" for name in columns if name != KEY
+        )
+        on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        result = await conn.execute(
+            f"INSERT INTO {quote(table.name)} ({names}) "
+            f"SELECT {names} FROM {quote(staging)} "
+            f"ON CONFLICT ({KEY}) {on_conflict}"
+        )
+        # imported ids don't move the id sequence, new rows would collide with them
+        await conn.execute(
+            f"SELECT setval(pg_get_serial_sequence($1, $2), max({KEY})) "
+            f"FROM {quote(table.name)}",
+            quote(table.name),
+            KEY,
+        )
+    logger.info("Merged into %s: %s", table.name, result)
+
+
+async def run(command: str, table_name: str, path: str, file_format: str) -> None:
+    table = TABLES[table_name]
+    conn = await asyncpg.connect(DSN)
+    try:
+        if command == "export":
+            with open(path, "wb") as output:
+                await export_table(conn, table, output, file_format)
+        else:
+            with open(path, "rb") as input_:
+                await import_table(conn, table, input_, file_format)
+    finally:
+        await conn.close()
+
+
+async def show_cluster() -> None:
+    import aioredis
+
+    redis = aioredis.from_url(REDIS_URL)
+    try:
+        print(json.dumps(await get_cluster_status(redis), indent=2))
+    finally:
+        await redis.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bot administration")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("export", "import"):
+        table_parser = commands.add_parser(command, help=f"bulk {command} of a table")
+        table_parser.add_argument("table", choices=list(TABLES))
+        table_parser.add_argument("path")
+        table_parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="defaults to the file extension",
+        )
+    commands.add_parser("cluster", help="show the replicas and their load")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.command == "cluster":
+        asyncio.run(show_cluster())
+        return 0
+
+    file_format = args.format or ("jsonl" if args.path.endswith(".jsonl") else "csv")
+    try:
+        asyncio.run(run(args.command, args.table, args.path, file_format))
+    except (ValueError, asyncpg.PostgresError) as exc:
+        logger.error("%s failed: %s", args.command.capitalize(), exc)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,173 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 import os
-from typing import TYPE_CHECKING
+import time
+from asyncio import Task
+from dataclasses import dataclass
+from functools import partial
+from typing import IO, TYPE_CHECKING, Type
 
 from bot_context import BotContext
-from command_handlers import CommandHandlerRegistry
-from entities import Command, Message
+from callback_handlers import CallbackHandler, CallbackHandlerRegistry
+from command_handlers import CommandHandler, CommandHandlerRegistry
+from deadline import Deadline, get_deadline, record_shed, set_deadline
+from entities import CallbackQuery, Command, Message
 from exceptions import ValidationError
+from metrics import COMMAND_LATENCY, UPDATES_PROCESSED, UPDATES_RECEIVED
+from rate_limiter import RateLimit, SlidingWindowLimiter
 from repositories import UserRepository
+from shutdown import TASK_DRAIN_TIMEOUT
 from task_manager import TaskManager
+from tracing import span, trace
+from utils.privacy import redact
 from webapp_client import WebappClient
 
 if TYPE_CHECKING:
+    from handover import PollingHandover
     from telegram_client import TelegramClient as TelegramClient
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class BotIdentity:
+    username: str
+    token: str
+
+
+def parse_bot_identities(value: str) -> list[BotIdentity]:
+    # "username=token,username=token"
+    identities = []
+    for item in value.split(","):
+        if item.strip():
+            username, _, token = item.strip().partition("=")
+            identities.append(BotIdentity(username, token))
+    return identities
+
+
 class Bot:
     USERNAME = os.environ.get("BOT_USERNAME", "gcservantbot")
+    # more bots to host in the same process, they share the database, Redis and
+    # HTTP connection pools with the main one
+    EXTRA_BOTS = parse_bot_identities(os.environ.get("EXTRA_BOTS", ""))
+
+    FAST_LANE = "fast"
+    SLOW_LANE = "slow"
+    # answers to callback queries, kept apart so they never wait behind replies
+    ACK_LANE = "ack"
+    # lane name -> (max parallel tasks, task timeout in seconds)
+    TASK_LANES: dict[str, tuple[int, float | None]] = {
+        ACK_LANE: (20, 5),
+        FAST_LANE: (10, 10),
+        TaskManager.DEFAULT_LANE: (10, 30),
+        SLOW_LANE: (5, 60),
+    }
+    SHUTDOWN_TIMEOUT = TASK_DRAIN_TIMEOUT
+
+    # time budget for handling an update, counted from the message date
+    UPDATE_BUDGET = float(os.environ.get("UPDATE_BUDGET_SECONDS", 30))
+    # stale commands younger than this get a cheap reply, older ones are dropped
+    STALE_REPLY_MAX_AGE = float(os.environ.get("STALE_REPLY_MAX_AGE_SECONDS", 600))
+    STALE_REPLY_BUDGET = 10
+    STALE_REPLY = (
+        "Sorry, I wasn't able to get to your message in time. Please send {} again."
+    )
+
+    # limits for commands that have no handler
+    USER_RATE_LIMIT = RateLimit(10, 60)
+    CHAT_RATE_LIMIT = RateLimit(30, 60)
+    THROTTLED_REPLY = "You're sending commands too fast, please slow down."
+    UNKNOWN_CALLBACK_REPLY = "This button doesn't work anymore."
+
+    # redacted updates are appended here as JSON lines, for replaying in load tests
+    CAPTURE_FILE = os.environ.get("UPDATE_CAPTURE_FILE")
 
     def __init__(
         self,
         telegram_client: TelegramClient,
         webapp_client: WebappClient,
         user_repository: UserRepository,
+        flood_limiter: SlidingWindowLimiter | None = None,
+        username: str = USERNAME,
+        handover: PollingHandover | None = None,
     ) -> None:
         self.telegram_client = telegram_client
+        self.username = username
+        self.handover = handover
         self.webapp_client = webapp_client
         self.user_repository = user_repository
+        self.flood_limiter = flood_limiter or SlidingWindowLimiter()
         self.context = BotContext()
-        self.task_manager = TaskManager()
+        # the main bot keeps the old name, so its metrics don't change
+        self.task_manager = TaskManager(
+            name="bot" if username == self.USERNAME else f"bot:{username}"
+        )
+        self.last_poll_at = time.monotonic()
+        self.stopping = False
+        self._poll: Task | None = None
+        # updates being processed, and the ones cut off by a shutdown
+        self._updates: set[Task] = set()
+        self._unfinished: list[dict] = []
+        self._capture: IO[str] | None = None
+        for lane, (max_parallel_tasks, timeout) in self.TASK_LANES.items():
+            self.task_manager.add_lane(lane, max_parallel_tasks, timeout)
+
+    @classmethod
+    def max_parallel_tasks(cls) -> int:
+        return sum(limit for limit, _ in cls.TASK_LANES.values())
 
     async def start(self) -> None:
         # await self.set_my_commands()  # TODO: enable
+        await self.take_over()
         await self.run_polling_loop()
+        await self.hand_over()
+
+    def stop_polling(self) -> None:
+        # updates that have been received are still dispatched, a long poll that's
+        # still open is abandoned and Telegram sends its updates again
+        self.stopping = True
+        if self._poll and not self._poll.done():
+            self._poll.cancel()
+
+    async def take_over(self) -> None:
+        if not self.handover:
+            return None
+        if last_update_id := await self.handover.acquire(self.username):
+            self.telegram_client.last_update_id = last_update_id
+        for update in await self.handover.take_updates(self.username):
+            await self.dispatch_update(update)
+
+    async def hand_over(self) -> None:
+        if self._updates:
+            logger.info("Waiting for %d update(s)", len(self._updates))
+            _, pending = await asyncio.wait(
+                set(self._updates), timeout=self.SHUTDOWN_TIMEOUT
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        # confirms the updates received so far, otherwise Telegram sends them again
+        await self.telegram_client.confirm_updates()
+        await self.release_handover()
+
+    async def release_handover(self) -> None:
+        self._unfinished.sort(key=lambda update: update["update_id"])
+        if self.handover:
+            await self.handover.release(
+                self.username, self.telegram_client.last_update_id, self._unfinished
+            )
+        elif self._unfinished:
+            logger.warning("Dropping %d unfinished update(s)", len(self._unfinished))
+
+    async def shutdown(self) -> None:
+        logger.info("Shutting down, stats: %s", self.task_manager.stats())
+        await self.task_manager.drain(self.SHUTDOWN_TIMEOUT)
+        if self._capture:
+            self._capture.close()
 
     async def set_my_commands(self) -> None:
         logger.info("Setting bot's command list")
@@ -51,48 +182,234 @@ class Bot:
             )
         await self.telegram_client.set_my_commands(commands)
 
+    @staticmethod
+    def get_allowed_updates() -> list[str]:
+        # the update types registered handlers consume, the rest isn't fetched
+        handlers: list[Type[CommandHandler] | Type[CallbackHandler]] = [
+            *CommandHandlerRegistry.command_handlers.values(),
+            *CallbackHandlerRegistry.callback_handlers.values(),
+        ]
+        return sorted({handler.update_type for handler in handlers})
+
     async def run_polling_loop(self) -> None:
-        logger.info("Starting the polling loop")
-        while True:
+        allowed_updates = self.get_allowed_updates()
+        logger.info("Starting the polling loop, allowed updates: %s", allowed_updates)
+        while not self.stopping:
+            if self.handover and not self.handover.holds(self.username):
+                await self.take_over()
+
+            self._poll = asyncio.create_task(
+                self.telegram_client.get_updates(allowed_updates)
+            )
             try:
-                updates = await self.telegram_client.get_updates()
+                updates = await self._poll
+            except asyncio.CancelledError:
+                if self.stopping:
+                    break
+                raise
             except KeyboardInterrupt:
                 logger.info("Exiting...")
                 return
 
+            self.last_poll_at = time.monotonic()
             for update in updates:
-                asyncio.create_task(self.process_update(update))
+                UPDATES_RECEIVED.inc(type=self.get_update_type(update))
+                if self.CAPTURE_FILE:
+                    self.capture_update(update)
+                await self.dispatch_update(update)
 
             if updates:
                 logger.debug("%d update(s) received", len(updates))
 
-    async def process_update(self, update: dict) -> None:
+        logger.info("Stopped polling")
+
+    async def dispatch_update(self, update: dict) -> None:
+        task = asyncio.create_task(self._handle_update(update))
+        self._updates.add(task)
+        task.add_done_callback(partial(self._on_update_done, update))
+
+    async def _handle_update(self, update: dict) -> None:
+        # cancelling this cancels the handler too
+        if task := await self.process_update(update):
+            await task
+
+    def _on_update_done(self, update: dict, task: Task) -> None:
+        self._updates.discard(task)
+        if task.cancelled():
+            self._unfinished.append(update)
+        elif exc := task.exception():
+            logger.error("Failed to process an update", exc_info=exc)
+
+    def capture_update(self, update: dict) -> None:
+        if not self._capture:
+            assert self.CAPTURE_FILE
+            self._capture = open(self.CAPTURE_FILE, "a", buffering=1)
+
+        record = {"received_at": time.time(), "update": redact(update)}
+        self._capture.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def get_update_type(update: dict) -> str:
+        return next((key for key in update if key != "update_id"), "unknown")
+
+    async def process_update(self, update: dict) -> Task | None:
+        # returns the task handling the update, if one was started
         logger.debug("Processing new update: %s", update)
 
-        if "message" in update:
-            message = Message.from_json(update["message"])
-            await self.process_message(message)
+        task = None
+        update_type = self.get_update_type(update)
+        with trace("update", update_id=update.get("update_id"), type=update_type):
+            if "message" in update:
+                with span("parse"):
+                    message = Message.from_json(update["message"])
+                set_deadline(Deadline.from_timestamp(message.date, self.UPDATE_BUDGET))
+                task = await self.process_message(message)
+            elif "callback_query" in update:
+                with span("parse"):
+                    query = CallbackQuery.from_json(update["callback_query"])
+                set_deadline(Deadline.after(self.UPDATE_BUDGET))
+                task = await self.process_callback_query(query)
 
-    async def process_message(self, message: Message) -> None:
+        UPDATES_PROCESSED.inc(type=update_type)
+        return task
+
+    async def process_message(self, message: Message) -> Task | None:
         logger.debug("New %s", message)
 
         if command := message.command:
+            if not self.is_own_command(command):
+                logger.debug(
+                    "Received a command that's meant for another bot: %s@%s",
+                    command.command_str,
+                    command.username,
+                )
+                return None
+
+            if not await self.check_flood(message, command):
+                return None
+
+            if (deadline := get_deadline()) and deadline.expired:
+                return await self.process_stale_command_message(message, command)
+
+            handler_class = CommandHandlerRegistry.get_for_command_str(
+                command.command_str
+            )
+            lane = handler_class.lane if handler_class else self.FAST_LANE
             handler = self.process_command_message(message, command)
-            await self.task_manager.run_task(handler)
+            return await self.task_manager.run_task(handler, lane=lane)
+
+        return None
+
+    async def process_stale_command_message(
+        self, message: Message, command: Command
+    ) -> Task | None:
+        age = time.time() - message.date
+        if (
+            age > self.STALE_REPLY_MAX_AGE
+            or not CommandHandlerRegistry.get_for_command_str(command.command_str)
+        ):
+            logger.info("Dropping stale update (%.0fs old): %s", age, message)
+            record_shed("update_dropped")
             return None
 
-    async def process_command_message(self, message: Message, command: Command) -> bool:
+        logger.info("Replying to stale update (%.0fs old): %s", age, message)
+        record_shed("update_downgraded")
+        set_deadline(Deadline.after(self.STALE_REPLY_BUDGET))
+        reply = self.telegram_client.reply(
+            message, self.STALE_REPLY.format(f"/{command.command_str}")
+        )
+        return await self.task_manager.run_task(reply, lane=self.FAST_LANE)
+
+    async def process_callback_query(self, query: CallbackQuery) -> Task | None:
+        logger.debug("New %s", query)
+
+        handler_class = CallbackHandlerRegistry.get_for_prefix(query.prefix)
+        ack_text = handler_class.ack_text if handler_class else None
+        if not handler_class:
+            logger.info("No handler for callback query %s", query)
+            ack_text = self.UNKNOWN_CALLBACK_REPLY
+        elif rate_limit := handler_class.user_rate_limit:
+            key = f"{self.username}:user:{query.from_.id}:callback:{query.prefix}"
+            if not await self.flood_limiter.hit(key, rate_limit):
+                logger.info("Throttling %s", query)
+                record_shed("update_throttled")
+                handler_class, ack_text = None, self.THROTTLED_REPLY
+
+        # the user sees a spinner on the button until the query is answered, so the
+        # answer goes out first and the handler runs after it
+        params = {"text": ack_text} if ack_text else {}
+        answer = self.telegram_client.answer_callback_query(query.id, **params)
+        ack = await self.task_manager.run_task(answer, lane=self.ACK_LANE)
+        if not handler_class:
+            return ack
+
+        handler = self.process_callback_handler(query, handler_class, ack)
+        return await self.task_manager.run_task(handler, lane=handler_class.lane)
+
+    async def process_callback_handler(
+        self,
+        query: CallbackQuery,
+        handler_class: Type[CallbackHandler],
+        ack: Task | None,
+    ) -> None:
+        if ack:
+            await asyncio.wait([ack])
+
+        handler = handler_class(
+            self.telegram_client,
+            self.webapp_client,
+            self.user_repository,
+            self.context,
+        )
+        started_at = time.monotonic()
+        status = "error"
+        try:
+            with span("process", callback=query.prefix):
+                await handler.process(query)
+            status = "ok"
+        finally:
+            COMMAND_LATENCY.observe(
+                time.monotonic() - started_at,
+                command=f"callback:{query.prefix}",
+                status=status,
+            )
+
+    def is_own_command(self, command: Command) -> bool:
         if command.entity.offset != 0:
             return False
 
-        if command.username and command.username != self.USERNAME:
-            logger.debug(
-                "Received a command that's meant for another bot: %s@%s",
-                command.command_str,
-                command.username,
-            )
+        if command.username and command.username != self.username:
             return False
 
+        return True
+
+    async def check_flood(self, message: Message, command: Command) -> bool:
+        handler_class = CommandHandlerRegistry.get_for_command_str(command.command_str)
+        if handler_class:
+            user_limit = handler_class.user_rate_limit
+            chat_limit = handler_class.chat_rate_limit
+        else:
+            user_limit, chat_limit = self.USER_RATE_LIMIT, self.CHAT_RATE_LIMIT
+
+        # the limiter can be shared by several bots, each gets its own limits
+        prefix = f"{self.username}:"
+        limits = [
+            (f"{prefix}user:{message.from_.id}:{command.command_str}", user_limit),
+            (f"{prefix}chat:{message.chat.id}:{command.command_str}", chat_limit),
+        ]
+        checks = [(key, limit) for key, limit in limits if limit]
+        if not checks or not (key := await self.flood_limiter.hit_all(checks)):
+            return True
+
+        logger.info("Throttling %s (%s)", message, key)
+        record_shed("update_throttled")
+        if await self.flood_limiter.notify_once(key, dict(checks)[key].window):
+            reply = self.telegram_client.reply(message, self.THROTTLED_REPLY)
+            await self.task_manager.run_task(reply, lane=self.FAST_LANE)
+
+        return False
+
+    async def process_command_message(self, message: Message, command: Command) -> bool:
         handler_class = CommandHandlerRegistry.get_for_command_str(command.command_str)
         if not handler_class:
             await self.telegram_client.reply(
@@ -107,11 +424,23 @@ class Bot:
             self.context,
         )
         try:
-            handler.validate(command)
+            with span("validate", command=command.command_str):
+                handler.validate(command)
         except ValidationError as exc:
             await self.telegram_client.reply(message, exc.message)
             return True
 
-        await handler.process(message)
+        started_at = time.monotonic()
+        status = "error"
+        try:
+            with span("process", command=command.command_str):
+                await handler.process(message)
+            status = "ok"
+        finally:
+            COMMAND_LATENCY.observe(
+                time.monotonic() - started_at,
+                command=command.command_str,
+                status=status,
+            )
 
         return True
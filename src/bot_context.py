@@ -5,6 +5,7 @@ __version__ = "0.1.0"
 from datetime import datetime
 from typing import TYPE_CHECKING
 
+from deadline import shed_counter
 from utils.formatting import format_interval
 
 if TYPE_CHECKING:
@@ -23,4 +24,5 @@ class BotContext:
         return {
             "uptime": format_interval(self.get_uptime()),
             "version": self.version,
+            "shed": dict(shed_counter),
         }
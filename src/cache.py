@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Awaitable, Callable, Generic, TypeVar
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ExpiringCache:
+    DEFAULT_MAX_SIZE = 10000
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> str | None:
+        if item := self._data.get(key):
+            value, expires_at = item
+            if expires_at > time.time():
+                self.hits += 1
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, expires_at: float) -> None:
+        if expires_at <= time.time():
+            return None
+
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class RedisExpiringCache(ExpiringCache):
+    KEY_PREFIX = "cache"
+
+    def __init__(self, redis: Redis, max_size: int = ExpiringCache.DEFAULT_MAX_SIZE):
+        super().__init__(max_size)
+        self.redis = redis
+
+    async def get(self, key: str) -> str | None:
+        if (value := await super().get(key)) is not None:
+            return value
+
+        value = await self.redis.get(f"{self.KEY_PREFIX}:{key}")
+        if value is None:
+            return None
+
+        if isinstance(value, bytes):
+            value = value.decode("utf8")
+
+        # keep a local copy for as long as redis would
+        ttl = await self.redis.pttl(f"{self.KEY_PREFIX}:{key}")
+        if ttl > 0:
+            await super().set(key, value, time.time() + ttl / 1000)
+
+        return value
+
+    async def set(self, key: str, value: str, expires_at: float) -> None:
+        await super().set(key, value, expires_at)
+
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            await self.redis.set(f"{self.KEY_PREFIX}:{key}", value, px=ttl_ms)
+
+
+class _LeaderCancelled(Exception):
+    pass
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Future[T]] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        while future := self._calls.get(key):
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # the caller that made the call was cancelled, the waiters weren't:
+                # one of them makes the call again
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from logging import getLogger
+from typing import TYPE_CHECKING, Type
+
+from rate_limiter import RateLimit
+from repositories import UserRepository
+from task_manager import TaskManager
+from telegram_client import TelegramClient
+from webapp_client import WebappClient
+
+if TYPE_CHECKING:
+    from bot_context import BotContext
+    from entities import CallbackQuery
+
+
+logger = getLogger(__name__)
+
+# Telegram's limit for callback_data, in bytes
+CALLBACK_DATA_LIMIT = 64
+CALLBACK_DATA_SEPARATOR = ":"
+
+
+def encode_callback_data(prefix: str, *args: str | int) -> str:
+    # "prefix:arg:arg", the handler is looked up by the prefix, so it should be
+    # short; ints are written in base 36 to save space
+    fields = [prefix]
+    for arg in args:
+        field = _to_base36(arg) if isinstance(arg, int) else arg
+        if CALLBACK_DATA_SEPARATOR in field:
+            raise ValueError(f"Callback data field contains a separator: {field!r}")
+        fields.append(field)
+
+    data = CALLBACK_DATA_SEPARATOR.join(fields)
+    if len(data.encode("utf8")) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"Callback data is longer than {CALLBACK_DATA_LIMIT} bytes")
+    return data
+
+
+def decode_int(field: str) -> int:
+    return int(field, 36)
+
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    sign, value = ("-", -value) if value < 0 else ("", value)
+    result = ""
+    while True:
+        value, digit = divmod(value, 36)
+        result = digits[digit] + result
+        if not value:
+            return sign + result
+
+
+class CallbackHandlerRegistry(type):
+    callback_handlers: dict[str, Type[CallbackHandler]] = {}
+
+    def __new__(
+        mcs: Type[CallbackHandlerRegistry], name: str, bases: tuple, dct: dict
+    ) -> CallbackHandlerRegistry:
+        handler_cls: CallbackHandlerRegistry = super().__new__(mcs, name, bases, dct)
+        prefix = getattr(handler_cls, "prefix", None)
+        if prefix and issubclass(handler_cls, CallbackHandler):
+            mcs.callback_handlers[prefix] = handler_cls
+        return handler_cls
+
+    @classmethod
+    def get_for_prefix(mcs, prefix: str) -> Type[CallbackHandler] | None:
+        return mcs.callback_handlers.get(prefix)
+
+
+class CallbackHandler(metaclass=CallbackHandlerRegistry):
+    update_type = "callback_query"
+    lane = TaskManager.DEFAULT_LANE
+    user_rate_limit: RateLimit | None = RateLimit(30, 60)
+    # shown to the user when the query is answered, before the handler runs
+    ack_text: str | None = None
+
+    def __init__(
+        self,
+        telegram_client: TelegramClient,
+        webapp_client: WebappClient,
+        user_repository: UserRepository,
+        context: BotContext,
+    ) -> None:
+        self.telegram_client = telegram_client
+        self.webapp_client = webapp_client
+        self.context = context
+        self.user_repository = user_repository
+
+    async def process(self, query: CallbackQuery) -> None:
+        raise NotImplementedError
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import logging
+import time
+from enum import Enum
+from typing import Any
+
+from exceptions import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RECOVERY_TIMEOUT = 30
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == CircuitState.CLOSED:
+            return None
+
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(self.name)
+            self._set_state(CircuitState.HALF_OPEN)
+
+        # half-open: let a single probe through, reject everything else until it
+        # reports back
+        if self._probe_in_flight:
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+        self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != CircuitState.CLOSED:
+            self._set_state(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            if self.state != CircuitState.OPEN:
+                self._set_state(CircuitState.OPEN)
+
+    def release_probe(self) -> None:
+        # the call didn't finish, e.g. it was cancelled, which says nothing about
+        # the service; a half-open probe still gives its slot back, or the circuit
+        # never closes again
+        self._probe_in_flight = False
+
+    def _set_state(self, state: CircuitState) -> None:
+        logger.warning("Circuit %r: %s -> %s", self.name, self.state.value, state.value)
+        self.state = state
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+        }
@@ -7,8 +7,11 @@ from logging import getLogger
 from typing import TYPE_CHECKING, Type, cast
 
 from entities import Message
+from exceptions import WebappUnavailableError
 from models import ChatOrm, UserOrm
+from rate_limiter import RateLimit
 from repositories import UserRepository
+from task_manager import TaskManager
 from telegram_client import TelegramClient
 from webapp_client import WebappClient
 
@@ -47,6 +50,10 @@ class CommandHandlerRegistry(type):
 
 
 class CommandHandler(metaclass=CommandHandlerRegistry):
+    update_type = "message"
+    lane = TaskManager.DEFAULT_LANE
+    user_rate_limit: RateLimit | None = RateLimit(10, 60)
+    chat_rate_limit: RateLimit | None = RateLimit(30, 60)
     validator_class: Type[Validator] | None = None
     validator: Validator | None
 
@@ -81,9 +88,15 @@ def _get_date_from_seconds(seconds: int):
 class LinkHandler(CommandHandler):
     command_str = "link"
     short_description = "Link your happiness-mj.xyz account"
+    lane = "slow"
+    user_rate_limit = RateLimit(3, 60)
 
     WEB_APP_LINKS_BASE = os.environ.get("WEBAPP_LINKS_BASE")
     TOKEN_EXPIRATION_SECONDS = 1800  # 30 MIN
+    WEBAPP_UNAVAILABLE = (
+        "happiness-mj.xyz is temporarily unavailable, please try again in a few "
+        "minutes."
+    )
 
     async def _get_or_create_user_with_chat(
         self,
@@ -129,10 +142,15 @@ class LinkHandler(CommandHandler):
             )
             return None
 
-        result = await self.webapp_client.make_bot_token(user.token)
-        logger.debug("Token created %s", result)
+        try:
+            url = await self.webapp_client.get_link_url(
+                user.token, user.token_expires_at.timestamp()
+            )
+        except WebappUnavailableError as exc:
+            logger.warning("Can't create a link for %s: %s", user, exc)
+            await self.telegram_client.reply(message, self.WEBAPP_UNAVAILABLE)
+            return None
 
-        url = result["url"]
         await self.telegram_client.reply(
             message,
             f"Follow this url to link your account - {self.WEB_APP_LINKS_BASE}{url}",
@@ -142,6 +160,7 @@ class LinkHandler(CommandHandler):
 class HelpHandler(CommandHandler):
     command_str = "help"
     short_description = "Get help on how to use the bot"
+    lane = "fast"
 
     HELP = """Happy bot."""
 
@@ -152,6 +171,7 @@ class HelpHandler(CommandHandler):
 class PingHandler(CommandHandler):
     command_str = "ping"
     short_description = "Test bot connectivity"
+    lane = "fast"
 
     async def process(self, message: Message) -> None:
         await self.telegram_client.reply(message, f"pong")
@@ -1,44 +1,188 @@
+import os
+
 import aioredis
 from dependency_injector import containers, providers
 
 from bot import Bot
+from cache import ExpiringCache, RedisExpiringCache
 from db import DB_URL, Database
 from event_handler import EventHandler
+from handover import PollingHandover
+from heartbeat import Heartbeat
+from http_server import HttpServer
+from leader import ClusterBot, LeaderLease, UpdateQueue
+from loop_monitor import LoopMonitor
+from monitoring import Monitoring
+from outbox import OutboxRelay
+from profiling import Profiling
 from pubsub import RedisPubSub
-from repositories import UserRepository
+from rate_limiter import RedisSlidingWindowLimiter, SlidingWindowLimiter
+from repositories import OutboxRepository, UserRepository
 from telegram_client import TelegramClient
 from webapp_client import WebappClient
+from workers import (
+    WORKER_TRANSPORT,
+    WORKERS,
+    IngestBot,
+    LocalTransport,
+    RedisTransport,
+    Router,
+    RoutingEventHandler,
+)
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis")
 
 
 class Container(containers.DeclarativeContainer):
-    telegram_client = providers.Singleton(TelegramClient)
-    webapp_client = providers.Singleton(WebappClient)
+    # "standalone", "ingest" or "cluster"; the ingest process only hands work to the
+    # workers, cluster replicas share the work and elect one of them to poll
+    process_role = providers.Object("standalone")
+
+    # every bot has a connection for its long poll and one for each of its tasks
+    # that can run at once, the event handler's tasks use the main bot's
+    telegram_http_client = providers.Singleton(
+        TelegramClient.make_http_client,
+        connections=(1 + len(Bot.EXTRA_BOTS)) * (1 + Bot.max_parallel_tasks())
+        + EventHandler.max_parallel_tasks(),
+    )
+    telegram_client = providers.Singleton(
+        TelegramClient, http_client=telegram_http_client
+    )
     db = providers.Singleton(
         Database,
         db_url=DB_URL,
     )
     redis = providers.Singleton(
         aioredis.from_url,
-        "redis://redis",
+        REDIS_URL,
         encoding="utf-8",
     )
+    link_cache = providers.Selector(
+        providers.Object(os.environ.get("LINK_CACHE_BACKEND", "memory")),
+        memory=providers.Singleton(ExpiringCache),
+        redis=providers.Singleton(RedisExpiringCache, redis=redis),
+    )
+    webapp_client = providers.Singleton(WebappClient, link_cache=link_cache)
     user_repository = providers.Factory(
         UserRepository,
         session_factory=db.provided.session,
     )
-    event_handler = providers.Factory(
-        EventHandler,
+    outbox_repository = providers.Factory(
+        OutboxRepository,
+        session_factory=db.provided.session,
+    )
+    outbox_relay = providers.Singleton(
+        OutboxRelay,
         telegram_client=telegram_client,
-        user_repository=user_repository,
+        outbox_repository=outbox_repository,
+    )
+    worker_transport = providers.Selector(
+        providers.Object(WORKER_TRANSPORT),
+        local=providers.Singleton(LocalTransport, partitions=WORKERS),
+        redis=providers.Singleton(
+            RedisTransport, redis=redis, redis_url=REDIS_URL, partitions=WORKERS
+        ),
+    )
+    router = providers.Singleton(Router, transport=worker_transport)
+    leader_lease = providers.Singleton(LeaderLease, redis=redis)
+    update_queue = providers.Singleton(UpdateQueue, redis=redis, lease=leader_lease)
+    polling_handover = providers.Singleton(PollingHandover, redis=redis)
+    event_handler = providers.Selector(
+        process_role,
+        standalone=providers.Factory(
+            EventHandler,
+            telegram_client=telegram_client,
+            user_repository=user_repository,
+        ),
+        ingest=providers.Factory(
+            RoutingEventHandler,
+            router=router,
+            telegram_client=telegram_client,
+            user_repository=user_repository,
+        ),
+        cluster=providers.Factory(
+            EventHandler,
+            telegram_client=telegram_client,
+            user_repository=user_repository,
+        ),
     )
     redis_pubsub = providers.Singleton(
         RedisPubSub,
         event_handler=event_handler,
         redis=redis,
     )
-    bot = providers.Singleton(
+    flood_limiter = providers.Selector(
+        providers.Object(os.environ.get("FLOOD_LIMITER_BACKEND", "memory")),
+        memory=providers.Singleton(SlidingWindowLimiter),
+        redis=providers.Singleton(RedisSlidingWindowLimiter, redis=redis),
+    )
+    bot = providers.Selector(
+        process_role,
+        standalone=providers.Singleton(
+            Bot,
+            telegram_client=telegram_client,
+            webapp_client=webapp_client,
+            user_repository=user_repository,
+            flood_limiter=flood_limiter,
+            handover=polling_handover,
+        ),
+        ingest=providers.Singleton(
+            IngestBot,
+            router=router,
+            telegram_client=telegram_client,
+            webapp_client=webapp_client,
+            user_repository=user_repository,
+            flood_limiter=flood_limiter,
+            handover=polling_handover,
+        ),
+        cluster=providers.Singleton(
+            ClusterBot,
+            lease=leader_lease,
+            queue=update_queue,
+            telegram_client=telegram_client,
+            webapp_client=webapp_client,
+            user_repository=user_repository,
+            flood_limiter=flood_limiter,
+        ),
+    )
+    # bots from EXTRA_BOTS, created with their own token and username
+    extra_telegram_client = providers.Factory(
+        TelegramClient, http_client=telegram_http_client
+    )
+    extra_bot = providers.Factory(
         Bot,
-        telegram_client=telegram_client,
         webapp_client=webapp_client,
         user_repository=user_repository,
+        flood_limiter=flood_limiter,
+        handover=polling_handover,
+    )
+    http_server = providers.Singleton(
+        HttpServer,
+        host=os.environ.get("HTTP_HOST", "0.0.0.0"),
+        port=int(os.environ.get("HTTP_PORT", 9090)),
+    )
+    loop_monitor = providers.Singleton(LoopMonitor)
+    monitoring = providers.Singleton(
+        Monitoring,
+        server=http_server,
+        bot=bot,
+        event_handler=redis_pubsub.provided.event_handler,
+        db=db,
+        webapp_client=webapp_client,
+        loop_monitor=loop_monitor,
+    )
+    profiling = providers.Singleton(
+        Profiling,
+        server=http_server,
+        bot=bot,
+        event_handler=redis_pubsub.provided.event_handler,
+    )
+    heartbeat = providers.Singleton(
+        Heartbeat,
+        redis=redis,
+        server=http_server,
+        bot=bot,
+        redis_pubsub=redis_pubsub,
+        role=process_role,
+        lease=leader_lease,
     )
@@ -1,9 +1,11 @@
+import hashlib
 import os
 from asyncio import current_task
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
 from logging import getLogger
 from typing import Callable
 
+from sqlalchemy import CheckConstraint, ForeignKeyConstraint, MetaData, text
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_scoped_session,
@@ -27,6 +29,30 @@ DB_URL = f"postgresql+asyncpg://{pg_user}:{pg_pass}@{pg_host}/{pg_db}"
 SessionFactory = Callable[..., AbstractAsyncContextManager[Session]]
 
 
+def get_schema_version(metadata: MetaData = Base.metadata) -> str:
+    # changes whenever a table, column, index or constraint of the models changes
+    parts = []
+    for table in metadata.sorted_tables:
+        parts.append(table.name)
+        for column in table.columns:
+            parts.append(f"{column.name} {column.type} {column.nullable}")
+        for index in sorted(table.indexes, key=lambda index: str(index.name)):
+            columns = [c.name for c in index.columns]
+            parts.append(f"{index.name} {columns} {index.unique}")
+        constraints = []
+        for constraint in table.constraints:
+            columns = [c.name for c in constraint.columns]
+            description = f"{type(constraint).__name__} {constraint.name} {columns}"
+            if isinstance(constraint, ForeignKeyConstraint):
+                targets = [element.target_fullname for element in constraint.elements]
+                description += f" {targets} {constraint.ondelete}"
+            elif isinstance(constraint, CheckConstraint):
+                description += f" {constraint.sqltext}"
+            constraints.append(description)
+        parts.extend(sorted(constraints))
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+
 class Database:
     def __init__(self, db_url: str) -> None:
         self._engine = create_async_engine(db_url, future=True)
@@ -40,9 +66,42 @@ class Database:
             current_task,
         )
 
-    async def create_database(self) -> None:
+    def pool_status(self) -> dict[str, int]:
+        pool = self._engine.sync_engine.pool
+        return {
+            "size": pool.size(),  # type: ignore
+            "checked_in": pool.checkedin(),  # type: ignore
+            "checked_out": pool.checkedout(),  # type: ignore
+            "overflow": pool.overflow(),  # type: ignore
+        }
+
+    async def create_database(self) -> bool:
+        # create_all inspects every table and index, so it's skipped when the
+        # schema was already created for the current models; returns whether it ran
+        version = get_schema_version()
         async with self._engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "CREATE TABLE IF NOT EXISTS schema_version "
+                    "(id INTEGER PRIMARY KEY, version VARCHAR(40) NOT NULL)"
+                )
+            )
+            result = await conn.execute(
+                text("SELECT version FROM schema_version WHERE id = 1")
+            )
+            if result.scalar() == version:
+                return False
+
             await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(
+                text(
+                    "INSERT INTO schema_version (id, version) VALUES (1, :version) "
+                    "ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version"
+                ),
+                {"version": version},
+            )
+        logger.info("Schema created for version %s", version)
+        return True
 
     @asynccontextmanager
     async def session(self) -> SessionFactory:
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Awaitable, Callable, TypeVar
+
+from exceptions import DeadlineExceeded
+from metrics import SHED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+shed_counter: Counter[str] = Counter()
+
+
+@dataclass(frozen=True)
+class Deadline:
+    expires_at: float
+
+    @classmethod
+    def from_timestamp(cls, timestamp: float, budget: float) -> Deadline:
+        return cls(timestamp + budget)
+
+    @classmethod
+    def after(cls, budget: float) -> Deadline:
+        return cls(time.time() + budget)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.time())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.time()
+
+
+_current_deadline: ContextVar[Deadline | None] = ContextVar("deadline", default=None)
+
+
+def set_deadline(deadline: Deadline | None) -> Token[Deadline | None]:
+    return _current_deadline.set(deadline)
+
+
+def reset_deadline(token: Token[Deadline | None]) -> None:
+    _current_deadline.reset(token)
+
+
+def get_deadline() -> Deadline | None:
+    return _current_deadline.get()
+
+
+def remaining_timeout(default: float | None) -> float | None:
+    if not (deadline := get_deadline()):
+        return default
+    if default is None:
+        return deadline.remaining()
+    return min(default, deadline.remaining())
+
+
+def record_shed(reason: str) -> None:
+    shed_counter[reason] += 1
+    SHED.inc(reason=reason)
+
+
+def check_deadline(reason: str) -> None:
+    if (deadline := get_deadline()) and deadline.expired:
+        record_shed(reason)
+        raise DeadlineExceeded(reason)
+
+
+def bounded(
+    reason: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            if not get_deadline():
+                return await func(*args, **kwargs)
+
+            check_deadline(reason)
+            try:
+                return await asyncio.wait_for(
+                    func(*args, **kwargs), remaining_timeout(None)
+                )
+            except asyncio.TimeoutError:
+                record_shed(reason)
+                raise DeadlineExceeded(reason)
+
+        return wrapper
+
+    return decorator
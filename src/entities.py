@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import logging
 from dataclasses import dataclass, field
 from functools import cached_property
@@ -166,17 +165,18 @@ class CallbackQuery:
     id: int
     message_id: int
     chat_id: int
-    data: dict
+    from_: User
+    prefix: str
+    args: list[str]
 
     @classmethod
     def from_json(cls, callback_json: dict) -> CallbackQuery:
         callback_id = callback_json["id"]
         message_id = callback_json["message"]["message_id"]
         chat_id = callback_json["message"]["chat"]["id"]
+        from_ = User.from_json(callback_json["from"])
 
-        try:
-            data = json.loads(callback_json["data"])
-        except (ValueError, TypeError):
-            data = {"raw": callback_json["data"]}
+        # see callback_handlers.encode_callback_data
+        prefix, *args = (callback_json.get("data") or "").split(":")
 
-        return cls(callback_id, message_id, chat_id, data)
+        return cls(callback_id, message_id, chat_id, from_, prefix, args)
@@ -1,10 +1,18 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import time
 from datetime import datetime
 from logging import getLogger
+from typing import Awaitable, Callable
 
+from deadline import Deadline, record_shed, reset_deadline, set_deadline
+from metrics import EVENT_LATENCY
+from models import OutboxMessageOrm
 from pubsub import Event
 from repositories import UserRepository
+from shutdown import TASK_DRAIN_TIMEOUT
 from task_manager import TaskManager
 from telegram_client import TelegramClient
 
@@ -13,6 +21,25 @@ logger = getLogger(__name__)
 
 class EventHandler:
     MAX_PARALLEL_TASKS = 5
+    TASK_TIMEOUT = 30
+    SHUTDOWN_TIMEOUT = TASK_DRAIN_TIMEOUT
+
+    PRIORITY_LANE = "priority"
+    # lane name -> (max parallel tasks, task timeout in seconds)
+    TASK_LANES: dict[str, tuple[int, float | None]] = {
+        PRIORITY_LANE: (5, 15),
+    }
+    EVENT_LANES = {
+        "bot_account_linked": PRIORITY_LANE,
+    }
+
+    # time budget for handling an event, counted from the event timestamp
+    EVENT_BUDGET = float(os.environ.get("EVENT_BUDGET_SECONDS", 300))
+    # stale events of these types are dropped, others carry state changes and are
+    # always processed
+    SHEDDABLE_EVENTS = {"user_event"}
+
+    ACCOUNT_LINKED = "Your happiness-mj.xyz account has been linked successfully!"
 
     def __init__(
         self,
@@ -21,16 +48,66 @@ class EventHandler:
     ) -> None:
         self.telegram_client = telegram_client
         self.user_repository = user_repository
-        self.task_manager = TaskManager(self.MAX_PARALLEL_TASKS)
+        self.task_manager = TaskManager(
+            self.MAX_PARALLEL_TASKS, self.TASK_TIMEOUT, name="events"
+        )
+        for lane, (max_parallel_tasks, timeout) in self.TASK_LANES.items():
+            self.task_manager.add_lane(lane, max_parallel_tasks, timeout)
+        # events whose handlers were cancelled by a shutdown
+        self.unfinished_events: list[Event] = []
+
+    @classmethod
+    def max_parallel_tasks(cls) -> int:
+        lanes = sum(limit for limit, _ in cls.TASK_LANES.values())
+        return cls.MAX_PARALLEL_TASKS + lanes
 
     async def handle(self, event: Event) -> None:
         logger.debug("Got new event %s", event)
 
         if handler := getattr(self, f"process_{event.type}", None):
-            await self.task_manager.run_task(handler(event))
+            deadline: Deadline | None = None
+            if event.type in self.SHEDDABLE_EVENTS:
+                deadline = Deadline.from_timestamp(event.timestamp, self.EVENT_BUDGET)
+                if deadline.expired:
+                    logger.info("Dropping stale event %s", event)
+                    record_shed("event_dropped")
+                    return None
+
+            # the task copies the deadline, the consumer calling this shouldn't keep
+            # it for the next event
+            token = set_deadline(deadline)
+            try:
+                lane = self.EVENT_LANES.get(event.type)
+                await self.task_manager.run_task(
+                    self._run_handler(handler, event), lane=lane
+                )
+            finally:
+                reset_deadline(token)
         else:
             logger.warning("No handler for event type %s", event.type)
 
+    async def _run_handler(
+        self, handler: Callable[[Event], Awaitable[None]], event: Event
+    ) -> None:
+        started_at = time.monotonic()
+        status = "error"
+        try:
+            await handler(event)
+            status = "ok"
+        except asyncio.CancelledError:
+            # timeouts cancel handlers too, only a draining one is passed on
+            if not self.task_manager.accepting:
+                self.unfinished_events.append(event)
+            raise
+        finally:
+            EVENT_LATENCY.observe(
+                time.monotonic() - started_at, event_type=event.type, status=status
+            )
+
+    async def shutdown(self) -> None:
+        logger.info("Shutting down, stats: %s", self.task_manager.stats())
+        await self.task_manager.drain(self.SHUTDOWN_TIMEOUT)
+
     async def process_user_event(self, event: Event) -> None:
         user = await self.user_repository.get_by_webapp_id_with_chats(
             event.payload["user_id"]
@@ -45,14 +122,14 @@ class EventHandler:
 
     async def process_bot_account_linked(self, event: Event) -> None:
         token = event.payload["token"]
-        if user := await self.user_repository.get_by_token_with_chats(token):
-            user.webapp_id = event.payload["user_id"]
-            user.activated_at = datetime.now()
-            await self.user_repository.update(user)
-        else:
+        if not (user := await self.user_repository.get_by_token_with_chats(token)):
             return None
 
-        await self.telegram_client.post_message(
-            user.chat.telegram_id,
-            "Your happiness-mj.xyz account has been linked successfully!",
+        user.webapp_id = event.payload["user_id"]
+        user.activated_at = datetime.now()
+        # the notification is committed with the change and sent by the outbox
+        # relay, so it isn't lost if the process dies before sending it
+        message = OutboxMessageOrm(
+            chat_id=user.chat.telegram_id, text=self.ACCOUNT_LINKED
         )
+        await self.user_repository.update_all(user, message)
@@ -8,3 +8,15 @@ class ValidationError(Exception):
 
 class TelegramAPIError(Exception):
     pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class WebappUnavailableError(Exception):
+    pass
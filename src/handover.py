@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+
+class PollingHandover:
+    # only one instance polls a bot: during a deploy the new instance waits until
+    # the old one has stopped polling and released the key, so their getUpdates
+    # calls don't conflict; the key of an instance that crashed expires
+    KEY = "bot:polling:{}"
+    # updates the old instance didn't finish, the new one processes them first
+    UPDATES_KEY = "bot:polling:{}:updates"
+    TTL = float(os.environ.get("POLLING_HANDOVER_TTL_SECONDS", 15))
+    # how long the released key keeps the last update id for the next instance
+    RELEASED_TTL = 60 * 60
+    RETRY_INTERVAL = 0.5
+
+    RELEASED = "released:"
+
+    ACQUIRE_SCRIPT = """
+        local value = redis.call('GET', KEYS[1])
+        if value and value ~= ARGV[1] and string.sub(value, 1, 9) ~= 'released:' then
+            return false
+        end
+        redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return value or ''
+    """
+    RENEW_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    RELEASE_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+        end
+        return false
+    """
+
+    def __init__(self, redis: Redis, ttl: float = TTL) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.owner = (
+            f"polling:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        # names of the bots this instance polls
+        self.names: set[str] = set()
+        self._acquire_script = redis.register_script(self.ACQUIRE_SCRIPT)
+        self._renew_script = redis.register_script(self.RENEW_SCRIPT)
+        self._release_script = redis.register_script(self.RELEASE_SCRIPT)
+
+    def holds(self, name: str) -> bool:
+        return name in self.names
+
+    async def run(self) -> None:
+        while True:
+            for name in list(self.names):
+                try:
+                    renewed = await self._renew_script(
+                        keys=[self.KEY.format(name)],
+                        args=[self.owner, int(self.ttl * 1000)],
+                    )
+                except Exception as exc:
+                    logger.warning("Failed to renew the polling key: %r", exc)
+                    continue
+                if not renewed:
+                    logger.warning("Polling of @%s was taken over", name)
+                    self.names.discard(name)
+
+            await asyncio.sleep(self.ttl / 3)
+
+    async def acquire(self, name: str) -> int | None:
+        # waits for the previous instance, returns the last update id it handed over
+        waiting = False
+        while True:
+            previous = await self._acquire_script(
+                keys=[self.KEY.format(name)], args=[self.owner, int(self.ttl * 1000)]
+            )
+            if previous is not None:
+                break
+            if not waiting:
+                logger.info("Waiting for the polling of @%s to be handed over", name)
+                waiting = True
+            await asyncio.sleep(self.RETRY_INTERVAL)
+
+        self.names.add(name)
+        if isinstance(previous, bytes):
+            previous = previous.decode("utf8")
+        if previous.startswith(self.RELEASED) and previous != self.RELEASED:
+            logger.info("Took over the polling of @%s", name)
+            return int(previous[len(self.RELEASED) :])
+        return None
+
+    async def take_updates(self, name: str) -> list[dict]:
+        key = self.UPDATES_KEY.format(name)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.delete(key)
+            updates, _ = await pipe.execute()
+        return [json.loads(update) for update in updates]
+
+    async def release(
+        self, name: str, last_update_id: int | None, updates: list[dict]
+    ) -> None:
+        if updates:
+            key = self.UPDATES_KEY.format(name)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, *(json.dumps(update) for update in updates))
+                pipe.expire(key, self.RELEASED_TTL)
+                await pipe.execute()
+            logger.info("Handed over %d unfinished update(s)", len(updates))
+
+        self.names.discard(name)
+        await self._release_script(
+            keys=[self.KEY.format(name)],
+            args=[
+                self.owner,
+                f"{self.RELEASED}{last_update_id or ''}",
+                self.RELEASED_TTL * 1000,
+            ],
+        )
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import TYPE_CHECKING, Any
+
+from http_server import Request, Response
+from leader import UpdateQueue
+from pubsub import RedisPubSub
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+    from bot import Bot
+    from http_server import HttpServer
+    from leader import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+# replica id -> time of its last heartbeat
+REPLICAS_KEY = "bot:replicas"
+REPLICA_KEY = "bot:replica:{}"
+# heartbeat fields that aren't numbers
+TEXT_FIELDS = {"id", "role", "version"}
+# shared queues whose length is part of the cluster view
+QUEUES = {"events": RedisPubSub.MESSAGES_LIST, "updates": UpdateQueue.KEY}
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode("utf8") if isinstance(value, bytes) else value
+
+
+class Heartbeat:
+    # every process publishes its load to Redis, so any of them can show the whole
+    # cluster; a replica that stops sending heartbeats disappears after TTL
+    INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL_SECONDS", 5))
+    TTL = INTERVAL * 3
+
+    def __init__(
+        self,
+        redis: Redis,
+        server: HttpServer,
+        bot: Bot,
+        redis_pubsub: RedisPubSub,
+        role: str,
+        lease: LeaderLease | None = None,
+    ) -> None:
+        self.redis = redis
+        self.bot = bot
+        self.redis_pubsub = redis_pubsub
+        self.role = role
+        self.lease = lease
+        self.replica_id = f"{socket.gethostname()}:{os.getpid()}"
+        server.add_route("/cluster", self.cluster)
+
+    def snapshot(self) -> dict[str, str | int | float]:
+        running = waiting = limit = 0
+        for task_manager in (
+            self.bot.task_manager,
+            self.redis_pubsub.event_handler.task_manager,
+        ):
+            for stats in task_manager.stats().values():
+                running += stats["running"]
+                waiting += stats["waiting"]
+                limit += stats["limit"]
+
+        context = self.bot.context
+        return {
+            "role": self.role,
+            "version": context.version,
+            "uptime": int(context.get_uptime().total_seconds()),
+            "leader": int(bool(self.lease and self.lease.is_leader)),
+            "running": running,
+            "waiting": waiting,
+            "limit": limit,
+            "utilization": round(running / limit, 3) if limit else 0,
+            "event_lag": round(self.redis_pubsub.last_event_lag, 3),
+            "poll_age": round(time.monotonic() - self.bot.last_poll_at, 1),
+        }
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.publish()
+            except Exception as exc:
+                logger.warning("Failed to publish a heartbeat: %r", exc)
+            await asyncio.sleep(self.INTERVAL)
+
+    async def publish(self) -> None:
+        key = REPLICA_KEY.format(self.replica_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=self.snapshot())
+            pipe.pexpire(key, int(self.TTL * 1000))
+            pipe.zadd(REPLICAS_KEY, {self.replica_id: time.time()})
+            await pipe.execute()
+
+    async def remove(self) -> None:
+        # called first on shutdown, a Redis error mustn't keep the rest from
+        # draining; the heartbeat expires after TTL anyway
+        try:
+            await self.redis.delete(REPLICA_KEY.format(self.replica_id))
+            await self.redis.zrem(REPLICAS_KEY, self.replica_id)
+        except Exception as exc:
+            logger.warning("Failed to remove the heartbeat: %r", exc)
+
+    async def cluster(self, request: Request) -> Response:
+        return Response.json(await get_cluster_status(self.redis, self.TTL))
+
+
+async def get_cluster_status(redis: Redis, ttl: float = Heartbeat.TTL) -> dict:
+    await redis.zremrangebyscore(REPLICAS_KEY, "-inf", time.time() - ttl)
+    replica_ids = [_decode(id_) for id_ in await redis.zrange(REPLICAS_KEY, 0, -1)]
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for replica_id in replica_ids:
+            pipe.hgetall(REPLICA_KEY.format(replica_id))
+        for queue in QUEUES.values():
+            pipe.llen(queue)
+        results = await pipe.execute()
+
+    replicas = []
+    for replica_id, heartbeat in zip(replica_ids, results):
+        if not heartbeat:
+            continue
+        replica: dict[str, Any] = {"id": replica_id}
+        for field, value in heartbeat.items():
+            field, value = _decode(field), _decode(value)
+            replica[field] = value if field in TEXT_FIELDS else float(value)
+        replicas.append(replica)
+
+    running = sum(replica["running"] for replica in replicas)
+    limit = sum(replica["limit"] for replica in replicas)
+    queues = dict(zip(QUEUES, results[len(replica_ids) :]))
+    return {
+        "replicas": replicas,
+        "total": {
+            "replicas": len(replicas),
+            "running": running,
+            "waiting": sum(replica["waiting"] for replica in replicas),
+            "limit": limit,
+            # the share of task slots in use across the cluster, and the work
+            # that has no slot yet: the inputs for scaling up or down
+            "utilization": round(running / limit, 3) if limit else 0,
+            "event_lag_max": max((r["event_lag"] for r in replicas), default=0),
+            "queues": queues,
+        },
+    }
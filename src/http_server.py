@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import socket
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: dict[str, str]
+    headers: dict[str, str]
+    body: bytes = b""
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else {}
+
+
+@dataclass
+class Response:
+    body: bytes | str = b""
+    status: int = 200
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def json(cls, data: Any, status: int = 200) -> Response:
+        return cls(json.dumps(data, default=str), status, "application/json")
+
+    def encode(self, keep_alive: bool) -> bytes:
+        body = self.body.encode("utf8") if isinstance(self.body, str) else self.body
+        headers = {
+            "Content-Type": self.content_type,
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **self.headers,
+        }
+        head = f"HTTP/1.1 {self.status} {HTTPStatus(self.status).phrase}\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        return (head + "\r\n").encode("latin1") + body
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    # a tiny HTTP/1.1 server for internal endpoints (metrics, health checks, admin
+    # actions), so the bot doesn't need a web framework as a dependency
+    MAX_BODY_SIZE = 10 * 1024 * 1024
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 9090) -> None:
+        self.host = host
+        self.port = port
+        self.routes: dict[str, Handler] = {}
+        self.prefix_routes: dict[str, Handler] = {}
+        self._server: asyncio.AbstractServer | None = None
+
+    def add_route(self, path: str, handler: Handler) -> None:
+        if path.endswith("*"):
+            self.prefix_routes[path[:-1]] = handler
+        else:
+            self.routes[path] = handler
+
+    def _find_handler(self, path: str) -> Handler | None:
+        if handler := self.routes.get(path):
+            return handler
+        for prefix, handler in self.prefix_routes.items():
+            if path.startswith(prefix):
+                return handler
+        return None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        sockets: list[socket.socket] = list(self._server.sockets or [])
+        if sockets:
+            self.port = sockets[0].getsockname()[1]
+        logger.info("HTTP server listening on %s:%d", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Request | None:
+        try:
+            request_line = await reader.readline()
+        except ConnectionError:
+            return None
+        if not request_line.strip():
+            return None
+
+        method, target, _ = request_line.decode("latin1").split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if length := int(headers.get("content-length", 0)):
+            if length > self.MAX_BODY_SIZE:
+                raise ValueError("Request body is too large")
+            body = await reader.readexactly(length)
+
+        url = urlsplit(target)
+        return Request(method, url.path, dict(parse_qsl(url.query)), headers, body)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while request := await self._read_request(reader):
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                response = await self._dispatch(request)
+                writer.write(response.encode(keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ValueError as exc:
+            # a malformed request line or header, or a body that's too large
+            logger.debug("Bad HTTP request: %r", exc)
+            writer.write(Response("Bad Request", 400).encode(keep_alive=False))
+        except (asyncio.IncompleteReadError, ConnectionError) as exc:
+            logger.debug("Dropping HTTP connection: %r", exc)
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        if not (handler := self._find_handler(request.path)):
+            return Response("Not Found", 404)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception("Error handling %s %s", request.method, request.path)
+            return Response("Internal Server Error", 500)
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import TYPE_CHECKING, Any
+
+from bot import Bot
+from metrics import gauge
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+# replicas elect a leader that polls Telegram, every replica processes updates
+CLUSTER_MODE = os.environ.get("CLUSTER_MODE", "0") == "1"
+
+LEADER = gauge("bot_leader", "1 if this replica holds the polling lease")
+
+
+class LeaderLease:
+    KEY = "bot:leader"
+    TTL = float(os.environ.get("LEADER_LEASE_TTL_SECONDS", 6))
+
+    # every acquisition gets a new, higher fencing token; writes made on behalf of
+    # the leader check it, so a replica that lost the lease without noticing (e.g.
+    # a long GC pause) can't publish anymore
+    ACQUIRE_SCRIPT = """
+        if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+            return redis.call('INCR', KEYS[2])
+        end
+        return 0
+    """
+    RENEW_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    RELEASE_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, redis: Redis, key: str = KEY, ttl: float = TTL) -> None:
+        self.redis = redis
+        self.key = key
+        self.fence_key = f"{key}:fence"
+        self.ttl = ttl
+        self.replica_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.token: int | None = None
+        self._valid_until = 0.0
+        self._acquire_script = redis.register_script(self.ACQUIRE_SCRIPT)
+        self._renew_script = redis.register_script(self.RENEW_SCRIPT)
+        self._release_script = redis.register_script(self.RELEASE_SCRIPT)
+
+    @property
+    def is_leader(self) -> bool:
+        # a lease that couldn't be renewed in time is treated as lost even before
+        # Redis confirms it, another replica may already hold it
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    async def run(self) -> None:
+        while True:
+            started_at = time.monotonic()
+            try:
+                if self.token is None:
+                    await self._acquire(started_at)
+                elif not await self._renew():
+                    self._lose("the lease was taken over")
+            except Exception as exc:
+                logger.warning("Leader lease error: %r", exc)
+            if self.token is not None and not self.is_leader:
+                self._lose("the lease expired")
+
+            await asyncio.sleep(self.ttl / 3)
+
+    async def _acquire(self, started_at: float) -> None:
+        token = await self._acquire_script(
+            keys=[self.key, self.fence_key],
+            args=[self.replica_id, int(self.ttl * 1000)],
+        )
+        if token:
+            self.token = int(token)
+            self._valid_until = started_at + self.ttl
+            LEADER.set(1)
+            logger.info("Became the leader, fencing token %d", self.token)
+
+    async def _renew(self) -> bool:
+        started_at = time.monotonic()
+        renewed = await self._renew_script(
+            keys=[self.key], args=[self.replica_id, int(self.ttl * 1000)]
+        )
+        if renewed:
+            self._valid_until = started_at + self.ttl
+        return bool(renewed)
+
+    def _lose(self, reason: str) -> None:
+        logger.warning("Lost leadership (token %s): %s", self.token, reason)
+        self.token = None
+        LEADER.set(0)
+
+    async def release(self) -> None:
+        if self.token is None:
+            return None
+        # lets another replica take over right away instead of after the TTL
+        await self._release_script(keys=[self.key], args=[self.replica_id])
+        self._lose("released")
+
+    def status(self) -> dict[str, Any]:
+        return {
+            "replica": self.replica_id,
+            "leader": self.is_leader,
+            "token": self.token,
+        }
+
+
+class UpdateQueue:
+    # the queue the leader publishes updates to and every replica consumes from
+    KEY = "bot_work:shared"
+    OFFSET_KEY = "bot:last_update_id"
+    SEEN_KEY = "bot:update_seen:{}"
+    SEEN_TTL = 24 * 60 * 60
+
+    # an update is only queued by the current leader and only once: Telegram
+    # resends unconfirmed updates to a new leader, which may include updates the
+    # previous one already queued
+    PUBLISH_SCRIPT = """
+        if tonumber(redis.call('GET', KEYS[1])) ~= tonumber(ARGV[1]) then
+            return -1
+        end
+        local queued = 0
+        if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'EX', ARGV[4]) then
+            redis.call('RPUSH', KEYS[3], ARGV[2])
+            queued = 1
+        end
+        redis.call('SET', KEYS[4], ARGV[3])
+        return queued
+    """
+
+    def __init__(self, redis: Redis, lease: LeaderLease) -> None:
+        self.redis = redis
+        self.lease = lease
+        self._publish_script = redis.register_script(self.PUBLISH_SCRIPT)
+
+    async def publish(self, update: dict) -> bool:
+        # returns False if the lease has moved to another replica
+        result = await self._publish_script(
+            keys=[
+                self.lease.fence_key,
+                self.SEEN_KEY.format(update["update_id"]),
+                self.KEY,
+                self.OFFSET_KEY,
+            ],
+            args=[
+                self.lease.token or 0,
+                json.dumps({"update": update}),
+                update["update_id"],
+                self.SEEN_TTL,
+            ],
+        )
+        if result == 0:
+            logger.info("Update %s was already queued", update["update_id"])
+        return result != -1
+
+    async def get_last_update_id(self) -> int | None:
+        value = await self.redis.get(self.OFFSET_KEY)
+        return int(value) if value else None
+
+
+class LeadershipLost(Exception):
+    pass
+
+
+class ClusterBot(Bot):
+    # polls Telegram only while holding the lease, and publishes updates to the
+    # shared queue instead of processing them
+    CONFLICT_RETRY_DELAY = 2
+
+    def __init__(self, lease: LeaderLease, queue: UpdateQueue, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.lease = lease
+        self.queue = queue
+
+    async def start(self) -> None:
+        while not self.stopping:
+            if not self.lease.is_leader:
+                # followers don't poll, but they're healthy
+                self.last_poll_at = time.monotonic()
+                await asyncio.sleep(0.5)
+                continue
+
+            await self.lead()
+        await self.hand_over()
+
+    async def hand_over(self) -> None:
+        # the updates are in the shared queue already, only the lease is passed on
+        if self.lease.is_leader:
+            await self.telegram_client.confirm_updates()
+        await self.lease.release()
+
+    async def lead(self) -> None:
+        self.telegram_client.last_update_id = await self.queue.get_last_update_id()
+        polling = asyncio.create_task(self.run_polling_loop())
+        while self.lease.is_leader and not polling.done():
+            await asyncio.wait([polling], timeout=0.5)
+
+        polling.cancel()
+        try:
+            await polling
+        except (asyncio.CancelledError, LeadershipLost):
+            pass
+        except Exception as exc:
+            # e.g. a 409 while the previous leader's long poll is still open
+            logger.warning("Polling failed: %r", exc)
+            await asyncio.sleep(self.CONFLICT_RETRY_DELAY)
+
+    async def dispatch_update(self, update: dict) -> None:
+        if not await self.queue.publish(update):
+            raise LeadershipLost()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "0") == "1"
+ADAPTIVE_MAX_LIMIT_FACTOR = int(os.environ.get("ADAPTIVE_MAX_LIMIT_FACTOR", 4))
+ADAPTIVE_LATENCY_THRESHOLD = float(os.environ.get("ADAPTIVE_LATENCY_THRESHOLD", 2.0))
+
+
+@dataclass
+class Outcome:
+    latency: float = 0.0
+    error: bool = False
+    overloaded: bool = False
+
+    @property
+    def dropped(self) -> bool:
+        return self.error or self.overloaded
+
+
+_current_outcome: ContextVar[Outcome | None] = ContextVar(
+    "limiter_outcome", default=None
+)
+
+
+def track_outcome(outcome: Outcome | None = None) -> Outcome:
+    outcome = outcome or Outcome()
+    _current_outcome.set(outcome)
+    return outcome
+
+
+def report_overload() -> None:
+    # called by API clients when a dependency answers with 429 or similar, so that
+    # the limiter of the task making the call can back off
+    if outcome := _current_outcome.get():
+        outcome.overloaded = True
+
+
+class Limiter:
+    def __init__(self, limit: int) -> None:
+        self._limit = float(limit)
+        self.in_flight = 0
+        self.dropped = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return None
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake_waiters()
+            raise
+
+    def release(self, outcome: Outcome) -> None:
+        self.in_flight -= 1
+        if outcome.dropped:
+            self.dropped += 1
+        self.update_limit(outcome)
+        self._wake_waiters()
+
+    def update_limit(self, outcome: Outcome) -> None:
+        pass
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "dropped": self.dropped,
+        }
+
+
+class AIMDLimiter(Limiter):
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int | None = None,
+        latency_threshold: float = ADAPTIVE_LATENCY_THRESHOLD,
+        backoff_ratio: float = 0.9,
+    ) -> None:
+        super().__init__(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit or initial_limit * ADAPTIVE_MAX_LIMIT_FACTOR
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+
+    def update_limit(self, outcome: Outcome) -> None:
+        old_limit = self.limit
+
+        if outcome.dropped or outcome.latency > self.latency_threshold:
+            self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+        elif self.in_flight * 2 >= self._limit:
+            # only grow when the current limit is actually being used
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+        if self.limit != old_limit:
+            logger.debug("Concurrency limit changed %d -> %d", old_limit, self.limit)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            **super().as_dict(),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+        }
+
+
+def create_limiter(limit: int) -> Limiter:
+    if ADAPTIVE_CONCURRENCY:
+        return AIMDLimiter(limit)
+    return Limiter(limit)
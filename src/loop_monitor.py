@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = histogram(
+    "bot_event_loop_lag_seconds",
+    "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_BLOCKED = counter("bot_event_loop_blocked_total", "Detected event loop stalls")
+
+
+class LoopMonitor:
+    INTERVAL = float(os.environ.get("LOOP_MONITOR_INTERVAL_SECONDS", 0.25))
+    BLOCK_THRESHOLD = float(os.environ.get("LOOP_BLOCK_THRESHOLD_SECONDS", 0.5))
+    STACK_LIMIT = 30
+
+    def __init__(
+        self,
+        interval: float = INTERVAL,
+        block_threshold: float = BLOCK_THRESHOLD,
+    ) -> None:
+        self.interval = interval
+        self.block_threshold = block_threshold
+        # the lag of the last tick, and the largest one seen
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.blocked_count = 0
+        self._last_tick = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+        try:
+            while True:
+                scheduled_at = loop.time()
+                await asyncio.sleep(self.interval)
+                self.lag = max(0.0, loop.time() - scheduled_at - self.interval)
+                self._last_tick = time.monotonic()
+                self.max_lag = max(self.max_lag, self.lag)
+                LOOP_LAG.observe(self.lag)
+        finally:
+            self._stopped.set()
+
+    def _watch(self) -> None:
+        # runs in a separate thread, so it can see the loop thread while the loop is
+        # stuck in a synchronous callback
+        reported_tick = None
+        while not self._stopped.wait(self.block_threshold / 2):
+            last_tick = self._last_tick
+            blocked_for = time.monotonic() - last_tick - self.interval
+            if blocked_for < self.block_threshold or reported_tick == last_tick:
+                continue
+
+            reported_tick = last_tick
+            self.blocked_count += 1
+            LOOP_BLOCKED.inc()
+            logger.warning(
+                "Event loop blocked for %.0fms, loop thread stack:\n%s",
+                blocked_for * 1000,
+                self.sample_stack(),
+            )
+
+    def sample_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id or -1)
+        if frame is None:
+            return "<unavailable>"
+        return "".join(traceback.format_stack(frame, limit=self.STACK_LIMIT))
+
+
+def install_uvloop() -> bool:
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("USE_UVLOOP is set but uvloop isn't installed")
+        return False
+
+    uvloop.install()
+    return True
@@ -2,43 +2,313 @@
 from __future__ import annotations
 
 import asyncio
+import atexit
 import logging
+import os
+import queue
+import signal
+import time
+from logging.handlers import QueueListener
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Sequence, TypeVar
 
+import httpx
 from dependency_injector.wiring import Provide, inject
 
 from bot import Bot
-from containers import Container
+from containers import REDIS_URL, Container
 from db import Database
+from handover import PollingHandover
+from heartbeat import Heartbeat
+from http_server import HttpServer
+from leader import CLUSTER_MODE, LeaderLease, UpdateQueue
+from loop_monitor import LoopMonitor, install_uvloop
+from monitoring import Monitoring
+from outbox import OutboxRelay
+from profiling import Profiling
 from pubsub import RedisPubSub
-from utils.logging import CustomFormatter
+from shutdown import DRAIN_TIMEOUT, SHUTDOWN_TIMEOUT
+from telegram_client import TelegramClient
+from utils.logging import (
+    CustomFormatter,
+    JsonFormatter,
+    NonFormattingQueueHandler,
+    RateLimitFilter,
+)
+from webapp_client import WebappClient
+from workers import (
+    MP_CONTEXT,
+    WORKERS,
+    IngestBot,
+    Receiver,
+    RedisReceiver,
+    Transport,
+    Worker,
+    stop_processes,
+)
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+T = TypeVar("T")
+
+LOG_FORMAT = "%(asctime)s %(levelname)-5s %(name)-16s > %(message)s"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
+LOG_JSON = os.environ.get("LOG_JSON", "0") == "1"
+# debug records per second allowed for each call site, 0 turns the limit off
+LOG_DEBUG_RATE = float(os.environ.get("LOG_DEBUG_RATE", 20))
+USE_UVLOOP = os.environ.get("USE_UVLOOP", "0") == "1"
 
 
 def init_logging() -> None:
-    logging.basicConfig(
-        format="%(asctime)s %(levelname)-5s %(name)-16s > %(message)s",
-        level=logging.DEBUG,
-    )
+    formatter = JsonFormatter() if LOG_JSON else CustomFormatter(LOG_FORMAT)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    handlers: list[logging.Handler] = [stream_handler]
+
+    if slow_log_file := os.environ.get("SLOW_LOG_FILE"):
+        slow_log_handler = logging.FileHandler(slow_log_file)
+        slow_log_handler.setFormatter(formatter)
+        slow_log_handler.addFilter(logging.Filter("slow_updates"))
+        handlers.append(slow_log_handler)
 
-    logger = logging.getLogger()
-    for handler in logger.root.handlers:  # type: ignore
-        handler.setFormatter(CustomFormatter(handler.formatter._fmt))
+    # the event loop only puts records on a queue, they're formatted and written
+    # by the listener's thread
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = NonFormattingQueueHandler(log_queue)
+    if LOG_DEBUG_RATE:
+        queue_handler.addFilter(RateLimitFilter(LOG_DEBUG_RATE))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
     logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
 
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+async def timed(timings: dict[str, float], name: str, aw: Awaitable[T]) -> T:
+    started_at = time.monotonic()
+    try:
+        return await aw
+    finally:
+        timings[name] = time.monotonic() - started_at
+
+
+async def start_up(
+    bot: Bot, db: Database, redis: Redis, http_server: HttpServer
+) -> None:
+    # nothing here depends on anything else, so it's all done at the same time; it
+    # also checks that the database, Redis and the bot token work before polling
+    timings = {"imports (cpu)": time.process_time()}
+    started_at = time.monotonic()
+    schema_created, _, me, _ = await asyncio.gather(
+        timed(timings, "db", db.create_database()),
+        timed(timings, "redis", redis.ping()),
+        timed(timings, "telegram", bot.telegram_client.get_me()),
+        timed(timings, "http", http_server.start()),
+    )
+    if not me.ok:
+        raise RuntimeError(f"getMe failed: {me}")
+    if (username := me.get_result()["username"]) != bot.username:  # type: ignore
+        logging.warning("The token is for @%s, not @%s", username, bot.username)
+
+    logging.info(
+        "Started in %.2fs (schema %s): %s",
+        time.monotonic() - started_at,
+        "created" if schema_created else "up to date",
+        ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()),
+    )
+
+
+async def run_until_signal(
+    draining: Sequence[Awaitable[Any]],
+    background: Sequence[Awaitable[Any]],
+    stop: Callable[[], None],
+) -> None:
+    # on a signal, `stop` tells the `draining` tasks to stop taking work, they get
+    # DRAIN_TIMEOUT to finish what they have; `background` tasks are cancelled
+    signalled = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, signalled.set)
+
+    drained = [asyncio.ensure_future(awaitable) for awaitable in draining]
+    tasks = drained + [asyncio.ensure_future(awaitable) for awaitable in background]
+    waiting = asyncio.create_task(signalled.wait())
+    try:
+        done, _ = await asyncio.wait(
+            [*tasks, waiting], return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done - {waiting}:
+            task.result()
+
+        logging.info("Draining")
+        stop()
+        _, pending = await asyncio.wait(drained, timeout=DRAIN_TIMEOUT)
+        if pending:
+            logging.warning("%d task(s) didn't drain in time", len(pending))
+    finally:
+        waiting.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 
 @inject
 async def main(
     bot: Bot = Provide[Container.bot],
     db: Database = Provide[Container.db],
+    redis: Redis = Provide[Container.redis],
     redis_pubsub: RedisPubSub = Provide[Container.redis_pubsub],
+    webapp_client: WebappClient = Provide[Container.webapp_client],
+    http_server: HttpServer = Provide[Container.http_server],
+    monitoring: Monitoring = Provide[Container.monitoring],
+    loop_monitor: LoopMonitor = Provide[Container.loop_monitor],
+    profiling: Profiling = Provide[Container.profiling],
+    worker_transport: Transport = Provide[Container.worker_transport],
+    leader_lease: LeaderLease = Provide[Container.leader_lease],
+    outbox_relay: OutboxRelay = Provide[Container.outbox_relay],
+    heartbeat: Heartbeat = Provide[Container.heartbeat],
+    polling_handover: PollingHandover = Provide[Container.polling_handover],
+    telegram_http_client: httpx.AsyncClient = Provide[Container.telegram_http_client],
+    extra_telegram_client: Callable[..., TelegramClient] = Provide[
+        Container.extra_telegram_client.provider
+    ],
+    extra_bot: Callable[..., Bot] = Provide[Container.extra_bot.provider],
 ) -> None:
     init_logging()
-    await db.create_database()
-    await asyncio.gather(bot.start(), redis_pubsub.run())
+    await start_up(bot, db, redis, http_server)
+    extra_bots = []
+    if CLUSTER_MODE or WORKERS:
+        if Bot.EXTRA_BOTS:
+            logging.warning("EXTRA_BOTS are only supported in single process mode")
+    else:
+        for identity in Bot.EXTRA_BOTS:
+            telegram_client = extra_telegram_client(token=identity.token)
+            extra = extra_bot(
+                telegram_client=telegram_client, username=identity.username
+            )
+            monitoring.add_bot(extra)
+            extra_bots.append(extra)
+
+    workers = []
+    # cluster replicas process updates themselves, scale them instead of WORKERS
+    for partition in range(0 if CLUSTER_MODE else WORKERS):
+        worker = MP_CONTEXT.Process(
+            target=run_worker,
+            args=(partition, worker_transport.receiver(partition)),
+            name=f"worker-{partition}",
+        )
+        worker.start()
+        workers.append(worker)
+
+    bots = [bot, *extra_bots]
+    draining = [polling_bot.start() for polling_bot in bots]
+    draining += [redis_pubsub.run(), outbox_relay.run()]
+    background = [loop_monitor.run(), heartbeat.run(), polling_handover.run()]
+    shared_worker = None
+    if CLUSTER_MODE:
+        receiver = RedisReceiver(REDIS_URL, UpdateQueue.KEY)
+        shared_worker = Worker(bot, redis_pubsub.event_handler, receiver)
+        draining.append(shared_worker.run())
+        background.append(leader_lease.run())
+
+    def stop() -> None:
+        for polling_bot in bots:
+            polling_bot.stop_polling()
+        redis_pubsub.stop()
+        outbox_relay.stop()
+        if shared_worker:
+            shared_worker.stop()
+
+    try:
+        await run_until_signal(draining, background, stop)
+    finally:
+        stopping_workers = None
+        taking_back: list[Awaitable[None]] = []
+        if workers:
+            # everything has been routed, the workers finish it while this process
+            # shuts down; they get what the drain has left of the budget
+            await worker_transport.close()
+            stopping_workers = asyncio.get_running_loop().run_in_executor(
+                None, stop_processes, workers, SHUTDOWN_TIMEOUT - DRAIN_TIMEOUT
+            )
+            assert isinstance(bot, IngestBot)
+            taking_back.append(bot.take_back(SHUTDOWN_TIMEOUT - DRAIN_TIMEOUT))
+        if CLUSTER_MODE:
+            await leader_lease.release()
+        await heartbeat.remove()
+        await asyncio.gather(
+            *(polling_bot.shutdown() for polling_bot in bots),
+            redis_pubsub.shutdown(),
+            *taking_back,
+        )
+        await asyncio.gather(
+            *(polling_bot.telegram_client.flush() for polling_bot in bots)
+        )
+        await webapp_client.close()
+        await telegram_http_client.aclose()
+        await http_server.stop()
+        if stopping_workers:
+            await stopping_workers
+
+
+@inject
+async def worker_main(
+    receiver: Receiver,
+    bot: Bot = Provide[Container.bot],
+    redis_pubsub: RedisPubSub = Provide[Container.redis_pubsub],
+    webapp_client: WebappClient = Provide[Container.webapp_client],
+    http_server: HttpServer = Provide[Container.http_server],
+    monitoring: Monitoring = Provide[Container.monitoring],
+    loop_monitor: LoopMonitor = Provide[Container.loop_monitor],
+    profiling: Profiling = Provide[Container.profiling],
+    telegram_http_client: httpx.AsyncClient = Provide[Container.telegram_http_client],
+    heartbeat: Heartbeat = Provide[Container.heartbeat],
+) -> None:
+    init_logging()
+    await http_server.start()
+    worker = Worker(bot, redis_pubsub.event_handler, receiver)
+    try:
+        await run_until_signal(
+            [worker.run()], [loop_monitor.run(), heartbeat.run()], worker.stop
+        )
+    finally:
+        await heartbeat.remove()
+        await asyncio.gather(bot.shutdown(), redis_pubsub.shutdown())
+        await bot.telegram_client.flush()
+        await webapp_client.close()
+        await telegram_http_client.aclose()
+        await http_server.stop()
+
+
+def run_worker(partition: int, receiver: Receiver) -> None:
+    container = Container()
+    # every worker serves its metrics on its own port, after the ingest process's
+    port = container.http_server.kwargs["port"]
+    container.http_server.add_kwargs(port=port + 1 + partition)
+    container.heartbeat.add_kwargs(role="worker")
+    container.init_resources()
+    container.wire(modules=[__name__])
+
+    if USE_UVLOOP:
+        install_uvloop()
+
+    asyncio.run(worker_main(receiver))
 
 
 if __name__ == "__main__":
     container = Container()
+    if CLUSTER_MODE:
+        container.process_role.override("cluster")
+    elif WORKERS:
+        container.process_role.override("ingest")
     container.init_resources()
     container.wire(modules=[__name__])
 
+    if USE_UVLOOP:
+        install_uvloop()
+
     asyncio.run(main())
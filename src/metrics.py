@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import bisect
+import math
+from typing import Callable, Iterable, Sequence, TypeVar
+
+LabelValues = tuple[str, ...]
+Sample = tuple[str, Sequence[str], LabelValues, float]
+
+M = TypeVar("M", bound="Metric")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _label_values(self, labels: dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterable[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for suffix, names, values, value in self.samples():
+            labels = _format_labels(names, values)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for values, value in self._values.items():
+            yield "", self.label_names, values, value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        self._values[self._label_values(labels)] = value
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def samples(self) -> Iterable[Sample]:
+        for values, value in self._values.items():
+            yield "", self.label_names, values, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # per label set: bucket counts, sum, count
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._label_values(labels)
+        if not (item := self._values.get(key)):
+            item = self._values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, totals = item
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def samples(self) -> Iterable[Sample]:
+        bucket_names = self.label_names + ("le",)
+        for values, (counts, (total, count)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_values = values + (_format_value(bound),)
+                yield "_bucket", bucket_names, bucket_values, cumulative
+            yield "_sum", self.label_names, values, total
+            yield "_count", self.label_names, values, count
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+        self.collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        # collectors refresh gauges that are cheaper to read on scrape than to keep
+        # up to date, e.g. task manager and DB pool state
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labels: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+UPDATES_RECEIVED = counter("bot_updates_received_total", "Updates fetched", ["type"])
+UPDATES_PROCESSED = counter(
+    "bot_updates_processed_total", "Updates processed", ["type"]
+)
+COMMAND_LATENCY = histogram(
+    "bot_command_handler_seconds", "Command handler latency", ["command", "status"]
+)
+EVENT_LATENCY = histogram(
+    "bot_event_handler_seconds", "Event handler latency", ["event_type", "status"]
+)
+EVENT_LAG = histogram(
+    "bot_event_lag_seconds",
+    "Delay between event creation and consumption",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+UPDATES_PER_POLL = histogram(
+    "bot_updates_per_poll",
+    "Updates fetched by a getUpdates call",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+MESSAGES_COALESCED = counter(
+    "bot_telegram_messages_coalesced_total",
+    "sendMessage calls saved by merging messages to the same chat",
+)
+OUTBOX_MESSAGES = counter(
+    "bot_outbox_messages_total", "Outbox messages sent or failed", ["status"]
+)
+TELEGRAM_LATENCY = histogram(
+    "bot_telegram_request_seconds", "Telegram API latency", ["method", "status"]
+)
+WEBAPP_LATENCY = histogram(
+    "bot_webapp_request_seconds", "Web app API latency", ["method", "status"]
+)
+CIRCUIT_STATE = gauge(
+    "bot_circuit_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ["name"],
+)
+CIRCUIT_FAILURES = gauge(
+    "bot_circuit_consecutive_failures", "Failures since the last success", ["name"]
+)
+TASKS_RUNNING = gauge("bot_tasks_running", "Running tasks", ["manager", "lane"])
+TASKS_WAITING = gauge(
+    "bot_tasks_waiting", "Tasks waiting for a slot", ["manager", "lane"]
+)
+TASKS_LIMIT = gauge("bot_tasks_limit", "Concurrency limit", ["manager", "lane"])
+DB_POOL = gauge("bot_db_pool_connections", "DB pool connections", ["state"])
+SHED = counter("bot_shed_total", "Work shed because of deadlines or limits", ["reason"])
@@ -1,6 +1,16 @@
 from __future__ import annotations
 
-from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, String, func
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    func,
+)
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -49,3 +59,36 @@ class ChatOrm(Base):
 
     def __repr__(self) -> str:
         return f"ChatOrm(id={self.id!r}, telegram_id={self.telegram_id!r})"
+
+
+class OutboxMessageOrm(Base):
+    # messages written in the same transaction as the change they're about, and
+    # sent by outbox.OutboxRelay
+    __tablename__ = "outbox"
+
+    PENDING = "pending"
+    DELIVERED = "delivered"
+    FAILED = "failed"
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(20), nullable=False, default="HTML")
+
+    status = Column(String(20), nullable=False, default=PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.now())
+    delivered_at = Column(DateTime)
+
+    __table_args__ = (
+        Index(
+            "ix_outbox_pending",
+            "next_attempt_at",
+            postgresql_where=(status == PENDING),
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return f"OutboxMessageOrm(id={self.id!r}, chat_id={self.chat_id!r})"
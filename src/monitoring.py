@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+from circuit_breaker import CircuitState
+from http_server import Request, Response
+from metrics import (
+    CIRCUIT_FAILURES,
+    CIRCUIT_STATE,
+    DB_POOL,
+    REGISTRY,
+    TASKS_LIMIT,
+    TASKS_RUNNING,
+    TASKS_WAITING,
+)
+
+if TYPE_CHECKING:
+    from bot import Bot
+    from db import Database
+    from event_handler import EventHandler
+    from http_server import HttpServer
+    from loop_monitor import LoopMonitor
+    from task_manager import TaskManager
+    from webapp_client import WebappClient
+
+
+class Monitoring:
+    # the bot is unhealthy if the polling loop hasn't completed a request for longer
+    # than a long poll plus its network timeout, with some slack
+    MAX_POLL_AGE = 150
+    # still healthy, but slow: the web app is failing or the event loop is so busy
+    # that every update waits this long before it's even looked at
+    MAX_LOOP_LAG = 0.25
+    CIRCUIT_STATES = {
+        CircuitState.CLOSED: 0,
+        CircuitState.HALF_OPEN: 1,
+        CircuitState.OPEN: 2,
+    }
+
+    def __init__(
+        self,
+        server: HttpServer,
+        bot: Bot,
+        event_handler: EventHandler,
+        db: Database,
+        webapp_client: WebappClient,
+        loop_monitor: LoopMonitor,
+    ) -> None:
+        self.server = server
+        self.bot = bot
+        self.bots = [bot]
+        self.event_handler = event_handler
+        self.db = db
+        self.webapp_client = webapp_client
+        self.loop_monitor = loop_monitor
+
+        REGISTRY.add_collector(self.collect)
+        server.add_route("/metrics", self.metrics)
+        server.add_route("/healthz", self.healthz)
+
+    def add_bot(self, bot: Bot) -> None:
+        self.bots.append(bot)
+
+    @property
+    def task_managers(self) -> list[TaskManager]:
+        return [bot.task_manager for bot in self.bots] + [
+            self.event_handler.task_manager
+        ]
+
+    def collect(self) -> None:
+        for task_manager in self.task_managers:
+            for lane, stats in task_manager.stats().items():
+                labels = {"manager": task_manager.name, "lane": lane}
+                TASKS_RUNNING.set(stats["running"], **labels)
+                TASKS_WAITING.set(stats["waiting"], **labels)
+                TASKS_LIMIT.set(stats["limit"], **labels)
+
+        breaker = self.webapp_client.breaker
+        CIRCUIT_STATE.set(self.CIRCUIT_STATES[breaker.state], name=breaker.name)
+        CIRCUIT_FAILURES.set(breaker.consecutive_failures, name=breaker.name)
+
+        for state, value in self.db.pool_status().items():
+            DB_POOL.set(value, state=state)
+
+    async def metrics(self, request: Request) -> Response:
+        return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4")
+
+    async def healthz(self, request: Request) -> Response:
+        poll_age = time.monotonic() - min(bot.last_poll_at for bot in self.bots)
+        healthy = poll_age < self.MAX_POLL_AGE
+        degraded = []
+        if self.webapp_client.breaker.state != CircuitState.CLOSED:
+            degraded.append("webapp")
+        if self.loop_monitor.lag > self.MAX_LOOP_LAG:
+            degraded.append("event_loop")
+        status = {
+            "healthy": healthy,
+            "degraded": degraded,
+            "poll_age": round(poll_age, 1),
+            "loop_lag": round(self.loop_monitor.lag, 3),
+            "webapp": self.webapp_client.breaker.state.value,
+            **self.bot.context.status(),
+        }
+        return Response.json(status, 200 if healthy else 503)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Any
+
+from metrics import OUTBOX_MESSAGES
+from repositories import OutboxRepository
+from telegram_client import TelegramClient
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    # sends the messages of the outbox table; any number of relays can run, each
+    # claims its own batches
+    POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 0.5))
+    BATCH_SIZE = 50
+    # longer than a sendMessage call can take, so a message isn't claimed again
+    # while it's being sent
+    CLAIM_LEASE = 60
+    MAX_ATTEMPTS = 10
+    RETRY_BACKOFF = 5
+    RETRY_BACKOFF_MAX = 600
+
+    def __init__(
+        self, telegram_client: TelegramClient, outbox_repository: OutboxRepository
+    ) -> None:
+        self.telegram_client = telegram_client
+        self.outbox_repository = outbox_repository
+        self.stopping = False
+
+    def stop(self) -> None:
+        # the batch being sent is finished, so its messages aren't left claimed
+        self.stopping = True
+
+    async def run(self) -> None:
+        while not self.stopping:
+            try:
+                sent = await self.relay_batch()
+            except Exception:
+                logger.exception("Failed to relay outbox messages")
+                sent = 0
+            if sent < self.BATCH_SIZE:
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def relay_batch(self) -> int:
+        messages = await self.outbox_repository.claim(self.BATCH_SIZE, self.CLAIM_LEASE)
+        # messages to a chat are sent in order, different chats at the same time
+        by_chat: dict[int, list[Any]] = defaultdict(list)
+        for message in messages:
+            by_chat[message.chat_id].append(message)
+        results = await asyncio.gather(
+            *(self._send_chat(chat_messages) for chat_messages in by_chat.values())
+        )
+
+        delivered = [message_id for ids in results for message_id in ids]
+        if delivered:
+            await self.outbox_repository.mark_delivered(delivered)
+            OUTBOX_MESSAGES.inc(len(delivered), status="delivered")
+        return len(messages)
+
+    async def _send_chat(self, messages: list[Any]) -> list[int]:
+        delivered = []
+        for index, message in enumerate(messages):
+            try:
+                response = await self.telegram_client.post_message(
+                    message.chat_id, message.text, parse_mode=message.parse_mode
+                )
+            except Exception as exc:
+                error = repr(exc)
+            else:
+                if response.ok:
+                    delivered.append(message.id)
+                    continue
+                error = f"{response.status} {response.text}"
+                if 400 <= response.status < 500 and response.status != 429:
+                    # e.g. the user blocked the bot, retrying won't help
+                    await self._fail(message, error, retry=False)
+                    continue
+
+            # the rest of the chat's messages wait, so they're not sent out of order
+            for pending in messages[index:]:
+                await self._fail(pending, error, retry=True)
+            break
+
+        return delivered
+
+    async def _fail(self, message: Any, error: str, retry: bool) -> None:
+        if retry and message.attempts < self.MAX_ATTEMPTS:
+            backoff = min(
+                self.RETRY_BACKOFF * 2 ** (message.attempts - 1), self.RETRY_BACKOFF_MAX
+            )
+            logger.warning("Outbox message %s failed, retrying: %s", message.id, error)
+            OUTBOX_MESSAGES.inc(status="retried")
+            await self.outbox_repository.mark_failed([message.id], error, backoff)
+        else:
+            logger.error("Outbox message %s failed: %s", message.id, error)
+            OUTBOX_MESSAGES.inc(status="failed")
+            await self.outbox_repository.mark_failed([message.id], error, None)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import gc
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from entities import Message
+from http_server import Request, Response
+from pubsub import Event
+from tracing import Span
+
+if TYPE_CHECKING:
+    from bot import Bot
+    from event_handler import EventHandler
+    from http_server import HttpServer
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    DEFAULT_INTERVAL = 0.005
+
+    def __init__(self, thread_id: int, interval: float = DEFAULT_INTERVAL) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def _run(self, duration: float) -> None:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self._sample()
+            time.sleep(self.interval)
+
+    async def profile(self, duration: float) -> None:
+        # sampling happens in a thread, the loop keeps serving requests meanwhile
+        await asyncio.get_running_loop().run_in_executor(None, self._run, duration)
+
+    def write_folded(self, path: str) -> None:
+        # "folded" stacks, as consumed by flamegraph.pl and speedscope
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiling:
+    ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/happy_bot_profiles")
+    MAX_DURATION = 120
+    TRACEMALLOC_FRAMES = 10
+    TOP_STATS = 25
+    COUNTED_TYPES: tuple[type, ...] = (Message, Event, asyncio.Task, Span)
+
+    def __init__(
+        self,
+        server: HttpServer,
+        bot: Bot,
+        event_handler: EventHandler,
+    ) -> None:
+        self.bot = bot
+        self.event_handler = event_handler
+        self.snapshots: list[tuple[str, tracemalloc.Snapshot]] = []
+        self._busy = False
+
+        # without an admin token nothing is registered, so there's no overhead and
+        # no way to trigger a profile
+        if self.ADMIN_TOKEN:
+            server.add_route("/debug/*", self.dispatch)
+
+    def _is_authorized(self, request: Request) -> bool:
+        token = request.headers.get("x-admin-token") or request.query.get("token", "")
+        return hmac.compare_digest(token.encode(), (self.ADMIN_TOKEN or "").encode())
+
+    def _get_path(self, name: str, extension: str) -> str:
+        os.makedirs(self.PROFILE_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.PROFILE_DIR, f"{name}-{timestamp}.{extension}")
+
+    async def dispatch(self, request: Request) -> Response:
+        if not self._is_authorized(request):
+            return Response("Forbidden", 403)
+
+        actions = {
+            "/debug/cpu": self.cpu_profile,
+            "/debug/tracemalloc/start": self.tracemalloc_start,
+            "/debug/tracemalloc/snapshot": self.tracemalloc_snapshot,
+            "/debug/tracemalloc/stop": self.tracemalloc_stop,
+            "/debug/objects": self.object_counts,
+        }
+        if not (action := actions.get(request.path)):
+            return Response("Not Found", 404)
+
+        if self._busy:
+            return Response("Another profiling action is running", 409)
+        self._busy = True
+        try:
+            return Response.json(await action(request))
+        finally:
+            self._busy = False
+
+    async def cpu_profile(self, request: Request) -> dict[str, Any]:
+        duration = min(float(request.query.get("seconds", 10)), self.MAX_DURATION)
+        mode = request.query.get("mode", "sample")
+
+        if mode == "cprofile":
+            # deterministic, slows the bot down while it runs; the output can be
+            # loaded with pstats or snakeviz
+            profile = cProfile.Profile()
+            profile.enable()
+            await asyncio.sleep(duration)
+            profile.disable()
+            path = self._get_path("cpu", "prof")
+            profile.dump_stats(path)
+            return {"mode": mode, "seconds": duration, "path": path}
+
+        profiler = SamplingProfiler(threading.main_thread().ident or 0)
+        await profiler.profile(duration)
+        path = self._get_path("cpu", "folded")
+        profiler.write_folded(path)
+        return {
+            "mode": "sample",
+            "seconds": duration,
+            "samples": profiler.samples,
+            "path": path,
+        }
+
+    async def tracemalloc_start(self, request: Request) -> dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.TRACEMALLOC_FRAMES)
+        return {"tracing": True}
+
+    async def tracemalloc_stop(self, request: Request) -> dict[str, Any]:
+        tracemalloc.stop()
+        self.snapshots.clear()
+        return {"tracing": False}
+
+    async def tracemalloc_snapshot(self, request: Request) -> dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            return {"error": "tracemalloc isn't running, call /debug/tracemalloc/start"}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        path = self._get_path("memory", "snapshot")
+        snapshot.dump(path)
+        result: dict[str, Any] = {
+            "path": path,
+            "traced_memory": tracemalloc.get_traced_memory(),
+        }
+
+        if self.snapshots:
+            previous_path, previous = self.snapshots[-1]
+            diff = snapshot.compare_to(previous, "lineno")[: self.TOP_STATS]
+            result["compared_to"] = previous_path
+            result["diff"] = [str(stat) for stat in diff]
+        else:
+            top = snapshot.statistics("lineno")[: self.TOP_STATS]
+            result["top"] = [str(stat) for stat in top]
+
+        self.snapshots = [*self.snapshots[-1:], (path, snapshot)]
+        return result
+
+    async def object_counts(self, request: Request) -> dict[str, Any]:
+        counts: Counter[str] = Counter()
+        objects = gc.get_objects()
+        for obj in objects:
+            if isinstance(obj, self.COUNTED_TYPES):
+                counts[type(obj).__name__] += 1
+
+        return {
+            "objects": dict(counts),
+            "gc_objects": len(objects),
+            "asyncio_tasks": len(asyncio.all_tasks()),
+            "task_managers": {
+                manager.name: len(manager.tasks)
+                for manager in (self.bot.task_manager, self.event_handler.task_manager)
+            },
+        }
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
+import time
 import uuid
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 from typing import TYPE_CHECKING, Any
 
+from metrics import EVENT_LAG
+from tracing import span, trace
+
 if TYPE_CHECKING:
     from aioredis import Redis
 
@@ -39,17 +44,54 @@ class Event:
 
 class RedisPubSub:
     MESSAGES_LIST = "bot_messages"
+    # how often a stopped consumer notices it; a BLPOP isn't cancelled, so an
+    # event can't be lost between Redis and the consumer
+    POP_TIMEOUT = 1
 
     def __init__(self, event_handler: EventHandler, redis: Redis) -> None:
         self.event_handler = event_handler
         self.redis = redis
+        self.last_event_lag = 0.0
+        self.stopping = False
+        self._unfinished: list[Event] = []
 
-    async def run(self) -> None:
-        while True:
-            _, data = await self.redis.blpop(self.MESSAGES_LIST)
-            event = self._parse_event(data)
+    def stop(self) -> None:
+        self.stopping = True
 
-            await self.event_handler.handle(event)
+    async def run(self) -> None:
+        while not self.stopping:
+            if not (
+                popped := await self.redis.blpop(self.MESSAGES_LIST, self.POP_TIMEOUT)
+            ):
+                # the list is empty, nothing is waiting
+                self.last_event_lag = 0.0
+                continue
+            _, data = popped
+            with trace("event") as event_span:
+                with span("parse"):
+                    event = self._parse_event(data)
+                event_span.set(type=event.type, event_id=event.id)
+                self.last_event_lag = max(0.0, time.time() - event.timestamp)
+                EVENT_LAG.observe(self.last_event_lag)
+
+                try:
+                    await self.event_handler.handle(event)
+                except asyncio.CancelledError:
+                    self._unfinished.append(event)
+                    raise
+
+    async def shutdown(self) -> None:
+        await self.event_handler.shutdown()
+        # events cut off by the shutdown go back to the front of the list, in the
+        # order they were published; the handlers' are cancelled in any order
+        events = self._unfinished + self.event_handler.unfinished_events
+        events.sort(key=lambda event: event.timestamp)
+        if events:
+            logger.info("Requeueing %d unfinished event(s)", len(events))
+            await self.redis.lpush(
+                self.MESSAGES_LIST,
+                *(json.dumps(asdict(event)) for event in reversed(events)),
+            )
 
     @staticmethod
     def _parse_event(data: bytes) -> Event:
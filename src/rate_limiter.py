@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    limit: int
+    window: float
+
+
+class SlidingWindowLimiter:
+    SWEEP_INTERVAL = 60
+    MAX_WINDOW = 3600
+
+    def __init__(self) -> None:
+        self._hits: dict[str, deque[float]] = {}
+        self._notices: dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, now: float) -> None:
+        # drop keys that have no hits left in any window so that memory use follows
+        # the number of recently active users rather than all users ever seen
+        if now - self._last_sweep < self.SWEEP_INTERVAL:
+            return None
+
+        self._last_sweep = now
+        self._notices = {k: v for k, v in self._notices.items() if v > now}
+        self._hits = {
+            k: v for k, v in self._hits.items() if v and v[-1] > now - self.MAX_WINDOW
+        }
+
+    async def hit(self, key: str, rate_limit: RateLimit) -> bool:
+        return await self.hit_all([(key, rate_limit)]) is None
+
+    async def hit_all(self, checks: list[tuple[str, RateLimit]]) -> str | None:
+        # a hit is only recorded if every limit allows it, so rejected attempts
+        # don't use up the budget; returns the key of the limit that was exceeded
+        now = time.monotonic()
+        self._sweep(now)
+
+        for key, rate_limit in checks:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - rate_limit.window:
+                hits.popleft()
+            if len(hits) >= rate_limit.limit:
+                return key
+
+        for key, _ in checks:
+            self._hits[key].append(now)
+        return None
+
+    async def notify_once(self, key: str, window: float) -> bool:
+        now = time.monotonic()
+        if self._notices.get(key, 0) > now:
+            return False
+
+        self._notices[key] = now + window
+        return True
+
+
+class RedisSlidingWindowLimiter(SlidingWindowLimiter):
+    KEY_PREFIX = "flood"
+
+    # ARGV: now, hit id, then a window and a limit per key; returns the 1-based
+    # index of the key whose limit was exceeded, 0 if the hit was recorded
+    HIT_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        for i, key in ipairs(KEYS) do
+            local window = tonumber(ARGV[2 * i + 1])
+            redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+            if redis.call('ZCARD', key) >= tonumber(ARGV[2 * i + 2]) then
+                return i
+            end
+        end
+        for i, key in ipairs(KEYS) do
+            redis.call('ZADD', key, now, ARGV[2])
+            redis.call('PEXPIRE', key, math.ceil(tonumber(ARGV[2 * i + 1]) * 1000))
+        end
+        return 0
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        super().__init__()
+        self.redis = redis
+        self._hit_script = redis.register_script(self.HIT_SCRIPT)
+
+    async def hit_all(self, checks: list[tuple[str, RateLimit]]) -> str | None:
+        args: list[float | str] = [time.time(), uuid.uuid4().hex]
+        for _, rate_limit in checks:
+            args += [rate_limit.window, rate_limit.limit]
+        exceeded = await self._hit_script(
+            keys=[f"{self.KEY_PREFIX}:{key}" for key, _ in checks], args=args
+        )
+        return checks[int(exceeded) - 1][0] if exceeded else None
+
+    async def notify_once(self, key: str, window: float) -> bool:
+        was_set = await self.redis.set(
+            f"{self.KEY_PREFIX}:notice:{key}", 1, nx=True, px=int(window * 1000)
+        )
+        return bool(was_set)
@@ -1,18 +1,23 @@
 from __future__ import annotations
 
-from typing import Any
+from datetime import timedelta
+from typing import Any, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import joinedload
 
 from db import SessionFactory
-from models import UserOrm
+from deadline import bounded
+from models import OutboxMessageOrm, UserOrm
+from tracing import traced
 
 
 class UserRepository:
     def __init__(self, session_factory: SessionFactory) -> None:
         self.session_factory = session_factory
 
+    @traced()
+    @bounded("repository")
     async def get_by_token_with_chats(self, token: str) -> UserOrm | None:
         async with self.session_factory() as session:
             query = (
@@ -23,6 +28,8 @@ class UserRepository:
             result = await session.execute(query)
             return result.scalars().first()
 
+    @traced()
+    @bounded("repository")
     async def get_by_webapp_id_with_chats(self, webapp_id: int) -> UserOrm | None:
         async with self.session_factory() as session:
             query = (
@@ -33,18 +40,97 @@ class UserRepository:
             result = await session.execute(query)
             return result.scalars().first()
 
+    @traced()
+    @bounded("repository")
     async def update(self, user: UserOrm) -> None:
         async with self.session_factory() as session:
             session.add(user)
             await session.commit()
 
+    @traced()
+    @bounded("repository")
     async def update_all(self, *objects: Any) -> None:
         async with self.session_factory() as session:
             session.add_all(objects)
             await session.commit()
 
+    @traced()
+    @bounded("repository")
     async def get_by_telegram_id(self, telegram_id: int) -> UserOrm | None:
         async with self.session_factory() as session:
             query = select(UserOrm).where(UserOrm.telegram_id == telegram_id)
             result = await session.execute(query)
             return result.scalars().first()
+
+
+class OutboxRepository:
+    def __init__(self, session_factory: SessionFactory) -> None:
+        self.session_factory = session_factory
+
+    @traced()
+    async def claim(self, limit: int, lease: float) -> list[Any]:
+        # claimed messages aren't locked while they're sent, they're hidden from
+        # other relays for `lease` seconds instead; if the relay dies, they're
+        # claimed again after that
+        outbox = OutboxMessageOrm
+        claimable = (
+            select(outbox.id)
+            .where(
+                outbox.status == outbox.PENDING,
+                outbox.next_attempt_at <= func.now(),
+            )
+            .order_by(outbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            update(outbox)
+            .where(outbox.id.in_(claimable.scalar_subquery()))
+            .values(
+                attempts=outbox.attempts + 1,
+                next_attempt_at=func.now() + timedelta(seconds=lease),
+            )
+            .returning(
+                outbox.id,
+                outbox.chat_id,
+                outbox.text,
+                outbox.parse_mode,
+                outbox.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(query)
+            messages = sorted(result.all(), key=lambda message: message.id)
+            await session.commit()
+            return messages
+
+    @traced()
+    async def mark_delivered(self, ids: Sequence[int]) -> None:
+        await self._update(
+            ids, status=OutboxMessageOrm.DELIVERED, delivered_at=func.now()
+        )
+
+    @traced()
+    async def mark_failed(
+        self, ids: Sequence[int], error: str, retry_in: float | None
+    ) -> None:
+        if retry_in is None:
+            await self._update(ids, status=OutboxMessageOrm.FAILED, last_error=error)
+        else:
+            await self._update(
+                ids,
+                last_error=error,
+                next_attempt_at=func.now() + timedelta(seconds=retry_in),
+            )
+
+    async def _update(self, ids: Sequence[int], **values: Any) -> None:
+        query = (
+            update(OutboxMessageOrm)
+            .where(OutboxMessageOrm.id.in_(ids))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        async with self.session_factory() as session:
+            await session.execute(query)
+            await session.commit()
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+import os
+
+# everything a process does after SIGTERM or SIGINT has to fit in the time the
+# container is given to stop, see stop_grace_period in docker-compose.yml
+SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT_SECONDS", 25))
+# time to finish the work in progress, the rest is requeued
+DRAIN_TIMEOUT = SHUTDOWN_TIMEOUT * 0.5
+# time for the tasks still running after that, and for the updates a worker
+# process has taken when its queue is closed; each phase is shorter than the
+# drain, so it ends before the drain gives up on it
+TASK_DRAIN_TIMEOUT = SHUTDOWN_TIMEOUT * 0.2
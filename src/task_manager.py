@@ -1,24 +1,239 @@
 from __future__ import annotations
 
 import asyncio
-from asyncio import Semaphore, Task
-from typing import Coroutine
+import logging
+import time
+from asyncio import Task
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, Coroutine
+
+from deadline import remaining_timeout
+from exceptions import DeadlineExceeded
+from limiter import Limiter, Outcome, create_limiter, track_outcome
+from tracing import Span, start_span, use_span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LaneStats:
+    running: int = 0
+    waiting: int = 0
+    completed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    cancelled: int = 0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+    run_time_total: float = 0.0
+    run_time_max: float = 0.0
+
+    @property
+    def finished(self) -> int:
+        return self.completed + self.failed + self.timed_out + self.cancelled
+
+    def as_dict(self) -> dict[str, Any]:
+        stats = asdict(self)
+        finished = self.finished
+        stats["wait_time_avg"] = self.wait_time_total / finished if finished else 0.0
+        stats["run_time_avg"] = self.run_time_total / finished if finished else 0.0
+        return stats
+
+
+class Lane:
+    def __init__(
+        self,
+        name: str,
+        max_parallel_tasks: int,
+        timeout: float | None = None,
+        limiter: Limiter | None = None,
+    ) -> None:
+        self.name = name
+        self.max_parallel_tasks = max_parallel_tasks
+        self.timeout = timeout
+        self.limiter = limiter or create_limiter(max_parallel_tasks)
+        self.stats = LaneStats()
+
+    async def acquire(self) -> float:
+        started_at = time.monotonic()
+        self.stats.waiting += 1
+        try:
+            await self.limiter.acquire()
+        finally:
+            self.stats.waiting -= 1
+
+        waited = time.monotonic() - started_at
+        self.stats.wait_time_total += waited
+        self.stats.wait_time_max = max(self.stats.wait_time_max, waited)
+        self.stats.running += 1
+        return waited
+
+    def release(self, outcome: Outcome) -> None:
+        run_time = outcome.latency
+        self.stats.running -= 1
+        self.stats.run_time_total += run_time
+        self.stats.run_time_max = max(self.stats.run_time_max, run_time)
+        self.limiter.release(outcome)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "max_parallel_tasks": self.max_parallel_tasks,
+            "timeout": self.timeout,
+            **self.stats.as_dict(),
+            **self.limiter.as_dict(),
+        }
 
 
 class TaskManager:
     DEFAULT_MAX_PARALLEL_TASKS = 10
+    DEFAULT_LANE = "default"
 
-    def __init__(self, max_parallel_tasks: int = DEFAULT_MAX_PARALLEL_TASKS) -> None:
+    def __init__(
+        self,
+        max_parallel_tasks: int = DEFAULT_MAX_PARALLEL_TASKS,
+        timeout: float | None = None,
+        name: str = DEFAULT_LANE,
+    ) -> None:
+        self.name = name
         self.max_parallel_tasks = max_parallel_tasks
-        self.semaphore = Semaphore(self.max_parallel_tasks)
-        self.tasks = set()
+        self.lanes: dict[str, Lane] = {}
+        self.tasks: set[Task] = set()
+        self.accepting = True
+        self.add_lane(self.DEFAULT_LANE, max_parallel_tasks, timeout)
+
+    def add_lane(
+        self,
+        name: str,
+        max_parallel_tasks: int,
+        timeout: float | None = None,
+        limiter: Limiter | None = None,
+    ) -> Lane:
+        lane = Lane(name, max_parallel_tasks, timeout, limiter)
+        self.lanes[name] = lane
+        return lane
+
+    def get_lane(self, name: str | None) -> Lane:
+        if name and name in self.lanes:
+            return self.lanes[name]
+        if name:
+            logger.warning("Unknown lane %r, using %r", name, self.DEFAULT_LANE)
+        return self.lanes[self.DEFAULT_LANE]
+
+    async def _run(
+        self,
+        lane: Lane,
+        coro: Coroutine,
+        timeout: float | None,
+        outcome: Outcome,
+    ) -> Any:
+        track_outcome(outcome)
+        try:
+            if timeout is not None:
+                result = await asyncio.wait_for(coro, timeout)
+            else:
+                result = await coro
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            outcome.error = True
+            lane.stats.timed_out += 1
+            logger.warning("Task in lane %r timed out after %.1fs", lane.name, timeout)
+        except Exception:
+            outcome.error = True
+            lane.stats.failed += 1
+            logger.exception("Task in lane %r failed", lane.name)
+        else:
+            lane.stats.completed += 1
+            return result
+
+    def _on_task_done(
+        self,
+        lane: Lane,
+        outcome: Outcome,
+        started_at: float,
+        task_span: Span | None,
+        task: Task,
+    ) -> None:
+        # the slot is released here rather than in _run, because a task that is
+        # cancelled before it starts never executes its body
+        if task.cancelled():
+            lane.stats.cancelled += 1
+        outcome.latency = time.monotonic() - started_at
+        lane.release(outcome)
+        self.tasks.discard(task)
+        if task_span:
+            task_span.finish()
+
+    async def run_task(
+        self,
+        coro: Coroutine,
+        lane: str | None = None,
+        timeout: float | None = None,
+    ) -> Task | None:
+        if not self.accepting:
+            logger.warning("Task manager is draining, dropping task %s", coro)
+            coro.close()
+            return None
 
-    def _on_task_done(self, task: Task) -> None:
-        self.tasks.remove(task)
-        self.semaphore.release()
+        task_lane = self.get_lane(lane)
+        try:
+            waited = await task_lane.acquire()
+        except BaseException:
+            # e.g. cancelled while waiting for a slot, the coroutine never runs
+            coro.close()
+            raise
 
-    async def run_task(self, coro: Coroutine) -> None:
-        await self.semaphore.acquire()
-        task = asyncio.create_task(coro)
+        task_timeout = remaining_timeout(
+            timeout if timeout is not None else task_lane.timeout
+        )
+        outcome = Outcome()
+        task_span = start_span(f"task.{task_lane.name}", wait=round(waited, 4))
+        with use_span(task_span):
+            task = asyncio.create_task(
+                self._run(task_lane, coro, task_timeout, outcome)
+            )
         self.tasks.add(task)
-        task.add_done_callback(self._on_task_done)
+        task.add_done_callback(
+            partial(self._on_task_done, task_lane, outcome, time.monotonic(), task_span)
+        )
+        return task
+
+    def cancel_all(self) -> int:
+        for task in self.tasks:
+            task.cancel()
+        return len(self.tasks)
+
+    def _is_busy(self) -> bool:
+        # calls accepted before the drain that still wait for a slot start their
+        # tasks later
+        waiting = any(lane.stats.waiting for lane in self.lanes.values())
+        return bool(self.tasks) or waiting
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        self.accepting = False
+        if not self._is_busy():
+            return True
+
+        logger.info("Draining %d task(s)", len(self.tasks))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        while self._is_busy():
+            remaining = deadline - loop.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            if self.tasks:
+                await asyncio.wait(set(self.tasks), timeout=remaining)
+            else:
+                # a slot has been freed, the waiting call is about to start its task
+                await asyncio.sleep(0)
+        else:
+            return True
+
+        logger.warning("Cancelling %d task(s) left after drain", len(self.tasks))
+        pending = set(self.tasks)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return False
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {name: lane.as_dict() for name, lane in self.lanes.items()}
@@ -1,23 +1,28 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import os
+import time
 from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Any, cast
 
 import httpx
-import requests
-from requests.exceptions import Timeout
+from httpx import Response
 
-if TYPE_CHECKING:
-    from requests import Response
+from deadline import check_deadline, remaining_timeout
+from limiter import report_overload
+from metrics import MESSAGES_COALESCED, TELEGRAM_LATENCY, UPDATES_PER_POLL
+from tracing import span
 
+if TYPE_CHECKING:
     from entities import Message
 
 logger = logging.getLogger(__name__)
 
-TOKEN = os.environ["TOKEN"]
-BASE_URL = f"https://api.telegram.org/bot{TOKEN}"
+TOKEN = os.environ.get("TOKEN", "")
+API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
 
 
 @dataclass
@@ -54,6 +59,9 @@ class APIResponse:
                 response.text,
             )
 
+        if response.status_code == 429:
+            report_overload()
+
         return cls(data, response.text, response.status_code, response=response)
 
     @classmethod
@@ -65,32 +73,112 @@ class APIResponse:
             self.response.raise_for_status()
 
 
+@dataclass
+class _Batch:
+    # messages to a chat waiting to be sent as one
+    parse_mode: str
+    texts: list[str]
+    sent: asyncio.Future
+    flushing: bool = False
+
+    @property
+    def length(self) -> int:
+        separators = len(TelegramClient.COALESCE_SEPARATOR) * (len(self.texts) - 1)
+        return sum(len(text) for text in self.texts) + separators
+
+
 class TelegramClient:
     POLL_INTERVAL = 60
+    # getUpdates batch size, grows while catching up and shrinks when idle
+    MIN_POLL_LIMIT = 10
+    MAX_POLL_LIMIT = 100
     DEFAULT_TIMEOUT = 5
-
-    def __init__(self, last_update_id: int | None = None) -> None:
+    # a request that can't get a connection by then is given up on, instead of
+    # waiting for as long as it would for a response
+    POOL_TIMEOUT = 2
+    # used when no client is passed in, the shared one is sized from the task lanes
+    MAX_CONNECTIONS = 100
+
+    MESSAGE_LIMIT = 4096
+    # messages posted to the same chat within this many seconds are sent as one,
+    # 0 turns it off
+    COALESCE_WINDOW = float(os.environ.get("TELEGRAM_COALESCE_WINDOW", 0))
+    COALESCE_SEPARATOR = "\n\n"
+
+    def __init__(
+        self,
+        token: str = TOKEN,
+        http_client: httpx.AsyncClient | None = None,
+        last_update_id: int | None = None,
+    ) -> None:
+        if not token:
+            raise ValueError("Telegram bot token is not set")
+        self.base_url = f"{API_URL}/bot{token}"
         self.last_update_id = last_update_id
+        self.poll_limit = self.MIN_POLL_LIMIT
+        self._backlog = False
         self.headers = {"Content-Type": "application/json"}
+        # bots hosted by the same process share one connection pool
+        self._owns_http_client = http_client is None
+        self._client = http_client or self.make_http_client()
+        self._batches: dict[int, _Batch] = {}
+        # chat id -> done once the last send to the chat has finished
+        self._sending: dict[int, asyncio.Future] = {}
+
+    @classmethod
+    def make_http_client(cls, connections: int = MAX_CONNECTIONS) -> httpx.AsyncClient:
+        # sized so that every task that can run at once has a connection
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=connections, max_keepalive_connections=connections
+            ),
+            timeout=httpx.Timeout(cls.DEFAULT_TIMEOUT, pool=cls.POOL_TIMEOUT),
+        )
+
+    async def close(self) -> None:
+        if self._owns_http_client:
+            await self._client.aclose()
 
     def _prepare_params(self, request_params: dict) -> dict:
         headers = {}
         headers.update(self.headers)
         headers.update(request_params.pop("headers", {}))
 
+        timeout = request_params.pop("timeout", None)
+        if timeout is None:
+            timeout = cast(float, remaining_timeout(self.DEFAULT_TIMEOUT))
+
         params = {
             "headers": headers,
-            "timeout": self.DEFAULT_TIMEOUT,
+            "timeout": httpx.Timeout(timeout, pool=min(timeout, self.POOL_TIMEOUT)),
         }
         params.update(request_params)
 
         return params
 
+    @staticmethod
+    def _observe(url: str, started_at: float, status: str) -> None:
+        _, _, method = url.rpartition("/")
+        TELEGRAM_LATENCY.observe(
+            time.monotonic() - started_at, method=method, status=status
+        )
+
     async def _post(self, url: str, data: dict, **request_params: Any) -> APIResponse:
+        check_deadline("telegram")
         params = self._prepare_params(request_params)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data, **params)
+        started_at = time.monotonic()
+        status = "error"
+        try:
+            with span("telegram", method=url.rpartition("/")[2]):
+                response = await self._client.post(url, json=data, **params)
+            status = str(response.status_code)
+        except httpx.PoolTimeout:
+            status = "pool_timeout"
+            logger.warning("No free connection for POST %s", url.rpartition("/")[2])
+            return APIResponse.from_timeout()
+        finally:
+            self._observe(url, started_at, status)
 
         api_response = APIResponse.from_response(response)
         logger.debug("POST response: %s", api_response)
@@ -102,10 +190,23 @@ class TelegramClient:
         params: dict[str, Any],
         **request_params: Any,
     ) -> APIResponse:
+        check_deadline("telegram")
         full_request_params = self._prepare_params(request_params)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, **full_request_params)
+        started_at = time.monotonic()
+        status = "error"
+        try:
+            with span("telegram", method=url.rpartition("/")[2]):
+                response = await self._client.get(
+                    url, params=params, **full_request_params
+                )
+            status = str(response.status_code)
+        except httpx.PoolTimeout:
+            status = "pool_timeout"
+            logger.warning("No free connection for GET %s", url.rpartition("/")[2])
+            return APIResponse.from_timeout()
+        finally:
+            self._observe(url, started_at, status)
 
         return APIResponse.from_response(response)
 
@@ -113,13 +214,21 @@ class TelegramClient:
     def offset(self) -> int | None:
         return self.last_update_id + 1 if self.last_update_id else None
 
-    async def get_updates(self) -> list[dict]:
+    async def get_updates(self, allowed_updates: list[str] | None = None) -> list[dict]:
+        params: dict[str, Any] = {
+            # no need to wait for new updates while there are more to fetch
+            "timeout": 0 if self._backlog else self.POLL_INTERVAL,
+            "offset": self.offset,
+            "limit": self.poll_limit,
+        }
+        if allowed_updates is not None:
+            # the types Telegram sends are filtered on its side, so the others
+            # aren't transferred and parsed just to be dropped
+            params["allowed_updates"] = json.dumps(allowed_updates)
+
         response = await self._get(
-            f"{BASE_URL}/getUpdates",
-            params={
-                "timeout": self.POLL_INTERVAL,
-                "offset": self.offset,
-            },
+            f"{self.base_url}/getUpdates",
+            params=params,
             timeout=self.POLL_INTERVAL + 5,
         )
 
@@ -134,8 +243,31 @@ class TelegramClient:
             last_update = updates[-1]
             self.last_update_id = last_update["update_id"]
 
+        UPDATES_PER_POLL.observe(len(updates))
+        self._adapt_poll_limit(len(updates))
         return cast(list, updates)
 
+    async def confirm_updates(self) -> None:
+        # Telegram only forgets updates once it's asked for the ones after them
+        if self.offset is None:
+            return None
+        response = await self._get(
+            f"{self.base_url}/getUpdates",
+            params={"offset": self.offset, "limit": 1, "timeout": 0},
+        )
+        if not response.ok:
+            logger.warning("Failed to confirm updates: %s", response)
+
+    def _adapt_poll_limit(self, fetched: int) -> None:
+        # a full batch means there's a backlog, so batches get bigger until it's
+        # cleared; when idle, small batches get the first updates of a burst to the
+        # handlers sooner
+        self._backlog = fetched >= self.poll_limit
+        if self._backlog:
+            self.poll_limit = min(self.poll_limit * 2, self.MAX_POLL_LIMIT)
+        elif fetched < self.poll_limit // 2:
+            self.poll_limit = max(self.poll_limit // 2, self.MIN_POLL_LIMIT)
+
     async def reply(self, message: Message, text: str, **kwargs: Any) -> None:
         logger.debug("Replying to chat %s: %r", message.chat.id, text)
 
@@ -152,6 +284,13 @@ class TelegramClient:
         text: str,
         parse_mode: str = "HTML",
         **extra_params: Any,
+    ) -> APIResponse:
+        if self.COALESCE_WINDOW:
+            return await self._post_coalesced(chat_id, text, parse_mode, extra_params)
+        return await self._send_message(chat_id, text, parse_mode, **extra_params)
+
+    async def _send_message(
+        self, chat_id: int, text: str, parse_mode: str, **extra_params: Any
     ) -> APIResponse:
         body = {
             "chat_id": chat_id,
@@ -160,7 +299,82 @@ class TelegramClient:
         }
         body.update(extra_params)
 
-        return await self._post(f"{BASE_URL}/sendMessage", body)
+        return await self._post(f"{self.base_url}/sendMessage", body)
+
+    async def _post_coalesced(
+        self, chat_id: int, text: str, parse_mode: str, extra_params: dict
+    ) -> APIResponse:
+        # replies, keyboards and other options can't be merged
+        mergeable = not extra_params and len(text) <= self.MESSAGE_LIMIT
+        if batch := self._batches.get(chat_id):
+            length = batch.length + len(self.COALESCE_SEPARATOR) + len(text)
+            if (
+                mergeable
+                and batch.parse_mode == parse_mode
+                and length <= self.MESSAGE_LIMIT
+            ):
+                batch.texts.append(text)
+                MESSAGES_COALESCED.inc()
+                return await asyncio.shield(batch.sent)
+
+            # the pending messages go first, so the chat sees them in order
+            await self._flush(chat_id, batch)
+            return await self._post_coalesced(chat_id, text, parse_mode, extra_params)
+
+        if not mergeable:
+            return await self._send_in_order(chat_id, text, parse_mode, extra_params)
+
+        sent = asyncio.get_running_loop().create_future()
+        batch = self._batches[chat_id] = _Batch(parse_mode, [text], sent)
+        # shielded, so the batch is still sent if this caller is cancelled
+        await asyncio.shield(self._flush(chat_id, batch, self.COALESCE_WINDOW))
+        return sent.result()
+
+    async def _flush(self, chat_id: int, batch: _Batch, delay: float = 0) -> None:
+        # callers sharing the batch get the same response, or the same exception
+        if delay:
+            await asyncio.sleep(delay)
+        if batch.flushing:
+            # sent early, to keep the chat's messages in order
+            await asyncio.wait([batch.sent])
+            return None
+
+        batch.flushing = True
+        if self._batches.get(chat_id) is batch:
+            del self._batches[chat_id]
+        text = self.COALESCE_SEPARATOR.join(batch.texts)
+        try:
+            response = await self._send_in_order(chat_id, text, batch.parse_mode, {})
+        except asyncio.CancelledError:
+            batch.sent.cancel()
+            raise
+        except Exception as exc:
+            batch.sent.set_exception(exc)
+        else:
+            batch.sent.set_result(response)
+
+    async def _send_in_order(
+        self, chat_id: int, text: str, parse_mode: str, extra_params: dict
+    ) -> APIResponse:
+        # a message is sent once the previous one to the chat is, so a batch whose
+        # window ended while a slow send was in flight doesn't overtake it
+        previous = self._sending.get(chat_id)
+        done = self._sending[chat_id] = asyncio.get_running_loop().create_future()
+        try:
+            if previous:
+                await asyncio.wait([previous])
+            return await self._send_message(chat_id, text, parse_mode, **extra_params)
+        finally:
+            done.set_result(None)
+            if self._sending.get(chat_id) is done:
+                del self._sending[chat_id]
+
+    async def flush(self) -> None:
+        # sends the coalesced messages without waiting for their window to end
+        await asyncio.gather(
+            *(self._flush(chat_id, batch) for chat_id, batch in self._batches.items()),
+            return_exceptions=True,
+        )
 
     async def delete_message(self, chat_id: int, message_id: int) -> APIResponse:
         body = {
@@ -168,7 +382,7 @@ class TelegramClient:
             "message_id": message_id,
         }
 
-        return await self._post(f"{BASE_URL}/deleteMessage", body)
+        return await self._post(f"{self.base_url}/deleteMessage", body)
 
     async def send_chat_action(self, chat_id: int, action: str) -> APIResponse:
         body = {
@@ -176,7 +390,7 @@ class TelegramClient:
             "action": action,
         }
 
-        return await self._post(f"{BASE_URL}/sendChatAction", body)
+        return await self._post(f"{self.base_url}/sendChatAction", body)
 
     async def edit_message_text(
         self,
@@ -192,7 +406,7 @@ class TelegramClient:
         }
         body.update(extra_params)
 
-        return await self._post(f"{BASE_URL}/editMessageText", body)
+        return await self._post(f"{self.base_url}/editMessageText", body)
 
     async def answer_callback_query(
         self,
@@ -204,7 +418,12 @@ class TelegramClient:
         }
         body.update(extra_params)
 
-        return await self._post(f"{BASE_URL}/answerCallbackQuery", body)
+        return await self._post(f"{self.base_url}/answerCallbackQuery", body)
+
+    async def get_me(self) -> APIResponse:
+        return await self._get(f"{self.base_url}/getMe", params={})
 
     async def set_my_commands(self, commands: list[dict[str, str]]) -> APIResponse:
-        return await self._post(f"{BASE_URL}/setMyCommands", {"commands": commands})
+        return await self._post(
+            f"{self.base_url}/setMyCommands", {"commands": commands}
+        )
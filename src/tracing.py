@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import inspect
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Iterator, TypeVar, cast
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("slow_updates")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "0") == "1"
+SLOW_TRACE_THRESHOLD = float(os.environ.get("SLOW_TRACE_THRESHOLD_SECONDS", 2.0))
+OTEL_EXPORT = os.environ.get("TRACING_OTEL_EXPORT", "0") == "1"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    started_at: float
+    parent: Span | None = field(default=None, repr=False)
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration: float | None = None
+    error: str | None = None
+    children: list[Span] = field(default_factory=list, repr=False)
+    open_spans: int = field(default=1, repr=False)
+
+    @property
+    def root(self) -> Span:
+        return self.parent.root if self.parent else self
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started_at
+
+        # a trace is reported once all of its spans are finished, which can be after
+        # the root span itself exits if it spawned tasks
+        root = self.root
+        root.open_spans -= 1
+        if root.open_spans == 0:
+            root.duration = time.perf_counter() - root.started_at
+            _report(root)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+            **({"error": self.error} if self.error else {}),
+            **self.attributes,
+            **(
+                {"children": [child.as_dict() for child in self.children]}
+                if self.children
+                else {}
+            ),
+        }
+
+
+class _NoopSpan:
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+def current_trace_id() -> str | None:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Span | _NoopSpan]:
+    # starts a new trace: every span opened in this context (and in tasks created
+    # from it) is attached to the root span and reported once it finishes
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+
+    root = Span(name, uuid.uuid4().hex, time.perf_counter(), attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        root.error = repr(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        root.finish()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | _NoopSpan]:
+    if (child := start_span(name, **attributes)) is None:
+        yield NOOP_SPAN
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = repr(exc)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+
+def start_span(name: str, **attributes: Any) -> Span | None:
+    # for spans that outlive the current block, e.g. a spawned task; the caller has
+    # to finish() the span
+    parent = _current_span.get() if TRACING_ENABLED else None
+    if parent is None:
+        return None
+
+    child = Span(
+        name, parent.trace_id, time.perf_counter(), parent, attributes=attributes
+    )
+    parent.children.append(child)
+    child.root.open_spans += 1
+    return child
+
+
+@contextmanager
+def use_span(span: Span | None) -> Iterator[None]:
+    if span is None:
+        yield
+        return
+
+    token = _current_span.set(span)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def traced(name: str | None = None) -> Callable[[F], F]:
+    def decorator(func: F) -> F:
+        span_name = name or func.__qualname__
+
+        if not inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not TRACING_ENABLED:
+                    return func(*args, **kwargs)
+                with span(span_name):
+                    return func(*args, **kwargs)
+
+            return cast(F, wrapper)
+
+        @wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not TRACING_ENABLED:
+                return await func(*args, **kwargs)
+            with span(span_name):
+                return await func(*args, **kwargs)
+
+        return cast(F, async_wrapper)
+
+    return decorator
+
+
+def _report(root: Span) -> None:
+    if root.duration is not None and root.duration >= SLOW_TRACE_THRESHOLD:
+        slow_logger.warning(
+            "Slow trace %s %s (%.0fms): %s",
+            root.trace_id,
+            root.name,
+            root.duration * 1000,
+            root.as_dict(),
+        )
+
+    if OTEL_EXPORT:
+        _export_otel(root)
+
+
+def _export_otel(root: Span) -> None:
+    try:
+        from opentelemetry import trace as otel_trace
+    except ImportError:
+        logger.warning("TRACING_OTEL_EXPORT is set but opentelemetry isn't installed")
+        return None
+
+    # spans are recorded with perf_counter, opentelemetry wants epoch nanoseconds
+    offset = time.time_ns() - int(time.perf_counter() * 1e9)
+    tracer = otel_trace.get_tracer("happy_bot")
+
+    def export(span: Span, context: Any = None) -> None:
+        start = offset + int(span.started_at * 1e9)
+        end = start + int((span.duration or 0) * 1e9)
+        otel_span = tracer.start_span(
+            span.name,
+            context=context,
+            start_time=start,
+            attributes={"trace_id": span.trace_id, **span.attributes},
+        )
+        if span.error:
+            otel_span.set_attribute("error", span.error)
+        child_context = otel_trace.set_span_in_context(otel_span)
+        for child in span.children:
+            export(child, child_context)
+        otel_span.end(end_time=end)
+
+    export(root)
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import json
 import logging
+import time
+from functools import lru_cache
+from logging.handlers import QueueHandler
 from typing import TYPE_CHECKING, Any, Mapping, Union
 
-from .privacy import redact_bot_token
+from .privacy import redact, redact_bot_token
 
 if TYPE_CHECKING:
     from logging import LogRecord
@@ -12,27 +16,105 @@ if TYPE_CHECKING:
 LoggingArgs = Union[Mapping[str, Any], tuple]
 
 
+@lru_cache(maxsize=1024)
+def shorten_module_name(name: str) -> str:
+    parts = name.split(".")
+    if len(parts) > 1:
+        parts_short = []
+        for part in parts[:-1]:
+            parts_short.append(part[:1])
+        return ".".join(parts_short + parts[-1:])
+    return name
+
+
 class CustomFormatter(logging.Formatter):
     def _redact_logging_args(self, args: LoggingArgs) -> LoggingArgs:
-        if not isinstance(args, dict):
-            clean_args: list[Any] = []
-            for arg in args:
-                if isinstance(arg, str):
-                    clean_args.append(redact_bot_token(arg))
-                else:
-                    clean_args.append(arg)
-            return tuple(clean_args)
-
-    def _shorten_module_name(self, name: str) -> str:
-        parts = name.split(".")
-        if len(parts) > 1:
-            parts_short = []
-            for part in parts[:-1]:
-                parts_short.append(part[:1])
-            return ".".join(parts_short + parts[-1:])
-        return name
+        if not isinstance(args, tuple):
+            return args
+
+        clean_args: list[Any] = []
+        for arg in args:
+            if isinstance(arg, dict):
+                clean_args.append(redact(arg))
+            else:
+                clean_args.append(arg)
+        return tuple(clean_args)
+
+    def format(self, record: LogRecord) -> str:
+        # redaction happens here rather than at the call site, so it's only paid for
+        # records that are actually emitted, and off the event loop with
+        # QueueListener
+        record.name = shorten_module_name(record.name)
+        if record.args:
+            record.args = self._redact_logging_args(record.args)
+        message = redact_bot_token(super().format(record))
+        if suppressed := getattr(record, "suppressed", 0):
+            message += f" ({suppressed} similar message(s) suppressed)"
+        return message
+
 
+class JsonFormatter(CustomFormatter):
     def format(self, record: LogRecord) -> str:
-        record.name = self._shorten_module_name(record.name)
-        # record.args = self._redact_logging_args(record.args)
-        return super().format(record)
+        record.name = shorten_module_name(record.name)
+        if record.args:
+            record.args = self._redact_logging_args(record.args)
+
+        data: dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact_bot_token(record.getMessage()),
+        }
+        if suppressed := getattr(record, "suppressed", 0):
+            data["suppressed"] = suppressed
+        if record.exc_info:
+            data["exc"] = redact_bot_token(self.formatException(record.exc_info))
+        return json.dumps(data, separators=(",", ":"), default=str)
+
+
+class NonFormattingQueueHandler(QueueHandler):
+    # the stock QueueHandler formats records before enqueueing them, which is the
+    # expensive part; the listener is in the same process, so records can be
+    # passed as they are and formatted in the listener thread. Arguments are
+    # formatted late, so they shouldn't be mutated after being logged.
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    # lets through at most `rate` records per second (with bursts of up to `burst`)
+    # for each call site at or below `level`; the next record that gets through
+    # carries the number of suppressed ones
+    MAX_CALL_SITES = 10_000
+
+    def __init__(
+        self, rate: float, burst: int = 10, level: int = logging.DEBUG
+    ) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.level = level
+        # (logger name, message template) -> (tokens, updated at, suppressed)
+        self._buckets: dict[tuple[str, Any], tuple[float, float, int]] = {}
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        tokens, updated_at, suppressed = self._buckets.get(
+            key, (float(self.burst), now, 0)
+        )
+        tokens = min(float(self.burst), tokens + (now - updated_at) * self.rate)
+        if len(self._buckets) >= self.MAX_CALL_SITES and key not in self._buckets:
+            # messages built with f-strings make a new call site per record
+            self._buckets.clear()
+        if tokens < 1:
+            self._buckets[key] = (tokens, now, suppressed + 1)
+            return False
+
+        self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
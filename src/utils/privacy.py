@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import re
-from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Any
 
 MASK = "*" * 3
 TOKEN_RE = re.compile(r"/bot([:0-9a-zA-Z_-]{46})/")
 
 
 def redact_bot_token(message: str) -> str:
+    if "/bot" not in message:
+        return message
     if match := TOKEN_RE.search(message):
         start, end = match.span(1)
         return message[:start] + MASK + message[end:]
@@ -25,27 +28,72 @@ REDACTED_FIELDS = [
 ]
 
 
-def _match_path(path: str, template: str) -> bool:
-    parts = template.split(".")
-    if parts[0] == "*" and len(parts) > 1:
-        ending = ".".join(parts[1:])
-        return path.endswith(ending)
-    else:
-        return path == template
+@dataclass
+class _Node:
+    # templates are stored reversed, starting from the last key of the path
+    children: dict[str, _Node] = field(default_factory=dict)
+    # the path matches if the key at this depth ends with one of these, which is
+    # how "*.from.id" also covers "forward_from.id"
+    suffixes: tuple[str, ...] = ()
+    # the path matches if it ends at this depth
+    terminal: bool = False
 
 
-def _redact_dict(data: dict, parent: str | None = None) -> None:
+def _compile(templates: list[str]) -> _Node:
+    root = _Node()
+    for template in templates:
+        parts = template.split(".")
+        wildcard = parts[0] == "*" and len(parts) > 1
+        if wildcard:
+            parts = parts[1:]
+
+        node = root
+        for part in reversed(parts[1:] if wildcard else parts):
+            node = node.children.setdefault(part, _Node())
+        if wildcard:
+            node.suffixes += (parts[0],)
+        else:
+            node.terminal = True
+    return root
+
+
+_TRIE = _compile(REDACTED_FIELDS)
+# keys that can end a redacted path, checked before walking the trie
+_LAST_KEYS = frozenset(_TRIE.children)
+
+
+def _is_redacted(key: str, parents: tuple[str, ...]) -> bool:
+    if key not in _LAST_KEYS and not key.endswith(_TRIE.suffixes):
+        return False
+
+    node = _TRIE
+    depth = len(parents)
+    while True:
+        if node.suffixes and key.endswith(node.suffixes):
+            return True
+        if not (child := node.children.get(key)):
+            return False
+        node = child
+        if depth == 0:
+            return node.terminal
+        depth -= 1
+        key = parents[depth]
+
+
+def _redact(data: dict, parents: tuple[str, ...]) -> dict:
+    changes: dict[str, Any] = {}
     for k, v in data.items():
-        path = (f"{parent}." if parent else "") + k
-        if isinstance(v, dict):
-            _redact_dict(v, path)
-        for template in REDACTED_FIELDS:
-            if _match_path(path, template):
-                data[k] = MASK
-                break
-
-
-def redacted_dict_copy(data: dict) -> dict:
-    dict_copy = deepcopy(data)
-    _redact_dict(dict_copy)
-    return dict_copy
+        if _is_redacted(k, parents):
+            if v != MASK:
+                changes[k] = MASK
+        elif isinstance(v, dict):
+            if (redacted := _redact(v, parents + (k,))) is not v:
+                changes[k] = redacted
+
+    return {**data, **changes} if changes else data
+
+
+def redact(data: dict) -> dict:
+    # copy-on-write: only the dicts on the way to redacted fields are copied, the
+    # rest is shared with `data`, so the result must not be modified in place
+    return _redact(data, ())
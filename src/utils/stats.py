@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Any
+
+
+class LatencyStats:
+    WINDOW_SIZE = 500
+
+    def __init__(self, window_size: int = WINDOW_SIZE) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: deque[float] = deque(maxlen=window_size)
+
+    def observe(self, latency: float, error: bool = False) -> None:
+        self.count += 1
+        self.errors += error
+        self.total += latency
+        self.max = max(self.max, latency)
+        self._recent.append(latency)
+
+    def percentile(self, q: float) -> float:
+        if not self._recent:
+            return 0.0
+        recent = sorted(self._recent)
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
@@ -1,22 +1,148 @@
 from __future__ import annotations
 
+import asyncio
 import os
+import random
+import time
 from logging import getLogger
 from typing import Any
 
 import httpx
 from httpx import Response
 
+from cache import ExpiringCache, SingleFlight
+from circuit_breaker import CircuitBreaker
+from deadline import check_deadline, get_deadline, remaining_timeout
+from exceptions import CircuitOpenError, WebappUnavailableError
+from limiter import report_overload
+from metrics import WEBAPP_LATENCY
+from tracing import span
+
 logger = getLogger(__name__)
 
 
 class WebappClient:
     BASE_URL = os.environ.get("WEBAPP_URL")
 
-    async def _post(self, url: str, data: dict, **request_params: Any) -> Response:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data, **request_params)
+    CONNECT_TIMEOUT = 3
+    READ_TIMEOUT = 10
+    MAX_CONNECTIONS = 20
+    MAX_KEEPALIVE_CONNECTIONS = 10
+
+    MAX_RETRIES = 2
+    RETRY_BACKOFF = 0.2
+    RETRY_BACKOFF_MAX = 2
+    RETRY_STATUSES = {502, 503, 504}
+
+    def __init__(self, link_cache: ExpiringCache | None = None) -> None:
+        self.link_cache = link_cache or ExpiringCache()
+        self._link_requests: SingleFlight[str] = SingleFlight()
+        self.breaker = CircuitBreaker("webapp")
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.READ_TIMEOUT, connect=self.CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=self.MAX_CONNECTIONS,
+                max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    def _prepare_params(self, request_params: dict) -> dict:
+        check_deadline("webapp")
+        params = {}
+        if get_deadline():
+            params["timeout"] = httpx.Timeout(
+                remaining_timeout(self.READ_TIMEOUT),
+                connect=remaining_timeout(self.CONNECT_TIMEOUT),
+            )
+        params.update(request_params)
+        return params
+
+    def _get_retry_delay(self, attempt: int) -> float:
+        # full jitter, so that retries from concurrent handlers don't arrive together
+        backoff = min(self.RETRY_BACKOFF_MAX, self.RETRY_BACKOFF * 2**attempt)
+        delay = random.uniform(0, backoff)
+        if (remaining := remaining_timeout(None)) is not None:
+            delay = min(delay, remaining)
+        return delay
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        idempotent: bool,
+        **request_params: Any,
+    ) -> Response:
+        attempts = self.MAX_RETRIES + 1 if idempotent else 1
+
+        for attempt in range(attempts):
+            params = self._prepare_params(dict(request_params))
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError as exc:
+                raise WebappUnavailableError("circuit open") from exc
+
+            started_at = time.monotonic()
+            try:
+                with span(
+                    "webapp", method=method, url=url, attempt=attempt
+                ) as request_span:
+                    response = await self._client.request(method, url, **params)
+                    request_span.set(status=response.status_code)
+            except httpx.TransportError as exc:
+                self.breaker.record_failure()
+                self._observe(method, started_at, "error")
+                logger.warning("%s %s failed: %r", method, url, exc)
+                if attempt + 1 == attempts:
+                    raise WebappUnavailableError(str(exc)) from exc
+            except Exception:
+                self.breaker.record_failure()
+                self._observe(method, started_at, "error")
+                raise
+            except BaseException:
+                # e.g. cancelled by a timeout
+                self.breaker.release_probe()
+                raise
+            else:
+                failed = response.status_code >= 500
+                self._observe(method, started_at, str(response.status_code))
+                if response.status_code in (429, 503):
+                    report_overload()
+
+                if not failed:
+                    self.breaker.record_success()
+                    return response
+
+                self.breaker.record_failure()
+                logger.warning("%s %s got %s", method, url, response.status_code)
+                if (
+                    attempt + 1 == attempts
+                    or response.status_code not in self.RETRY_STATUSES
+                ):
+                    raise WebappUnavailableError(f"status {response.status_code}")
 
+            await asyncio.sleep(self._get_retry_delay(attempt))
+
+        raise AssertionError("unreachable")
+
+    @staticmethod
+    def _observe(method: str, started_at: float, status: str) -> None:
+        WEBAPP_LATENCY.observe(
+            time.monotonic() - started_at, method=method, status=status
+        )
+
+    async def _post(
+        self,
+        url: str,
+        data: dict,
+        idempotent: bool = False,
+        **request_params: Any,
+    ) -> Response:
+        response = await self._request(
+            "POST", url, idempotent, json=data, **request_params
+        )
         logger.debug("POST response: %s", response)
         return response
 
@@ -26,16 +152,31 @@ class WebappClient:
         params: dict[str, Any],
         **request_params: Any,
     ) -> Response:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, **request_params)
-
-        return response
+        return await self._request("GET", url, True, params=params, **request_params)
 
     async def make_bot_token(self, token: str) -> dict:
+        # minting for the same token returns the same link, so it's safe to retry
         response = await self._post(
             f"{self.BASE_URL}/_int/users/bot_token/",
             {
                 "token": token,
             },
+            idempotent=True,
         )
         return response.json()
+
+    async def get_link_url(self, token: str, expires_at: float) -> str:
+        if url := await self.link_cache.get(token):
+            return url
+
+        return await self._link_requests.do(
+            token, lambda: self._mint_link_url(token, expires_at)
+        )
+
+    async def _mint_link_url(self, token: str, expires_at: float) -> str:
+        result = await self.make_bot_token(token)
+        logger.debug("Token created %s", result)
+
+        url = result["url"]
+        await self.link_cache.set(token, url, expires_at)
+        return url
@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+import zlib
+from asyncio import Task
+from dataclasses import asdict
+from functools import partial
+from multiprocessing.process import BaseProcess
+from queue import Empty, Full
+from typing import TYPE_CHECKING, Any, Sequence, Union
+
+from bot import Bot
+from event_handler import EventHandler
+from metrics import counter
+from pubsub import Event
+from shutdown import TASK_DRAIN_TIMEOUT
+
+if TYPE_CHECKING:
+    from multiprocessing.queues import Queue
+
+    from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+# number of worker processes, 0 runs everything in a single process
+WORKERS = int(os.environ.get("WORKERS", 0))
+# "local" passes work over multiprocessing queues, "redis" over Redis lists
+WORKER_TRANSPORT = os.environ.get("WORKER_TRANSPORT", "local")
+
+# workers are started fresh rather than forked, so they don't inherit the ingest
+# process's event loop, connections and threads
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+ROUTED = counter(
+    "bot_worker_routed_total", "Updates and events routed to workers", ["partition"]
+)
+ROUTING_BLOCKED = counter(
+    "bot_worker_routing_blocked_seconds_total",
+    "Time spent waiting for room in a worker's queue",
+    ["partition"],
+)
+
+
+def get_partition(key: int | str, partitions: int) -> int:
+    if isinstance(key, int):
+        return key % partitions
+    return zlib.crc32(key.encode("utf8")) % partitions
+
+
+def get_chat_id(update: dict) -> int | None:
+    if message := update.get("message"):
+        return message["chat"]["id"]
+    if callback_query := update.get("callback_query"):
+        if message := callback_query.get("message"):
+            return message["chat"]["id"]
+        # buttons of inline messages don't say which chat they're in, the user's
+        # callbacks are kept in order instead
+        return callback_query["from"]["id"]
+    return None
+
+
+def get_event_key(event: Event) -> str:
+    # events don't carry a chat id, the user they're about is the closest thing
+    payload = event.payload
+    return str(payload.get("user_id") or payload.get("token") or event.id)
+
+
+class LocalReceiver:
+    QUEUE_SIZE = 100
+
+    def __init__(self, queue: Queue, returned: Queue) -> None:
+        self.queue = queue
+        # the updates this worker couldn't finish go back to the ingest process
+        self.returned = returned
+        self._items: asyncio.Queue | None = None
+
+    async def receive(self) -> dict | None:
+        if self._items is None:
+            self._items = asyncio.Queue(self.QUEUE_SIZE)
+            threading.Thread(
+                target=self._read,
+                args=(asyncio.get_running_loop(), self._items),
+                name="worker-queue",
+                daemon=True,
+            ).start()
+        return await self._items.get()
+
+    def _read(self, loop: asyncio.AbstractEventLoop, items: asyncio.Queue) -> None:
+        # multiprocessing queues block, so they're read in a thread; waiting for
+        # room in `items` keeps the backpressure
+        while True:
+            item = self.queue.get()
+            asyncio.run_coroutine_threadsafe(items.put(item), loop).result()
+            if item is None:
+                return None
+
+    def close(self) -> None:
+        # the ingest process closes the queue once it has routed everything, the
+        # items left in it would be lost otherwise
+        pass
+
+    async def requeue(self, items: list[dict]) -> None:
+        # sent even when empty, so the ingest process knows this worker is done
+        if items:
+            logger.info("Sending back %d unfinished item(s)", len(items))
+        self.returned.put_nowait(items)
+
+
+class LocalTransport:
+    # a worker that falls behind holds up the routing to it, rather than the ingest
+    # process buffering its work without a limit
+    QUEUE_SIZE = 1000
+    PUT_TIMEOUT = 1
+
+    def __init__(self, partitions: int) -> None:
+        self.partitions = partitions
+        self.queues: list[Queue] = [
+            MP_CONTEXT.Queue(self.QUEUE_SIZE) for _ in range(partitions)
+        ]
+        self.returned: Queue = MP_CONTEXT.Queue()
+
+    async def send(self, partition: int, item: dict) -> None:
+        await self._put(partition, item)
+
+    async def _put(self, partition: int, item: dict | None) -> None:
+        queue = self.queues[partition]
+        try:
+            # pickling and writing happen in the queue's feeder thread
+            queue.put_nowait(item)
+            return None
+        except Full:
+            pass
+
+        started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(
+                    None, partial(queue.put, item, timeout=self.PUT_TIMEOUT)
+                )
+                break
+            except Full:
+                logger.warning("The queue of worker %d is full", partition)
+        ROUTING_BLOCKED.inc(time.monotonic() - started_at, partition=str(partition))
+
+    def receiver(self, partition: int) -> LocalReceiver:
+        return LocalReceiver(self.queues[partition], self.returned)
+
+    async def close(self) -> None:
+        for partition in range(self.partitions):
+            await self._put(partition, None)
+
+    async def take_back(self, timeout: float) -> list[dict]:
+        # the items the workers couldn't finish, once every one of them is done
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._take_back, timeout)
+
+    def _take_back(self, timeout: float) -> list[dict]:
+        deadline = time.monotonic() + timeout
+        items = []
+        for _ in range(self.partitions):
+            try:
+                items += self.returned.get(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except Empty:
+                logger.warning("Not every worker sent back its unfinished items")
+                break
+        return items
+
+
+class RedisReceiver:
+    # a closed receiver notices within this many seconds
+    POP_TIMEOUT = 1
+
+    def __init__(self, redis_url: str, key: str, stop_token: str | None = None) -> None:
+        self.redis_url = redis_url
+        self.key = key
+        # the transport that closes the list pushes this after the last item
+        self.stop_token = stop_token
+        self.closed = False
+        self._redis: Redis | None = None
+
+    async def receive(self) -> dict | None:
+        if self._redis is None:
+            import aioredis
+
+            self._redis = aioredis.from_url(self.redis_url)
+        while not self.closed:
+            if not (popped := await self._redis.blpop(self.key, self.POP_TIMEOUT)):
+                continue
+            item = json.loads(popped[1])
+            if "stop" not in item:
+                return item
+            if item["stop"] == self.stop_token:
+                return None
+            # left over from a transport that has been restarted since
+        return None
+
+    def close(self) -> None:
+        # the work left in the list is taken by the next worker
+        self.closed = True
+
+    async def requeue(self, items: list[dict]) -> None:
+        if items and self._redis is not None:
+            logger.info("Requeueing %d unfinished item(s)", len(items))
+            await self._redis.lpush(
+                self.key, *(json.dumps(item) for item in reversed(items))
+            )
+
+
+class RedisTransport:
+    # work survives restarts of the workers, and workers can run on other hosts
+    KEY = "bot_work:{}"
+
+    def __init__(self, redis: Redis, redis_url: str, partitions: int) -> None:
+        self.redis = redis
+        self.redis_url = redis_url
+        self.partitions = partitions
+        self.stop_token = uuid.uuid4().hex
+
+    async def send(self, partition: int, item: dict) -> None:
+        await self.redis.rpush(self.KEY.format(partition), json.dumps(item))
+
+    def receiver(self, partition: int) -> RedisReceiver:
+        return RedisReceiver(
+            self.redis_url, self.KEY.format(partition), stop_token=self.stop_token
+        )
+
+    async def close(self) -> None:
+        # like LocalTransport, the workers stop once they reach the end of the work
+        # sent so far; only this transport's workers stop on its token
+        for partition in range(self.partitions):
+            await self.send(partition, {"stop": self.stop_token})
+
+    async def take_back(self, timeout: float) -> list[dict]:
+        # the receivers requeue what they couldn't finish, the next workers take it
+        return []
+
+
+Transport = Union[LocalTransport, RedisTransport]
+Receiver = Union[LocalReceiver, RedisReceiver]
+
+
+class Router:
+    def __init__(self, transport: Transport) -> None:
+        self.transport = transport
+
+    async def route_update(self, update: dict) -> None:
+        if (key := get_chat_id(update)) is None:
+            key = update["update_id"]
+        await self._send(get_partition(key, self.transport.partitions), update=update)
+
+    async def route_event(self, event: Event) -> None:
+        partition = get_partition(get_event_key(event), self.transport.partitions)
+        await self._send(partition, event=asdict(event))
+
+    async def _send(self, partition: int, **item: Any) -> None:
+        ROUTED.inc(partition=str(partition))
+        await self.transport.send(partition, item)
+
+
+class IngestBot(Bot):
+    # polls for updates and hands them to the workers instead of processing them
+    def __init__(self, router: Router, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.router = router
+
+    async def dispatch_update(self, update: dict) -> None:
+        await self.router.route_update(update)
+
+    async def release_handover(self) -> None:
+        # the workers are still busy with the updates routed to them, the handover
+        # is released by take_back once they're done
+        pass
+
+    async def take_back(self, timeout: float) -> None:
+        # the updates the workers couldn't finish are handed over with this
+        # process's own
+        items = await self.router.transport.take_back(timeout)
+        self._unfinished.extend(item["update"] for item in items)
+        await super().release_handover()
+
+
+class RoutingEventHandler(EventHandler):
+    def __init__(self, router: Router, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.router = router
+
+    async def handle(self, event: Event) -> None:
+        await self.router.route_event(event)
+
+
+class Worker:
+    # runs the updates and events of its partition; updates from the same chat are
+    # handled one after another, different chats in parallel
+    MAX_PENDING = 1000
+    SHUTDOWN_TIMEOUT = TASK_DRAIN_TIMEOUT
+
+    def __init__(
+        self, bot: Bot, event_handler: EventHandler, receiver: Receiver
+    ) -> None:
+        self.bot = bot
+        self.event_handler = event_handler
+        self.receiver = receiver
+        self.tasks: set[Task] = set()
+        # chat id -> task of the last update received from the chat
+        self._last_tasks: dict[int, Task] = {}
+        self._pending: asyncio.Semaphore | None = None
+        # updates cut off by a shutdown
+        self._unfinished: list[dict] = []
+
+    def stop(self) -> None:
+        self.receiver.close()
+
+    async def run(self) -> None:
+        self._pending = asyncio.Semaphore(self.MAX_PENDING)
+        while (item := await self.receiver.receive()) is not None:
+            if "update" in item:
+                await self.submit_update(item["update"])
+            elif "event" in item:
+                await self.event_handler.handle(Event.from_dict(item["event"]))
+
+        logger.info("Work queue closed, waiting for %d update(s)", len(self.tasks))
+        if self.tasks:
+            _, pending = await asyncio.wait(
+                set(self.tasks), timeout=self.SHUTDOWN_TIMEOUT
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._unfinished.sort(key=lambda update: update["update_id"])
+        await self.receiver.requeue([{"update": update} for update in self._unfinished])
+
+    async def submit_update(self, update: dict) -> None:
+        assert self._pending
+        await self._pending.acquire()
+
+        chat_id = get_chat_id(update)
+        previous = self._last_tasks.get(chat_id) if chat_id is not None else None
+        task = asyncio.create_task(self._process_update(update, previous))
+        if chat_id is not None:
+            self._last_tasks[chat_id] = task
+        self.tasks.add(task)
+        task.add_done_callback(partial(self._on_done, chat_id, update))
+
+    async def _process_update(self, update: dict, previous: Task | None) -> None:
+        if previous:
+            await asyncio.wait([previous])
+        if task := await self.bot.process_update(update):
+            await task
+
+    def _on_done(self, chat_id: int | None, update: dict, task: Task) -> None:
+        assert self._pending
+        self._pending.release()
+        self.tasks.discard(task)
+        if chat_id is not None and self._last_tasks.get(chat_id) is task:
+            del self._last_tasks[chat_id]
+        if task.cancelled():
+            self._unfinished.append(update)
+        elif exc := task.exception():
+            logger.error("Failed to process an update", exc_info=exc)
+
+
+def stop_processes(processes: Sequence[BaseProcess], timeout: float) -> None:
+    # the processes stop at the same time, so they share the timeout: most of it to
+    # finish their work, the rest after being interrupted
+    _join_all(processes, timeout * 0.8)
+    for process in processes:
+        if process.is_alive() and process.pid:
+            # workers shut down on SIGINT, like the single process mode
+            os.kill(process.pid, signal.SIGINT)
+    _join_all(processes, timeout * 0.2)
+    for process in processes:
+        if process.is_alive():
+            logger.warning("Terminating %s", process.name)
+            process.terminate()
+
+
+def _join_all(processes: Sequence[BaseProcess], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from telegram_client import APIResponse
+
+# tests that need a real Redis run against this URL; its database is flushed
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL")
+
+
+@pytest.fixture
+def redis_url():
+    if not TEST_REDIS_URL:
+        pytest.skip("TEST_REDIS_URL is not set")
+    return TEST_REDIS_URL
+
+
+@pytest.fixture
+def connect_redis(redis_url):
+    # connections belong to the event loop they're made in, so every scenario
+    # connects in its own
+    async def connect():
+        import aioredis
+
+        redis = aioredis.from_url(redis_url)
+        await redis.flushdb()
+        return redis
+
+    return connect
+
+
+# tests that need a real Postgres run against this DSN; they recreate the tables
+# they use
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def database_url():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    return TEST_DATABASE_URL
+
+
+class FakeTelegramClient:
+    # records what the bot sends; getUpdates returns the queued updates at once,
+    # or waits like a long poll when there are none
+    def __init__(self):
+        self.replies = []
+        self.calls = []
+        self.sent = []
+        # message text -> status code of its sendMessage
+        self.statuses = {}
+        self.updates = []
+        # the offset of every poll
+        self.polled_from = []
+        self.last_update_id = None
+        self.confirmed = False
+
+    async def reply(self, message, text, **kwargs):
+        self.replies.append(text)
+
+    async def post_message(self, chat_id, text, parse_mode="HTML"):
+        self.sent.append(text)
+        status = self.statuses.get(text, 200)
+        return APIResponse({"ok": status == 200}, "", status)
+
+    async def answer_callback_query(self, callback_query_id, **kwargs):
+        self.calls.append(("answer", callback_query_id, kwargs.get("text")))
+
+    async def get_updates(self, allowed_updates=None):
+        self.polled_from.append(self.last_update_id)
+        if not self.updates:
+            await asyncio.sleep(60)
+        updates, self.updates = self.updates, []
+        self.last_update_id = updates[-1]["update_id"]
+        return updates
+
+    async def confirm_updates(self):
+        self.confirmed = True
+
+
+@pytest.fixture
+def telegram_client():
+    return FakeTelegramClient()
+
+
+@pytest.fixture
+def make_update():
+    now = int(time.time())
+
+    def make(update_id=1, chat_id=4, text="/help", age=0, data=None):
+        user = {"id": chat_id, "is_bot": False, "first_name": "User"}
+        chat = {"id": chat_id, "type": "private"}
+        if data is not None:
+            message = {"message_id": update_id, "chat": chat}
+            callback_query = {
+                "id": str(update_id),
+                "from": user,
+                "message": message,
+                "data": data,
+            }
+            return {"update_id": update_id, "callback_query": callback_query}
+        message = {
+            "message_id": update_id,
+            "from": user,
+            "chat": chat,
+            "date": int(now - age),
+            "text": text,
+            "entities": [{"offset": 0, "length": len(text), "type": "bot_command"}],
+        }
+        return {"update_id": update_id, "message": message}
+
+    return make
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    # stands in for the time functions of the module under test, see the clock
+    # fixtures in the tests that use it
+    return Clock()
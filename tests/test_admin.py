@@ -0,0 +1,89 @@
+import asyncio
+import io
+
+import asyncpg
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from admin import TABLES, export_table, get_import_columns, import_table
+
+
+class TestImportColumns:
+    def test_partial_columns(self):
+        columns = get_import_columns(TABLES["users"], b"id,webapp_id\r\n", "csv")
+
+        assert columns == ["id", "webapp_id"]
+
+    def test_jsonl_columns(self):
+        line = b'{"id": 1, "telegram_id": 2, "type": "private"}\n'
+
+        assert get_import_columns(TABLES["chats"], line, "jsonl") == [
+            "id",
+            "telegram_id",
+            "type",
+        ]
+
+    def test_rejects_unknown_columns(self):
+        with pytest.raises(ValueError):
+            get_import_columns(TABLES["users"], b"id,password\n", "csv")
+
+    def test_requires_key(self):
+        with pytest.raises(ValueError):
+            get_import_columns(TABLES["users"], b"telegram_id,webapp_id\n", "csv")
+
+
+def run(database_url, scenario):
+    async def connected():
+        conn = await asyncpg.connect(database_url)
+        try:
+            for table in reversed(list(TABLES.values())):
+                await conn.execute(f'DROP TABLE IF EXISTS "{table.name}" CASCADE')
+            for table in TABLES.values():
+                ddl = CreateTable(table).compile(dialect=postgresql.dialect())
+                await conn.execute(str(ddl))
+            await conn.execute(
+                'INSERT INTO "user" (telegram_id, webapp_id) VALUES (10, NULL), (20, 2)'
+            )
+            return await scenario(conn)
+        finally:
+            await conn.close()
+
+    return asyncio.run(connected())
+
+
+async def get_users(conn):
+    rows = await conn.fetch('SELECT id, telegram_id, webapp_id FROM "user" ORDER BY id')
+    return [tuple(row) for row in rows]
+
+
+@pytest.mark.parametrize("file_format", ["csv", "jsonl"])
+class TestImportExport:
+    def test_round_trip(self, database_url, file_format):
+        async def scenario(conn):
+            exported = io.BytesIO()
+            await export_table(conn, TABLES["users"], exported, file_format)
+            await conn.execute('TRUNCATE "user" RESTART IDENTITY CASCADE')
+
+            exported.seek(0)
+            await import_table(conn, TABLES["users"], exported, file_format)
+            imported = await get_users(conn)
+            # the sequence was moved past the imported ids
+            new_id = await conn.fetchval(
+                'INSERT INTO "user" (telegram_id) VALUES (30) RETURNING id'
+            )
+            return imported, new_id
+
+        assert run(database_url, scenario) == ([(1, 10, None), (2, 20, 2)], 3)
+
+    def test_partial_columns_update_existing_rows(self, database_url, file_format):
+        data = {
+            "csv": b"id,webapp_id\n1,100\n2,200\n",
+            "jsonl": b'{"id": 1, "webapp_id": 100}\n{"id": 2, "webapp_id": 200}\n',
+        }[file_format]
+
+        async def scenario(conn):
+            await import_table(conn, TABLES["users"], io.BytesIO(data), file_format)
+            return await get_users(conn)
+
+        assert run(database_url, scenario) == [(1, 10, 100), (2, 20, 200)]
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from cache import ExpiringCache, SingleFlight
+
+
+class TestExpiringCache:
+    def test_expires(self):
+        async def scenario():
+            cache = ExpiringCache()
+            await cache.set("a", "1", time.time() + 0.05)
+            await cache.set("b", "2", time.time() - 1)
+            fresh = await cache.get("a")
+            await asyncio.sleep(0.1)
+            return fresh, await cache.get("a"), await cache.get("b"), cache
+
+        fresh, expired, never_set, cache = asyncio.run(scenario())
+
+        assert (fresh, expired, never_set) == ("1", None, None)
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_evicts_least_recently_used(self):
+        async def scenario():
+            cache = ExpiringCache(max_size=2)
+            expires_at = time.time() + 60
+            await cache.set("a", "1", expires_at)
+            await cache.set("b", "2", expires_at)
+            await cache.get("a")
+            await cache.set("c", "3", expires_at)
+            return [await cache.get(key) for key in "abc"]
+
+        assert asyncio.run(scenario()) == ["1", None, "3"]
+
+
+class TestSingleFlight:
+    def test_coalesces_concurrent_calls(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        async def scenario():
+            flight = SingleFlight()
+            results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+            return results, flight
+
+        results, flight = asyncio.run(scenario())
+
+        assert results == ["value"] * 5
+        assert len(calls) == 1
+        assert flight.coalesced == 4
+
+    def test_shares_exceptions(self):
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise ValueError()
+
+        async def scenario():
+            flight = SingleFlight()
+            return await asyncio.gather(
+                flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+            )
+
+        assert [type(result) for result in asyncio.run(scenario())] == [ValueError] * 2
+
+    def test_waiters_survive_cancelled_caller(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        async def scenario():
+            flight = SingleFlight()
+            leader = asyncio.create_task(flight.do("key", fetch))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(flight.do("key", fetch)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            results = await asyncio.gather(*waiters)
+            with pytest.raises(asyncio.CancelledError):
+                await leader
+            return results
+
+        assert asyncio.run(scenario()) == ["value"] * 3
+        # the cancelled call and the one made again for the waiters
+        assert len(calls) == 2
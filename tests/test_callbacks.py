@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from bot import Bot
+from callback_handlers import CallbackHandler, decode_int, encode_callback_data
+from entities import CallbackQuery
+
+
+class VoteHandler(CallbackHandler):
+    prefix = "v"
+    ack_text = "Thanks!"
+
+    async def process(self, query):
+        self.telegram_client.calls.append(("vote", decode_int(query.args[0])))
+
+
+def process(telegram_client, update):
+    async def scenario():
+        bot = Bot(telegram_client, webapp_client=None, user_repository=None)
+        await bot.process_update(update)
+        await bot.task_manager.drain(1)
+        return telegram_client.calls
+
+    return asyncio.run(scenario())
+
+
+class TestCallbackData:
+    def test_round_trip(self, make_update):
+        data = encode_callback_data("v", 1234567890, "up")
+        query = CallbackQuery.from_json(make_update(data=data)["callback_query"])
+
+        assert data == "v:kf12oi:up"
+        assert query.prefix == "v"
+        assert decode_int(query.args[0]) == 1234567890
+        assert query.args[1] == "up"
+
+    def test_limits(self):
+        with pytest.raises(ValueError):
+            encode_callback_data("v", "x" * 63)
+        with pytest.raises(ValueError):
+            encode_callback_data("v", "a:b")
+
+
+class TestCallbackRouting:
+    def test_answers_before_processing(self, telegram_client, make_update):
+        update = make_update(42, data=encode_callback_data("v", 5))
+        calls = process(telegram_client, update)
+
+        assert calls == [("answer", "42", "Thanks!"), ("vote", 5)]
+
+    def test_unknown_prefix_is_answered(self, telegram_client, make_update):
+        calls = process(telegram_client, make_update(42, data="gone:1"))
+
+        assert calls == [("answer", "42", Bot.UNKNOWN_CALLBACK_REPLY)]
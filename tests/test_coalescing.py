@@ -0,0 +1,68 @@
+import asyncio
+
+from telegram_client import TelegramClient
+
+
+class RecordingTelegramClient(TelegramClient):
+    COALESCE_WINDOW = 0.05
+
+    def __init__(self):
+        super().__init__("token")
+        self.sent = []
+
+    async def _post(self, url, data, **request_params):
+        self.sent.append(
+            (data["chat_id"], data["text"], data.get("reply_to_message_id"))
+        )
+        return "response"
+
+
+def post_all(*messages):
+    async def scenario():
+        client = RecordingTelegramClient()
+        responses = await asyncio.gather(
+            *(client.post_message(*args, **kwargs) for args, kwargs in messages)
+        )
+        return client.sent, responses
+
+    return asyncio.run(scenario())
+
+
+class TestCoalescing:
+    def test_merges_messages_to_the_same_chat(self):
+        sent, responses = post_all(((1, "a"), {}), ((2, "b"), {}), ((1, "c"), {}))
+
+        assert sorted(sent) == [(1, "a\n\nc", None), (2, "b", None)]
+        assert responses == ["response"] * 3
+
+    def test_keeps_order_around_replies(self):
+        sent, _ = post_all(
+            ((1, "a"), {}), ((1, "b"), {"reply_to_message_id": 5}), ((1, "c"), {})
+        )
+
+        assert sent == [(1, "a", None), (1, "b", 5), (1, "c", None)]
+
+    def test_splits_at_message_limit(self):
+        sent, _ = post_all(((1, "a" * 4000), {}), ((1, "b" * 100), {}))
+
+        assert [len(text) for _, text, _ in sent] == [4000, 100]
+
+    def test_keeps_order_between_batches(self):
+        class SlowTelegramClient(RecordingTelegramClient):
+            async def _post(self, url, data, **request_params):
+                # the first batch is still in flight when the second one's window ends
+                await asyncio.sleep(0.2 if data["text"] == "a" else 0)
+                return await super()._post(url, data, **request_params)
+
+        async def scenario():
+            client = SlowTelegramClient()
+            first = asyncio.create_task(client.post_message(1, "a"))
+            await asyncio.sleep(client.COALESCE_WINDOW * 2)
+            second = asyncio.create_task(client.post_message(1, "b"))
+            third = asyncio.create_task(
+                client.post_message(1, "c", reply_to_message_id=5)
+            )
+            await asyncio.gather(first, second, third)
+            return client.sent
+
+        assert asyncio.run(scenario()) == [(1, "a", None), (1, "b", None), (1, "c", 5)]
@@ -0,0 +1,78 @@
+import asyncio
+
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    ForeignKey,
+    Integer,
+    MetaData,
+    Table,
+    UniqueConstraint,
+    text,
+)
+
+from db import Database, get_schema_version
+from models import Base
+
+
+def make_metadata(*chat_args, user_table="user", ondelete=None):
+    metadata = MetaData()
+    Table(user_table, metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "chat",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey(f"{user_table}.id", ondelete=ondelete)),
+        *chat_args,
+    )
+    return metadata
+
+
+class TestSchemaVersion:
+    def test_unchanged_models(self):
+        assert get_schema_version(make_metadata()) == get_schema_version(
+            make_metadata()
+        )
+
+    def test_changed_constraints(self):
+        versions = [
+            get_schema_version(metadata)
+            for metadata in [
+                make_metadata(),
+                make_metadata(UniqueConstraint("user_id")),
+                make_metadata(CheckConstraint("user_id > 0")),
+                make_metadata(CheckConstraint("user_id > 1")),
+                make_metadata(ondelete="CASCADE"),
+                make_metadata(user_table="account"),
+            ]
+        ]
+
+        assert len(set(versions)) == len(versions)
+
+
+def test_create_database_skips_an_unchanged_schema(database_url, monkeypatch):
+    created = []
+    create_all = Base.metadata.create_all
+
+    def spy(*args, **kwargs):
+        created.append(True)
+        return create_all(*args, **kwargs)
+
+    monkeypatch.setattr(Base.metadata, "create_all", spy)
+
+    async def scenario():
+        db = Database(database_url.replace("postgresql://", "postgresql+asyncpg://"))
+        try:
+            async with db._engine.begin() as conn:
+                await conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+            ran = [await db.create_database(), await db.create_database()]
+            # the models changed since the schema was created
+            async with db._engine.begin() as conn:
+                await conn.execute(text("UPDATE schema_version SET version = 'old'"))
+            ran.append(await db.create_database())
+            return ran
+        finally:
+            await db._engine.dispose()
+
+    assert asyncio.run(scenario()) == [True, False, True]
+    assert len(created) == 2
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import pytest
+
+from bot import Bot
+from command_handlers import HelpHandler
+from deadline import (
+    Deadline,
+    bounded,
+    check_deadline,
+    get_deadline,
+    remaining_timeout,
+    set_deadline,
+    shed_counter,
+)
+from event_handler import EventHandler
+from exceptions import DeadlineExceeded
+from pubsub import Event
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    set_deadline(None)
+    yield
+    set_deadline(None)
+
+
+class TestDeadline:
+    def test_from_timestamp(self):
+        assert Deadline.from_timestamp(time.time() - 31, 30).expired
+        assert not Deadline.from_timestamp(time.time() - 29, 30).expired
+
+    def test_remaining_timeout_without_deadline(self):
+        assert remaining_timeout(5) == 5
+        assert remaining_timeout(None) is None
+
+    def test_remaining_timeout_is_clamped(self):
+        set_deadline(Deadline.after(2))
+
+        assert remaining_timeout(10) <= 2
+        assert remaining_timeout(1) == 1
+        assert 1 < remaining_timeout(None) <= 2
+
+    def test_remaining_timeout_of_expired_deadline(self):
+        set_deadline(Deadline.after(-5))
+
+        assert remaining_timeout(10) == 0
+
+    def test_check_deadline(self):
+        check_deadline("test")
+        set_deadline(Deadline.after(-1))
+        shed = shed_counter["test"]
+
+        with pytest.raises(DeadlineExceeded):
+            check_deadline("test")
+        assert shed_counter["test"] == shed + 1
+
+    def test_bounded_times_out(self):
+        @bounded("test")
+        async def slow():
+            await asyncio.sleep(5)
+
+        async def scenario():
+            set_deadline(Deadline.after(0.05))
+            await slow()
+
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(scenario())
+
+
+def process(telegram_client, update):
+    async def scenario():
+        bot = Bot(
+            telegram_client=telegram_client,
+            webapp_client=None,
+            user_repository=None,
+        )
+        if task := await bot.process_update(update):
+            await task
+        return bot.telegram_client.replies
+
+    return asyncio.run(scenario())
+
+
+class TestStaleCommands:
+    def test_downgrades_stale_command(self, telegram_client, make_update):
+        update = make_update(age=Bot.UPDATE_BUDGET + 60)
+        replies = process(telegram_client, update)
+
+        assert replies == [Bot.STALE_REPLY.format("/help")]
+
+    def test_drops_old_command(self, telegram_client, make_update):
+        update = make_update(age=Bot.STALE_REPLY_MAX_AGE + 60)
+        replies = process(telegram_client, update)
+
+        assert replies == []
+
+    def test_drops_stale_unknown_command(self, telegram_client, make_update):
+        update = make_update(text="/nosuchcommand", age=Bot.UPDATE_BUDGET + 60)
+        replies = process(telegram_client, update)
+
+        assert replies == []
+
+    def test_processes_fresh_command(self, telegram_client, make_update):
+        replies = process(telegram_client, make_update())
+
+        assert replies == [HelpHandler.HELP]
+
+
+class DeadlineEventHandler(EventHandler):
+    def __init__(self):
+        super().__init__(telegram_client=None, user_repository=None)
+        self.deadlines = []
+
+    async def process_user_event(self, event):
+        self.deadlines.append(get_deadline())
+
+
+def test_event_deadline_stays_in_its_task():
+    async def scenario():
+        event_handler = DeadlineEventHandler()
+        published_at = time.time()
+        await event_handler.handle(Event("user_event", {"user_id": 1}, published_at))
+        # the consumer's context, where the next event is handled
+        deadline = get_deadline()
+        await event_handler.task_manager.drain()
+        return event_handler.deadlines, deadline, published_at
+
+    deadlines, deadline, published_at = asyncio.run(scenario())
+
+    assert deadlines == [
+        Deadline.from_timestamp(published_at, EventHandler.EVENT_BUDGET)
+    ]
+    assert deadline is None
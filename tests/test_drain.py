@@ -0,0 +1,84 @@
+import asyncio
+
+from bot import Bot
+
+
+class FakeHandover:
+    def __init__(self, last_update_id=None, updates=()):
+        self.last_update_id = last_update_id
+        self.updates = list(updates)
+        self.names = set()
+        self.released = None
+
+    def holds(self, name):
+        return name in self.names
+
+    async def acquire(self, name):
+        self.names.add(name)
+        return self.last_update_id
+
+    async def take_updates(self, name):
+        updates, self.updates = self.updates, []
+        return updates
+
+    async def release(self, name, last_update_id, updates):
+        self.names.discard(name)
+        self.released = (last_update_id, updates)
+
+
+class SlowBot(Bot):
+    SHUTDOWN_TIMEOUT = 0.1
+
+    def __init__(self, **kwargs):
+        super().__init__(webapp_client=None, user_repository=None, **kwargs)
+        self.processed = []
+
+    async def process_update(self, update):
+        # even update ids are fast, odd ones don't finish before the shutdown
+        delay = 0 if update["update_id"] % 2 == 0 else 60
+
+        async def handle():
+            await asyncio.sleep(delay)
+            self.processed.append(update["update_id"])
+
+        return await self.task_manager.run_task(handle())
+
+
+def updates(*update_ids):
+    return [{"update_id": update_id} for update_id in update_ids]
+
+
+class TestDrain:
+    def test_hands_over_unfinished_updates(self, telegram_client):
+        async def scenario():
+            handover = FakeHandover()
+            telegram_client.updates = updates(4, 5, 6, 7)
+            bot = SlowBot(telegram_client=telegram_client, handover=handover)
+            polling = asyncio.create_task(bot.start())
+            await asyncio.sleep(0.05)
+            bot.stop_polling()
+            await asyncio.wait_for(polling, 5)
+            return bot, handover
+
+        bot, handover = asyncio.run(scenario())
+
+        assert bot.processed == [4, 6]
+        assert bot.telegram_client.confirmed
+        assert handover.released == (7, updates(5, 7))
+        assert not handover.names
+
+    def test_resumes_from_handover(self, telegram_client):
+        async def scenario():
+            handover = FakeHandover(last_update_id=7, updates=updates(6))
+            bot = SlowBot(telegram_client=telegram_client, handover=handover)
+            polling = asyncio.create_task(bot.start())
+            await asyncio.sleep(0.05)
+            bot.stop_polling()
+            await asyncio.wait_for(polling, 5)
+            return bot, handover
+
+        bot, handover = asyncio.run(scenario())
+
+        assert bot.telegram_client.last_update_id == 7
+        assert bot.processed == [6]
+        assert handover.released == (7, [])
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from handover import PollingHandover
+
+
+def run(connect_redis, scenario):
+    async def connected():
+        redis = await connect_redis()
+        try:
+            return await scenario(redis)
+        finally:
+            await redis.close()
+
+    return asyncio.run(connected())
+
+
+class TestPollingHandover:
+    def test_first_instance_starts_from_scratch(self, connect_redis):
+        async def scenario(redis):
+            handover = PollingHandover(redis)
+            return await handover.acquire("bot"), handover.holds("bot")
+
+        assert run(connect_redis, scenario) == (None, True)
+
+    def test_waits_for_the_previous_instance(self, connect_redis):
+        async def scenario(redis):
+            old, new = PollingHandover(redis), PollingHandover(redis)
+            await old.acquire("bot")
+            # the same instance can acquire again, e.g. after a retry
+            assert await old.acquire("bot") is None
+
+            acquiring = asyncio.create_task(new.acquire("bot"))
+            await asyncio.sleep(PollingHandover.RETRY_INTERVAL * 2)
+            assert not acquiring.done()
+
+            updates = [{"update_id": 6}, {"update_id": 7}]
+            await old.release("bot", 7, updates)
+            last_update_id = await asyncio.wait_for(acquiring, 5)
+            return last_update_id, await new.take_updates("bot"), old.holds("bot")
+
+        assert run(connect_redis, scenario) == (
+            7,
+            [{"update_id": 6}, {"update_id": 7}],
+            False,
+        )
+
+    def test_takes_over_after_a_release_without_updates(self, connect_redis):
+        async def scenario(redis):
+            old, new = PollingHandover(redis), PollingHandover(redis)
+            await old.acquire("bot")
+            await old.release("bot", None, [])
+            return await new.acquire("bot"), await new.take_updates("bot")
+
+        assert run(connect_redis, scenario) == (None, [])
+
+    def test_takes_over_from_a_crashed_instance(self, connect_redis):
+        async def scenario(redis):
+            crashed = PollingHandover(redis, ttl=0.2)
+            await crashed.acquire("bot")
+            new = PollingHandover(redis)
+            return await asyncio.wait_for(new.acquire("bot"), 5)
+
+        assert run(connect_redis, scenario) is None
+
+    @pytest.mark.parametrize("taken_over", [False, True])
+    def test_renews_only_its_own_key(self, connect_redis, taken_over):
+        async def scenario(redis):
+            handover = PollingHandover(redis, ttl=0.3)
+            await handover.acquire("bot")
+            if taken_over:
+                await redis.set(PollingHandover.KEY.format("bot"), "another")
+            renewing = asyncio.create_task(handover.run())
+            # longer than the TTL, the key would have expired without renewals
+            await asyncio.sleep(0.5)
+            renewing.cancel()
+            value = await redis.get(PollingHandover.KEY.format("bot"))
+            return handover.holds("bot"), value, handover.owner.encode()
+
+        holds, value, owner = run(connect_redis, scenario)
+
+        assert holds is not taken_over
+        assert value == (b"another" if taken_over else owner)
+
+    def test_release_keeps_another_owners_key(self, connect_redis):
+        async def scenario(redis):
+            handover = PollingHandover(redis)
+            await handover.acquire("bot")
+            await redis.set(PollingHandover.KEY.format("bot"), "another")
+            await handover.release("bot", 7, [])
+            return await redis.get(PollingHandover.KEY.format("bot"))
+
+        assert run(connect_redis, scenario) == b"another"
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+
+from heartbeat import REPLICA_KEY, REPLICAS_KEY, Heartbeat, get_cluster_status
+from pubsub import RedisPubSub
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    def hgetall(self, key):
+        self.calls.append(self.redis.hashes.get(key, {}))
+
+    def llen(self, key):
+        self.calls.append(len(self.redis.lists.get(key, [])))
+
+    async def execute(self):
+        return self.calls
+
+
+class FakeRedis:
+    def __init__(self):
+        self.replicas = {}
+        self.hashes = {}
+        self.lists = {}
+
+    def add_replica(self, replica_id, seen_at, **fields):
+        self.replicas[replica_id.encode()] = seen_at
+        if fields:
+            self.hashes[REPLICA_KEY.format(replica_id)] = {
+                key.encode(): str(value).encode() for key, value in fields.items()
+            }
+
+    async def zremrangebyscore(self, key, min_, max_):
+        assert key == REPLICAS_KEY
+        self.replicas = {k: v for k, v in self.replicas.items() if v > max_}
+
+    async def zrange(self, key, start, end):
+        return sorted(self.replicas, key=self.replicas.get)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def heartbeat(role, running, waiting, limit, event_lag):
+    return dict(
+        role=role,
+        version="0.1.0",
+        running=running,
+        waiting=waiting,
+        limit=limit,
+        event_lag=event_lag,
+    )
+
+
+class TestClusterStatus:
+    def test_aggregates_live_replicas(self):
+        redis = FakeRedis()
+        now = time.time()
+        redis.add_replica("a:1", now, **heartbeat("ingest", 3, 0, 10, 0.2))
+        redis.add_replica("b:1", now, **heartbeat("worker", 7, 4, 10, 1.5))
+        # stopped sending heartbeats
+        redis.add_replica("c:1", now - 60, **heartbeat("worker", 10, 10, 10, 9))
+        # its hash has expired, but it's not pruned yet
+        redis.add_replica("d:1", now)
+        redis.lists["bot_work:shared"] = [b"update"] * 5
+
+        status = asyncio.run(get_cluster_status(redis, ttl=15))
+
+        assert [replica["id"] for replica in status["replicas"]] == ["a:1", "b:1"]
+        assert status["replicas"][1]["role"] == "worker"
+        assert status["total"] == {
+            "replicas": 2,
+            "running": 10,
+            "waiting": 4,
+            "limit": 20,
+            "utilization": 0.5,
+            "event_lag_max": 1.5,
+            "queues": {"events": 0, "updates": 5},
+        }
+
+
+class FakeServer:
+    def add_route(self, path, handler):
+        pass
+
+
+class UnavailableRedis:
+    async def delete(self, key):
+        raise ConnectionError("Redis is down")
+
+
+class TestHeartbeat:
+    def test_remove_survives_redis_errors(self):
+        heartbeat = Heartbeat(UnavailableRedis(), FakeServer(), None, None, "worker")
+
+        asyncio.run(heartbeat.remove())
+
+
+class QueueRedis:
+    # blpop pops the given items, None stands for a timeout
+    def __init__(self, pubsub, items):
+        self.pubsub = pubsub
+        self.items = list(items)
+
+    async def blpop(self, key, timeout):
+        item = self.items.pop(0)
+        if not self.items:
+            self.pubsub.stop()
+        return item
+
+
+class FakeEventHandler:
+    async def handle(self, event):
+        pass
+
+
+class TestEventLag:
+    def test_resets_once_the_queue_is_empty(self):
+        data = json.dumps(
+            {
+                "id": "1",
+                "type": "user_event",
+                "timestamp": time.time() - 30,
+                "payload": {},
+            }
+        ).encode()
+        pubsub = RedisPubSub(FakeEventHandler(), None)
+        lags = []
+
+        async def record_lag(event):
+            lags.append(pubsub.last_event_lag)
+
+        pubsub.event_handler.handle = record_lag
+        pubsub.redis = QueueRedis(pubsub, [(b"bot_messages", data), None])
+        asyncio.run(pubsub.run())
+
+        assert lags[0] >= 30
+        assert pubsub.last_event_lag == 0
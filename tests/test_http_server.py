@@ -0,0 +1,91 @@
+import asyncio
+
+from http_server import HttpServer, Response
+
+
+async def echo(request):
+    return Response.json(
+        {
+            "method": request.method,
+            "path": request.path,
+            "query": request.query,
+            "body": request.json(),
+        }
+    )
+
+
+async def fail(request):
+    raise RuntimeError("boom")
+
+
+def exchange(*requests):
+    # sends raw requests over one connection, returns everything the server sent
+    async def scenario():
+        server = HttpServer("127.0.0.1", 0)
+        server.add_route("/echo", echo)
+        server.add_route("/fail", fail)
+        server.add_route("/debug/*", echo)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            for request in requests:
+                writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+        finally:
+            await server.stop()
+
+    return asyncio.run(scenario())
+
+
+def get(path, headers=b""):
+    return b"GET %s HTTP/1.1\r\nHost: x\r\nConnection: close\r\n%s\r\n" % (
+        path,
+        headers,
+    )
+
+
+class TestHttpServer:
+    def test_parses_requests(self):
+        body = b'{"name": "bot"}'
+        response = exchange(
+            b"POST /echo?a=1&b=2 HTTP/1.1\r\nContent-Length: %d\r\n"
+            b"Connection: close\r\n\r\n%s" % (len(body), body)
+        )
+
+        head, _, payload = response.partition(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+        assert b"Content-Type: application/json" in head
+        assert payload == (
+            b'{"method": "POST", "path": "/echo", "query": {"a": "1", "b": "2"}, '
+            b'"body": {"name": "bot"}}'
+        )
+
+    def test_keeps_the_connection_alive(self):
+        response = exchange(
+            b"GET /echo HTTP/1.1\r\n\r\n", get(b"/debug/profile?seconds=1")
+        )
+
+        assert response.count(b"HTTP/1.1 200 OK") == 2
+        assert b'"path": "/debug/profile"' in response
+
+    def test_unknown_path(self):
+        assert exchange(get(b"/missing")).startswith(b"HTTP/1.1 404 Not Found")
+
+    def test_handler_error(self):
+        response = exchange(get(b"/fail"))
+
+        assert response.startswith(b"HTTP/1.1 500 Internal Server Error")
+
+    def test_bad_requests(self, monkeypatch):
+        monkeypatch.setattr(HttpServer, "MAX_BODY_SIZE", 10)
+        bad_requests = [
+            b"GARBAGE\r\n\r\n",
+            get(b"/echo", b"Content-Length: ten\r\n"),
+            get(b"/echo", b"Content-Length: 11\r\n"),
+        ]
+        for request in bad_requests:
+            response = exchange(request)
+            assert response.startswith(b"HTTP/1.1 400 Bad Request"), request
@@ -0,0 +1,58 @@
+import asyncio
+
+from leader import ClusterBot
+
+
+class FakeLease:
+    def __init__(self):
+        self.is_leader = True
+
+
+class FakeQueue:
+    def __init__(self, fenced_after):
+        self.published = []
+        self.fenced_after = fenced_after
+
+    async def publish(self, update):
+        if len(self.published) == self.fenced_after:
+            return False
+        self.published.append(update["update_id"])
+        return True
+
+    async def get_last_update_id(self):
+        return 10
+
+
+def make_bot(telegram_client, lease, queue):
+    telegram_client.updates = [{"update_id": update_id} for update_id in range(11, 21)]
+    return ClusterBot(
+        lease=lease,
+        queue=queue,
+        telegram_client=telegram_client,
+        webapp_client=None,
+        user_repository=None,
+    )
+
+
+class TestClusterBot:
+    def test_resumes_from_stored_offset(self, telegram_client):
+        bot = make_bot(telegram_client, FakeLease(), FakeQueue(fenced_after=3))
+        asyncio.run(asyncio.wait_for(bot.lead(), 5))
+
+        assert telegram_client.polled_from == [10]
+        assert bot.queue.published == [11, 12, 13]
+
+    def test_stops_polling_when_lease_is_lost(self, telegram_client):
+        async def scenario():
+            lease = FakeLease()
+            bot = make_bot(telegram_client, lease, FakeQueue(fenced_after=1000))
+            leading = asyncio.create_task(bot.lead())
+            # the first batch is published, the next long poll stays open
+            await asyncio.sleep(0.1)
+            lease.is_leader = False
+            await asyncio.wait_for(leading, 5)
+            telegram_client.updates = [{"update_id": 21}]
+            await asyncio.sleep(0.1)
+            return bot.queue.published
+
+        assert asyncio.run(scenario()) == list(range(11, 21))
@@ -0,0 +1,54 @@
+import asyncio
+
+from limiter import AIMDLimiter, Limiter, Outcome
+
+
+class TestLimiter:
+    def test_waits_for_free_slot(self):
+        async def scenario():
+            limiter = Limiter(1)
+            await limiter.acquire()
+
+            waiter = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            assert not waiter.done()
+
+            limiter.release(Outcome())
+            await asyncio.wait_for(waiter, 1)
+            return limiter
+
+        limiter = asyncio.run(scenario())
+        assert limiter.in_flight == 1
+
+
+class TestAIMDLimiter:
+    def test_backs_off_on_overload(self):
+        limiter = AIMDLimiter(10, min_limit=2, max_limit=20)
+        for _ in range(30):
+            limiter.in_flight += 1
+            limiter.release(Outcome(overloaded=True))
+
+        assert limiter.limit == 2
+
+    def test_backs_off_on_slow_responses(self):
+        limiter = AIMDLimiter(10, latency_threshold=1)
+        limiter.in_flight += 1
+        limiter.release(Outcome(latency=5))
+
+        assert limiter.limit == 9
+
+    def test_grows_when_saturated(self):
+        limiter = AIMDLimiter(4, max_limit=6)
+        for _ in range(100):
+            limiter.in_flight = limiter.limit
+            limiter.release(Outcome(latency=0.01))
+
+        assert limiter.limit == 6
+
+    def test_does_not_grow_when_idle(self):
+        limiter = AIMDLimiter(4)
+        for _ in range(100):
+            limiter.in_flight = 1
+            limiter.release(Outcome(latency=0.01))
+
+        assert limiter.limit == 4
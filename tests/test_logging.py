@@ -0,0 +1,48 @@
+import json
+import logging
+
+from utils.logging import CustomFormatter, JsonFormatter, RateLimitFilter
+from utils.privacy import MASK
+
+TOKEN = "1234567890:" + "a" * 35
+
+
+def make_record(msg, *args, level=logging.DEBUG):
+    return logging.LogRecord("happy_bot.bot", level, __file__, 1, msg, args, None)
+
+
+class TestFormatters:
+    def test_redacts_when_formatting(self):
+        update = {"message": {"text": "secret", "chat": {"id": 1}}}
+        record = make_record("%s %s", f"/bot{TOKEN}/getMe", update)
+
+        message = CustomFormatter("%(name)s %(message)s").format(record)
+
+        assert message == (
+            f"h.bot /bot{MASK}/getMe {{'message': {{'text': '{MASK}', 'chat': {{'id': 1}}}}}}"
+        )
+        assert update["message"]["text"] == "secret"
+
+    def test_json(self):
+        data = json.loads(JsonFormatter().format(make_record("Got %d", 5)))
+
+        assert data["level"] == "DEBUG"
+        assert data["logger"] == "h.bot"
+        assert data["msg"] == "Got 5"
+
+
+class TestRateLimitFilter:
+    def test_counts_suppressed_records(self):
+        rate_limit = RateLimitFilter(rate=0.001, burst=2)
+        passed = [rate_limit.filter(make_record("Update %s", i)) for i in range(5)]
+        assert passed == [True, True, False, False, False]
+
+        rate_limit._buckets = {
+            key: (1, updated_at, suppressed)
+            for key, (_, updated_at, suppressed) in rate_limit._buckets.items()
+        }
+        record = make_record("Update %s", 5)
+        assert rate_limit.filter(record)
+        assert record.suppressed == 3
+
+        assert rate_limit.filter(make_record("Failed", level=logging.ERROR))
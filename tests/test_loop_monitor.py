@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import sys
+import time
+from types import SimpleNamespace
+
+from loop_monitor import LoopMonitor, install_uvloop
+
+
+def block_loop(seconds):
+    time.sleep(seconds)
+
+
+def monitor_while(monitor, scenario):
+    async def monitored():
+        running = asyncio.create_task(monitor.run())
+        try:
+            await scenario()
+        finally:
+            running.cancel()
+            await asyncio.gather(running, return_exceptions=True)
+
+    asyncio.run(monitored())
+
+
+class TestLoopMonitor:
+    def test_measures_lag(self):
+        monitor = LoopMonitor(interval=0.05, block_threshold=10)
+
+        async def scenario():
+            await asyncio.sleep(0.15)
+            assert monitor.max_lag < 0.1
+            block_loop(0.3)
+            await asyncio.sleep(0.1)
+
+        monitor_while(monitor, scenario)
+
+        assert monitor.max_lag > 0.2
+        # the loop has caught up since
+        assert monitor.lag < 0.1
+
+    def test_watchdog_reports_a_blocked_loop(self, caplog):
+        monitor = LoopMonitor(interval=0.02, block_threshold=0.1)
+
+        async def scenario():
+            await asyncio.sleep(0.05)
+            block_loop(0.4)
+            await asyncio.sleep(0.05)
+
+        with caplog.at_level(logging.WARNING, logger="loop_monitor"):
+            monitor_while(monitor, scenario)
+
+        # once per stall, however long it lasts
+        assert monitor.blocked_count == 1
+        assert "Event loop blocked" in caplog.text
+        # the stack sample shows what blocked the loop
+        assert "block_loop" in caplog.text
+
+        monitor._watchdog.join(1)
+        assert not monitor._watchdog.is_alive()
+
+
+class TestInstallUvloop:
+    def test_falls_back_without_uvloop(self, monkeypatch):
+        # a None entry makes the import fail
+        monkeypatch.setitem(sys.modules, "uvloop", None)
+
+        assert install_uvloop() is False
+
+    def test_installs_uvloop(self, monkeypatch):
+        installed = []
+        uvloop = SimpleNamespace(install=lambda: installed.append(True))
+        monkeypatch.setitem(sys.modules, "uvloop", uvloop)
+
+        assert install_uvloop() is True
+        assert installed == [True]
@@ -0,0 +1,61 @@
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+class TestExposition:
+    def test_counter(self):
+        updates = Counter("updates_total", "Updates", ["type"])
+        updates.inc(type="message")
+        updates.inc(2, type="message")
+        updates.inc(0.5, type="callback_query")
+
+        assert updates.render() == [
+            "# HELP updates_total Updates",
+            "# TYPE updates_total counter",
+            'updates_total{type="message"} 3',
+            'updates_total{type="callback_query"} 0.5',
+        ]
+
+    def test_gauge_without_labels(self):
+        lag = Gauge("lag_seconds", "Lag")
+        lag.set(2)
+        lag.set(0.25)
+
+        assert lag.render()[2:] == ["lag_seconds 0.25"]
+
+    def test_label_values_are_escaped(self):
+        errors = Counter("errors_total", "Errors", ["message"])
+        errors.inc(message='a "quoted"\\path\nnext')
+
+        assert errors.render()[2] == (
+            r'errors_total{message="a \"quoted\"\\path\nnext"} 1'
+        )
+
+    def test_labels_must_match(self):
+        errors = Counter("errors_total", "Errors", ["status"])
+        with pytest.raises(ValueError):
+            errors.inc(code=500)
+
+    def test_histogram(self):
+        latency = Histogram("latency_seconds", "Latency", ["method"], [0.1, 1])
+        for value in (0.05, 0.1, 0.5, 2):
+            latency.observe(value, method="get")
+
+        # buckets count the observations up to and including their bound
+        assert latency.render()[2:] == [
+            'latency_seconds_bucket{method="get",le="0.1"} 2',
+            'latency_seconds_bucket{method="get",le="1"} 3',
+            'latency_seconds_bucket{method="get",le="+Inf"} 4',
+            'latency_seconds_sum{method="get"} 2.65',
+            'latency_seconds_count{method="get"} 4',
+        ]
+
+    def test_registry_runs_collectors_first(self):
+        registry = Registry()
+        running = registry.register(Gauge("running", "Running tasks"))
+        registry.add_collector(lambda: running.set(3))
+
+        assert registry.render() == (
+            "# HELP running Running tasks\n# TYPE running gauge\nrunning 3\n"
+        )
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from bot_context import BotContext
+from circuit_breaker import CircuitBreaker, CircuitState
+from http_server import HttpServer, Request
+from metrics import REGISTRY
+from monitoring import Monitoring
+
+
+@pytest.fixture
+def monitoring(monkeypatch):
+    # the collector reads the fakes, it mustn't stay in the shared registry
+    monkeypatch.setattr(REGISTRY, "collectors", [])
+    bot = SimpleNamespace(last_poll_at=time.monotonic(), context=BotContext())
+    return Monitoring(
+        HttpServer(),
+        bot,
+        event_handler=None,
+        db=None,
+        webapp_client=SimpleNamespace(breaker=CircuitBreaker("webapp")),
+        loop_monitor=SimpleNamespace(lag=0.0),
+    )
+
+
+def get_health(monitoring):
+    response = asyncio.run(
+        monitoring.server.routes["/healthz"](Request("GET", "/healthz", {}, {}))
+    )
+    return response.status, json.loads(response.body)
+
+
+class TestHealthz:
+    def test_healthy(self, monitoring):
+        status, health = get_health(monitoring)
+
+        assert status == 200
+        assert health["healthy"] is True
+        assert health["degraded"] == []
+
+    def test_degraded_when_the_webapp_circuit_is_open(self, monitoring):
+        monitoring.webapp_client.breaker.state = CircuitState.OPEN
+        status, health = get_health(monitoring)
+
+        # still able to poll, so the instance isn't restarted
+        assert status == 200
+        assert health["degraded"] == ["webapp"]
+        assert health["webapp"] == "open"
+
+    def test_degraded_when_the_loop_lags(self, monitoring):
+        monitoring.loop_monitor.lag = Monitoring.MAX_LOOP_LAG * 2
+        status, health = get_health(monitoring)
+
+        assert status == 200
+        assert health["degraded"] == ["event_loop"]
+
+    def test_unhealthy_when_polling_stalls(self, monitoring):
+        monitoring.bot.last_poll_at -= Monitoring.MAX_POLL_AGE + 1
+        status, health = get_health(monitoring)
+
+        assert status == 503
+        assert health["healthy"] is False
@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+
+from outbox import OutboxRelay
+
+
+def make_message(message_id, chat_id, text, attempts=1):
+    return SimpleNamespace(
+        id=message_id, chat_id=chat_id, text=text, parse_mode="HTML", attempts=attempts
+    )
+
+
+class FakeOutboxRepository:
+    def __init__(self, messages):
+        self.messages = messages
+        self.delivered = []
+        self.failed = []
+
+    async def claim(self, limit, lease):
+        messages, self.messages = self.messages[:limit], self.messages[limit:]
+        return messages
+
+    async def mark_delivered(self, ids):
+        self.delivered.extend(ids)
+
+    async def mark_failed(self, ids, error, retry_in):
+        self.failed.extend((message_id, retry_in) for message_id in ids)
+
+
+def relay(telegram_client, messages, statuses):
+    repository = FakeOutboxRepository(messages)
+    telegram_client.statuses = statuses
+    asyncio.run(OutboxRelay(telegram_client, repository).relay_batch())
+    return telegram_client.sent, repository
+
+
+class TestOutboxRelay:
+    def test_delivers_messages(self, telegram_client):
+        sent, repository = relay(
+            telegram_client, [make_message(1, 10, "a"), make_message(2, 20, "b")], {}
+        )
+
+        assert sorted(sent) == ["a", "b"]
+        assert sorted(repository.delivered) == [1, 2]
+
+    def test_retries_keep_chat_order(self, telegram_client):
+        messages = [
+            make_message(1, 10, "a"),
+            make_message(2, 10, "b"),
+            make_message(3, 10, "c"),
+            make_message(4, 20, "d"),
+        ]
+        sent, repository = relay(telegram_client, messages, {"b": 502})
+
+        assert "c" not in sent
+        assert sorted(repository.delivered) == [1, 4]
+        assert repository.failed == [(2, 5), (3, 5)]
+
+    def test_client_errors_are_not_retried(self, telegram_client):
+        _, repository = relay(
+            telegram_client,
+            [make_message(1, 10, "a"), make_message(2, 10, "b")],
+            {"a": 403},
+        )
+
+        assert repository.delivered == [2]
+        assert repository.failed == [(1, None)]
@@ -0,0 +1,53 @@
+from utils.privacy import MASK, redact, redact_bot_token
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 2,
+        "from": {"id": 10, "is_bot": False, "first_name": "Alex", "username": "alex"},
+        "chat": {"id": -100, "title": "Notes", "type": "supergroup"},
+        "forward_from": {"id": 11, "first_name": "Sam"},
+        "forward_from_chat": {"id": -200, "username": "news", "type": "channel"},
+        "date": 1641987371,
+        "text": "Hello #tag",
+        "entities": [{"offset": 6, "length": 4, "type": "hashtag"}],
+    },
+}
+
+
+class TestRedact:
+    def test_masks_fields(self):
+        message = redact(UPDATE)["message"]
+
+        assert message["from"] == {
+            "id": MASK,
+            "is_bot": False,
+            "first_name": MASK,
+            "username": MASK,
+        }
+        assert message["chat"] == {"id": -100, "title": MASK, "type": "supergroup"}
+        assert message["forward_from"] == {"id": MASK, "first_name": MASK}
+        assert message["forward_from_chat"]["username"] == MASK
+        assert message["text"] == MASK
+
+    def test_copies_only_changed_dicts(self):
+        redacted = redact(UPDATE)
+
+        assert UPDATE["message"]["text"] == "Hello #tag"
+        assert redacted["message"] is not UPDATE["message"]
+        assert redacted["message"]["entities"] is UPDATE["message"]["entities"]
+
+        unchanged = {"update_id": 1, "poll": {"id": "5", "options": []}}
+        assert redact(unchanged) is unchanged
+
+
+class TestRedactBotToken:
+    def test_redacts_token(self):
+        token = "1234567890:" + "a" * 35
+        url = f"https://api.telegram.org/bot{token}/getUpdates"
+
+        assert redact_bot_token(url) == f"https://api.telegram.org/bot{MASK}/getUpdates"
+
+    def test_keeps_messages_without_token(self):
+        message = "Processing update 1"
+        assert redact_bot_token(message) is message
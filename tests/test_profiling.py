@@ -0,0 +1,76 @@
+import asyncio
+import json
+import tracemalloc
+
+import pytest
+
+from http_server import HttpServer, Request
+from profiling import Profiling
+
+
+def make_request(path, token="secret", **query):
+    headers = {"x-admin-token": token} if token else {}
+    return Request("GET", path, query, headers)
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    monkeypatch.setattr(Profiling, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(Profiling, "PROFILE_DIR", str(tmp_path))
+    server = HttpServer()
+    Profiling(server, bot=None, event_handler=None)
+    yield server
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def call(server, *requests):
+    # the requests are handled concurrently, like on separate connections
+    async def scenario():
+        handler = server._find_handler(requests[0].path)
+        return await asyncio.gather(*(handler(request) for request in requests))
+
+    return asyncio.run(scenario())
+
+
+class TestProfiling:
+    def test_no_routes_without_a_token(self, monkeypatch):
+        monkeypatch.setattr(Profiling, "ADMIN_TOKEN", None)
+        server = HttpServer()
+        Profiling(server, bot=None, event_handler=None)
+
+        assert server._find_handler("/debug/cpu") is None
+
+    @pytest.mark.parametrize("token", [None, "wrong", "secret2"])
+    def test_rejects_bad_tokens(self, server, token):
+        (response,) = call(server, make_request("/debug/cpu", token, seconds="0"))
+
+        assert response.status == 403
+
+    def test_token_in_query(self, server):
+        request = Request("GET", "/debug/tracemalloc/stop", {"token": "secret"}, {})
+        (response,) = call(server, request)
+
+        assert response.status == 200
+
+    def test_one_profile_at_a_time(self, server):
+        first, second = call(
+            server,
+            make_request("/debug/cpu", seconds="0.2"),
+            make_request("/debug/cpu", seconds="0.2"),
+        )
+
+        assert first.status == 200
+        assert json.loads(first.body)["mode"] == "sample"
+        assert second.status == 409
+
+    def test_no_tracemalloc_start_during_a_profile(self, server):
+        profile, start = call(
+            server,
+            make_request("/debug/cpu", seconds="0.2"),
+            make_request("/debug/tracemalloc/start"),
+        )
+
+        assert profile.status == 200
+        assert start.status == 409
+        assert not tracemalloc.is_tracing()
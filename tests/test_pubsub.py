@@ -0,0 +1,63 @@
+import asyncio
+import json
+import time
+from dataclasses import asdict
+
+from event_handler import EventHandler
+from pubsub import Event, RedisPubSub
+
+
+class FakeRedis:
+    def __init__(self, events):
+        self.messages = [json.dumps(asdict(event)).encode() for event in events]
+
+    async def blpop(self, key, timeout):
+        if not self.messages:
+            await asyncio.sleep(0.01)
+            return None
+        return key, self.messages.pop(0)
+
+    async def lpush(self, key, *values):
+        for value in values:
+            self.messages.insert(0, value)
+
+
+class SlowEventHandler(EventHandler):
+    SHUTDOWN_TIMEOUT = 0.1
+
+    def __init__(self):
+        super().__init__(telegram_client=None, user_repository=None)
+        self.processed = []
+
+    async def process_user_event(self, event):
+        # odd ids don't finish before the shutdown
+        if int(event.id) % 2:
+            await asyncio.sleep(60)
+        self.processed.append(event.id)
+
+
+def make_events(*ids):
+    published_at = time.time() - 10
+    return [
+        Event("user_event", {"user_id": 1}, published_at + id_, str(id_)) for id_ in ids
+    ]
+
+
+class TestRequeue:
+    def test_requeues_unfinished_events(self):
+        async def scenario():
+            redis = FakeRedis(make_events(1, 2, 3, 4))
+            pubsub = RedisPubSub(SlowEventHandler(), redis)
+            running = asyncio.create_task(pubsub.run())
+            await asyncio.sleep(0.05)
+            pubsub.stop()
+            await asyncio.wait_for(running, 5)
+            await pubsub.shutdown()
+            return pubsub.event_handler.processed, redis.messages
+
+        processed, messages = asyncio.run(scenario())
+
+        assert processed == ["2", "4"]
+        # back at the front of the list, in the order they were received
+        ids = [json.loads(message)["id"] for message in messages]
+        assert ids == ["1", "3"]
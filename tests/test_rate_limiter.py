@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from bot import Bot
+from entities import Message
+from rate_limiter import RateLimit, RedisSlidingWindowLimiter, SlidingWindowLimiter
+
+LIMIT = RateLimit(2, 10)
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    # a stand-in for the time module, so that the event loop keeps its clock
+    monkeypatch.setattr(
+        rate_limiter, "time", SimpleNamespace(monotonic=clock, time=clock)
+    )
+    return clock
+
+
+def hits(limiter, *checks):
+    async def scenario():
+        return [await limiter.hit_all(list(check)) for check in checks]
+
+    return asyncio.run(scenario())
+
+
+class TestSlidingWindowLimiter:
+    def test_limit_edge(self, clock):
+        limiter = SlidingWindowLimiter()
+        check = [("a", LIMIT)]
+
+        assert hits(limiter, check, check, check) == [None, None, "a"]
+
+    def test_window_slides(self, clock):
+        limiter = SlidingWindowLimiter()
+        check = [("a", LIMIT)]
+        hits(limiter, check)
+        clock.now += 5
+        hits(limiter, check)
+
+        clock.now += 5
+        # the first hit has left the window, the second hasn't
+        assert hits(limiter, check, check) == [None, "a"]
+
+    def test_rejected_hits_are_not_recorded(self, clock):
+        limiter = SlidingWindowLimiter()
+        chat_full = [("user", LIMIT), ("chat", RateLimit(1, 10))]
+        hits(limiter, chat_full)
+
+        assert hits(limiter, chat_full, chat_full) == ["chat", "chat"]
+        # the user key only has the one hit that was allowed
+        assert hits(limiter, [("user", LIMIT)]) == [None]
+
+
+class TestRedisSlidingWindowLimiter:
+    def test_limits(self, connect_redis):
+        async def scenario():
+            limiter = RedisSlidingWindowLimiter(await connect_redis())
+            chat_full = [("user", RateLimit(3, 10)), ("chat", RateLimit(1, 10))]
+            results = [await limiter.hit_all(chat_full) for _ in range(3)]
+            results.append(await limiter.hit_all([("user", RateLimit(2, 10))]))
+            results.append(await limiter.hit_all([("user", RateLimit(2, 10))]))
+            return results
+
+        assert asyncio.run(scenario()) == [None, "chat", "chat", None, "user"]
+
+    def test_window_slides(self, connect_redis):
+        async def scenario():
+            limiter = RedisSlidingWindowLimiter(await connect_redis())
+            limit = RateLimit(1, 0.2)
+            first = await limiter.hit("a", limit)
+            second = await limiter.hit("a", limit)
+            await asyncio.sleep(0.3)
+            return first, second, await limiter.hit("a", limit)
+
+        assert asyncio.run(scenario()) == (True, False, True)
+
+
+class TestBotFloodLimits:
+    def test_bots_have_their_own_limits(self, clock, telegram_client, make_update):
+        async def scenario():
+            limiter = SlidingWindowLimiter()
+            allowed = {}
+            for username in ("one_bot", "other_bot"):
+                bot = Bot(
+                    telegram_client=telegram_client,
+                    webapp_client=None,
+                    user_repository=None,
+                    flood_limiter=limiter,
+                    username=username,
+                )
+                allowed[username] = []
+                for update_id in range(Bot.USER_RATE_LIMIT.limit + 1):
+                    message = Message.from_json(make_update(update_id)["message"])
+                    allowed[username].append(
+                        await bot.check_flood(message, message.command)
+                    )
+            return allowed
+
+        expected = [True] * Bot.USER_RATE_LIMIT.limit + [False]
+        assert asyncio.run(scenario()) == {
+            "one_bot": expected,
+            "other_bot": expected,
+        }
@@ -0,0 +1,93 @@
+import asyncio
+import inspect
+
+import pytest
+
+from task_manager import TaskManager
+
+
+class TestTaskManager:
+    @pytest.fixture
+    def task_manager(self):
+        task_manager = TaskManager(max_parallel_tasks=1)
+        task_manager.add_lane("fast", 2)
+        return task_manager
+
+    def test_lanes_are_independent(self, task_manager):
+        async def scenario():
+            slow_started = asyncio.Event()
+            release = asyncio.Event()
+
+            async def slow():
+                slow_started.set()
+                await release.wait()
+
+            async def fast():
+                return "done"
+
+            await task_manager.run_task(slow())
+            await slow_started.wait()
+
+            task = await task_manager.run_task(fast(), lane="fast")
+            result = await asyncio.wait_for(task, 1)
+
+            release.set()
+            await task_manager.drain()
+            return result
+
+        assert asyncio.run(scenario()) == "done"
+        assert task_manager.stats()["fast"]["completed"] == 1
+        assert task_manager.stats()["default"]["completed"] == 1
+
+    def test_timeout(self, task_manager):
+        async def scenario():
+            task = await task_manager.run_task(asyncio.sleep(10), timeout=0.01)
+            await task
+
+        asyncio.run(scenario())
+        stats = task_manager.stats()["default"]
+        assert stats["timed_out"] == 1
+        assert stats["running"] == 0
+
+    def test_drain_cancels_leftover_tasks(self, task_manager):
+        async def scenario():
+            await task_manager.run_task(asyncio.sleep(10))
+            drained = await task_manager.drain(timeout=0.01)
+            dropped = await task_manager.run_task(asyncio.sleep(0))
+            return drained, dropped
+
+        drained, dropped = asyncio.run(scenario())
+        assert drained is False
+        assert dropped is None
+        assert task_manager.stats()["default"]["cancelled"] == 1
+
+    def test_drain_waits_for_tasks_started_meanwhile(self, task_manager):
+        async def scenario():
+            await task_manager.run_task(asyncio.sleep(0.05))
+            # accepted before the drain, it starts once the first task is done
+            waiting = asyncio.create_task(task_manager.run_task(asyncio.sleep(0.05)))
+            await asyncio.sleep(0)
+            drained = await task_manager.drain(timeout=5)
+            return drained, (await waiting).done()
+
+        assert asyncio.run(scenario()) == (True, True)
+        assert task_manager.stats()["default"]["completed"] == 2
+
+    def test_cancelled_while_waiting_closes_the_coroutine(self, task_manager):
+        async def handler():
+            pass
+
+        async def scenario():
+            await task_manager.run_task(asyncio.sleep(10))
+            coro = handler()
+            waiting = asyncio.create_task(task_manager.run_task(coro))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            await task_manager.drain(timeout=0)
+            return coro
+
+        coro = asyncio.run(scenario())
+        assert inspect.getcoroutinestate(coro) == inspect.CORO_CLOSED
+        assert task_manager.stats()["default"]["waiting"] == 0
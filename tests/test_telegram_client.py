@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from bot import Bot
+from callback_handlers import CallbackHandler, CallbackHandlerRegistry
+from telegram_client import TelegramClient
+
+
+async def serve_slowly(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    await asyncio.sleep(0.5)
+    body = b'{"ok": true, "result": true}'
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+        b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+    )
+    await writer.drain()
+    writer.close()
+
+
+class TestTelegramClient:
+    def test_requires_a_token(self):
+        with pytest.raises(ValueError):
+            TelegramClient("")
+
+    @pytest.mark.parametrize("connections, timed_out", [(2, False), (1, True)])
+    def test_gives_up_waiting_for_a_connection(
+        self, monkeypatch, connections, timed_out
+    ):
+        monkeypatch.setattr(TelegramClient, "POOL_TIMEOUT", 0.1)
+
+        async def scenario():
+            server = await asyncio.start_server(serve_slowly, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            client = TelegramClient(
+                "token", http_client=TelegramClient.make_http_client(connections)
+            )
+            url = f"http://127.0.0.1:{port}/bottoken/sendMessage"
+            try:
+                return await asyncio.gather(
+                    client._post(url, {}), client._post(url, {})
+                )
+            finally:
+                await client._client.aclose()
+                server.close()
+                await server.wait_closed()
+
+        first, second = asyncio.run(scenario())
+
+        assert first.ok
+        assert second.timeout is timed_out
+        assert second.ok is not timed_out
+
+
+class PollingClient(TelegramClient):
+    # answers getUpdates with the given numbers of updates, records the params
+    def __init__(self, batches):
+        batches = iter(batches)
+        self.requests = []
+        self.next_update_id = 1
+
+        def handler(request):
+            self.requests.append(dict(request.url.params))
+            count = next(batches)
+            updates = [
+                {"update_id": update_id}
+                for update_id in range(self.next_update_id, self.next_update_id + count)
+            ]
+            self.next_update_id += count
+            return httpx.Response(200, json={"ok": True, "result": updates})
+
+        super().__init__(
+            "token",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+    def poll(self, allowed_updates=None):
+        async def scenario():
+            return await self.get_updates(allowed_updates)
+
+        return asyncio.run(scenario())
+
+
+class TestPolling:
+    def test_grows_the_limit_while_catching_up(self):
+        client = PollingClient([10, 20, 40, 80, 100, 100])
+        for _ in range(6):
+            client.poll()
+
+        limits = [int(params["limit"]) for params in client.requests]
+        assert limits == [10, 20, 40, 80, 100, 100]
+        # a full batch means there are more updates waiting, they're fetched without
+        # a long poll
+        timeouts = [int(params["timeout"]) for params in client.requests]
+        assert timeouts == [TelegramClient.POLL_INTERVAL] + [0] * 5
+
+    def test_shrinks_the_limit_when_idle(self):
+        client = PollingClient([10, 20, 3, 3, 3, 0])
+        for _ in range(6):
+            client.poll()
+
+        limits = [int(params["limit"]) for params in client.requests]
+        assert limits == [10, 20, 40, 20, 10, 10]
+        timeouts = [int(params["timeout"]) for params in client.requests]
+        assert (
+            timeouts
+            == [TelegramClient.POLL_INTERVAL, 0, 0] + [TelegramClient.POLL_INTERVAL] * 3
+        )
+
+    def test_keeps_the_limit_for_a_half_full_batch(self):
+        client = PollingClient([10, 10, 10])
+        for _ in range(3):
+            client.poll()
+
+        limits = [int(params["limit"]) for params in client.requests]
+        assert limits == [10, 20, 20]
+        assert int(client.requests[-1]["timeout"]) == TelegramClient.POLL_INTERVAL
+
+    def test_sends_allowed_updates(self):
+        client = PollingClient([0, 0])
+        client.poll(["message"])
+        client.poll()
+
+        assert json.loads(client.requests[0]["allowed_updates"]) == ["message"]
+        assert "allowed_updates" not in client.requests[1]
+
+
+class TestAllowedUpdates:
+    def test_derived_from_handlers(self, monkeypatch):
+        monkeypatch.setattr(CallbackHandlerRegistry, "callback_handlers", {})
+        assert Bot.get_allowed_updates() == ["message"]
+
+        class VoteHandler(CallbackHandler):
+            prefix = "vote"
+
+        assert CallbackHandlerRegistry.get_for_prefix("vote") is VoteHandler
+        assert Bot.get_allowed_updates() == ["callback_query", "message"]
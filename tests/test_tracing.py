@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+import tracing
+from tracing import (
+    NOOP_SPAN,
+    current_trace_id,
+    span,
+    start_span,
+    trace,
+    traced,
+    use_span,
+)
+
+
+@pytest.fixture
+def reported(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACING_ENABLED", True)
+    reported = []
+    monkeypatch.setattr(tracing, "_report", reported.append)
+    return reported
+
+
+def names(span_):
+    return [span_.name, [names(child) for child in span_.children]]
+
+
+class TestTracing:
+    def test_spans_nest_across_awaits(self, reported):
+        async def handler():
+            with span("handler") as handler_span:
+                await asyncio.sleep(0)
+                with span("webapp", attempt=0):
+                    await asyncio.sleep(0)
+                handler_span.set(status="ok")
+            with span("reply"):
+                await asyncio.sleep(0)
+
+        async def scenario():
+            with trace("update", update_id=1) as root:
+                trace_id = current_trace_id()
+                await handler()
+            return root, trace_id
+
+        root, trace_id = asyncio.run(scenario())
+
+        assert reported == [root]
+        assert trace_id == root.trace_id
+        assert names(root) == [
+            "update",
+            [["handler", [["webapp", []]]], ["reply", []]],
+        ]
+        handler_span = root.children[0]
+        assert handler_span.attributes == {"status": "ok"}
+        assert handler_span.children[0].attributes == {"attempt": 0}
+        assert handler_span.children[0].trace_id == root.trace_id
+
+    def test_errors_are_recorded(self, reported):
+        with pytest.raises(ValueError):
+            with trace("update"):
+                with span("handler"):
+                    raise ValueError("bad")
+
+        assert reported[0].error == "ValueError('bad')"
+        assert reported[0].children[0].error == "ValueError('bad')"
+
+    def test_reported_once_spawned_spans_finish(self, reported):
+        async def scenario():
+            finish = asyncio.Event()
+
+            async def spawned(task_span):
+                with use_span(task_span):
+                    with span("reply"):
+                        await finish.wait()
+                task_span.finish()
+
+            with trace("update") as root:
+                task = asyncio.create_task(spawned(start_span("task")))
+                await asyncio.sleep(0)
+
+            # the root has exited, the task's span and the one in it are still open
+            assert root.open_spans == 2
+            assert reported == []
+            finish.set()
+            await task
+            return root
+
+        root = asyncio.run(scenario())
+
+        assert reported == [root]
+        assert names(root) == ["update", [["task", [["reply", []]]]]]
+        assert root.duration >= root.children[0].duration
+
+    def test_traced_functions(self, reported):
+        @traced()
+        def parse(data):
+            return data.upper()
+
+        @traced("fetch")
+        async def fetch(key):
+            await asyncio.sleep(0)
+            return parse(key)
+
+        async def scenario():
+            with trace("update") as root:
+                result = await fetch("user")
+            return result, root
+
+        result, root = asyncio.run(scenario())
+
+        assert result == "USER"
+        assert names(root) == [
+            "update",
+            [["fetch", [["TestTracing.test_traced_functions.<locals>.parse", []]]]],
+        ]
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
+        reported = []
+        monkeypatch.setattr(tracing, "_report", reported.append)
+
+        @traced()
+        async def fetch():
+            return current_trace_id()
+
+        async def scenario():
+            with trace("update") as root:
+                with span("handler") as handler_span:
+                    return root, handler_span, start_span("task"), await fetch()
+
+        assert asyncio.run(scenario()) == (NOOP_SPAN, NOOP_SPAN, None, None)
+        assert reported == []
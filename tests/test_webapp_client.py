@@ -0,0 +1,155 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitState
+from exceptions import CircuitOpenError, WebappUnavailableError
+from webapp_client import WebappClient
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    # a stand-in for the time module, so that the event loop keeps its clock
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self, clock):
+        breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=10)
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_success_resets_failures(self, clock):
+        breaker = CircuitBreaker("test", failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.CLOSED
+
+    def test_half_open_lets_one_probe_through(self, clock):
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=10)
+        breaker.record_failure()
+        clock.now += 10
+
+        breaker.before_call()
+        assert breaker.state == CircuitState.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+        breaker.before_call()
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=10)
+        breaker.record_failure()
+        clock.now += 10
+        breaker.before_call()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+
+def make_client(handler):
+    client = WebappClient()
+    client.BASE_URL = "http://webapp"
+    client.RETRY_BACKOFF = 0
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+class TestWebappClient:
+    def test_retries_idempotent_requests(self):
+        statuses = iter([503, 502, 200])
+
+        def handler(request):
+            return httpx.Response(next(statuses), json={"url": "/link"})
+
+        client = make_client(handler)
+        result = asyncio.run(client.make_bot_token("token"))
+
+        assert result == {"url": "/link"}
+        assert client.breaker.consecutive_failures == 0
+
+    def test_gives_up_after_retries(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(503)
+
+        client = make_client(handler)
+        with pytest.raises(WebappUnavailableError):
+            asyncio.run(client.make_bot_token("token"))
+
+        assert len(requests) == WebappClient.MAX_RETRIES + 1
+
+    def test_does_not_retry_other_errors(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(500)
+
+        client = make_client(handler)
+        with pytest.raises(WebappUnavailableError):
+            asyncio.run(client.make_bot_token("token"))
+
+        assert len(requests) == 1
+
+    def test_cancelled_probe_is_released(self, clock):
+        async def handler(request):
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"url": "/link"})
+
+        async def scenario():
+            client = make_client(handler)
+            client.breaker.state = CircuitState.OPEN
+            client.breaker.opened_at = clock.now - client.breaker.recovery_timeout
+
+            probe = asyncio.create_task(client.make_bot_token("token"))
+            await asyncio.sleep(0.05)
+            assert client.breaker.state == CircuitState.HALF_OPEN
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+
+            # not a failure, the next call is let through as the probe
+            assert client.breaker.state == CircuitState.HALF_OPEN
+            client._client = httpx.AsyncClient(
+                transport=httpx.MockTransport(lambda request: httpx.Response(200))
+            )
+            await client._get("http://webapp/", {})
+            return client.breaker.state
+
+        assert asyncio.run(scenario()) == CircuitState.CLOSED
+
+    def test_cancelled_call_is_not_a_failure(self):
+        async def handler(request):
+            await asyncio.sleep(1)
+            return httpx.Response(200)
+
+        async def scenario():
+            client = make_client(handler)
+            request = asyncio.create_task(client._get("http://webapp/", {}))
+            await asyncio.sleep(0.05)
+            request.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await request
+            return client.breaker.consecutive_failures
+
+        assert asyncio.run(scenario()) == 0
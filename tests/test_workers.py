@@ -0,0 +1,230 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from pubsub import Event
+from workers import (
+    IngestBot,
+    LocalTransport,
+    RedisTransport,
+    Router,
+    Worker,
+    get_chat_id,
+    get_partition,
+    stop_processes,
+)
+
+
+class FakeBot:
+    def __init__(self):
+        self.processed = []
+
+    async def process_update(self, update):
+        chat_id = update["message"]["chat"]["id"]
+        # the first update of chat 1 is the slowest
+        delay = 0.05 if update["update_id"] == 1 else 0
+
+        async def handle():
+            await asyncio.sleep(delay)
+            self.processed.append((chat_id, update["update_id"]))
+
+        return asyncio.create_task(handle())
+
+
+class FakeEventHandler:
+    def __init__(self):
+        self.events = []
+
+    async def handle(self, event):
+        self.events.append(event)
+
+
+class TestWorker:
+    def test_keeps_order_within_chat(self, make_update):
+        async def scenario():
+            transport = LocalTransport(1)
+            router = Router(transport)
+            for update_id, chat_id in [(1, 1), (2, 2), (3, 1), (4, 1), (5, 2)]:
+                await router.route_update(make_update(update_id, chat_id))
+            await router.route_event(Event("user_event", {"user_id": 7}, 0, "id"))
+            await transport.close()
+
+            bot, event_handler = FakeBot(), FakeEventHandler()
+            worker = Worker(bot, event_handler, transport.receiver(0))
+            await asyncio.wait_for(worker.run(), 5)
+            return bot.processed, event_handler.events
+
+        processed, events = asyncio.run(scenario())
+
+        assert [u for chat, u in processed if chat == 1] == [1, 3, 4]
+        assert [u for chat, u in processed if chat == 2] == [2, 5]
+        # chat 2 isn't held up by the slow update in chat 1
+        assert processed.index((2, 5)) < processed.index((1, 1))
+        assert events == [Event("user_event", {"user_id": 7}, 0, "id")]
+
+    def test_requeues_unfinished_updates(self, monkeypatch, make_update):
+        monkeypatch.setattr(Worker, "SHUTDOWN_TIMEOUT", 0.1)
+
+        class SlowBot(FakeBot):
+            async def process_update(self, update):
+                # updates of chat 2 don't finish before the shutdown
+                if update["message"]["chat"]["id"] == 2:
+                    return asyncio.create_task(asyncio.sleep(60))
+                return await super().process_update(update)
+
+        class FakeReceiver:
+            def __init__(self, items):
+                self.items = list(items)
+                self.requeued = None
+
+            async def receive(self):
+                return self.items.pop(0) if self.items else None
+
+            async def requeue(self, items):
+                self.requeued = items
+
+        async def scenario():
+            receiver = FakeReceiver(
+                {"update": make_update(update_id, chat_id)}
+                for update_id, chat_id in [(1, 1), (3, 2), (2, 2), (4, 1)]
+            )
+            bot = SlowBot()
+            worker = Worker(bot, FakeEventHandler(), receiver)
+            await asyncio.wait_for(worker.run(), 5)
+            return bot.processed, receiver.requeued
+
+        processed, requeued = asyncio.run(scenario())
+
+        assert processed == [(1, 1), (1, 4)]
+        # in update order, so they're processed in the order they were sent
+        assert requeued == [
+            {"update": make_update(2, 2)},
+            {"update": make_update(3, 2)},
+        ]
+
+
+class FakeHandover:
+    def __init__(self):
+        self.released = None
+
+    async def release(self, name, last_update_id, updates):
+        self.released = last_update_id, updates
+
+
+def test_unfinished_local_updates_are_handed_over(make_update):
+    async def scenario():
+        transport = LocalTransport(2)
+        handover = FakeHandover()
+        bot = IngestBot(
+            Router(transport),
+            telegram_client=SimpleNamespace(last_update_id=9),
+            webapp_client=None,
+            user_repository=None,
+            handover=handover,
+        )
+        bot._unfinished = [make_update(9, 3)]
+        # the ingest process waits for the workers before it hands over
+        await bot.release_handover()
+        assert handover.released is None
+
+        await transport.receiver(0).requeue([{"update": make_update(7, 1)}])
+        await transport.receiver(1).requeue([])
+        await bot.take_back(5)
+        return handover.released
+
+    assert asyncio.run(scenario()) == (9, [make_update(7, 1), make_update(9, 3)])
+
+
+def test_take_back_gives_up_on_a_missing_worker(make_update):
+    async def scenario():
+        transport = LocalTransport(2)
+        await transport.receiver(0).requeue([{"update": make_update(7, 1)}])
+        return await transport.take_back(0.1)
+
+    assert asyncio.run(scenario()) == [{"update": make_update(7, 1)}]
+
+
+def test_local_transport_waits_for_room(monkeypatch):
+    monkeypatch.setattr(LocalTransport, "QUEUE_SIZE", 1)
+
+    async def scenario():
+        transport = LocalTransport(1)
+        loop = asyncio.get_running_loop()
+        await transport.send(0, {"update": 1})
+        sending = asyncio.create_task(transport.send(0, {"update": 2}))
+        await asyncio.sleep(0.1)
+        assert not sending.done()
+
+        first = await loop.run_in_executor(None, transport.queues[0].get)
+        await asyncio.wait_for(sending, 5)
+        second = await loop.run_in_executor(None, transport.queues[0].get)
+        return first, second
+
+    assert asyncio.run(scenario()) == ({"update": 1}, {"update": 2})
+
+
+class FakeProcess:
+    def __init__(self, name, runs_for, pid=None):
+        self.name = name
+        self.ends_at = time.monotonic() + runs_for
+        self.pid = pid
+        self.terminated = False
+
+    def join(self, timeout):
+        time.sleep(max(0.0, min(timeout, self.ends_at - time.monotonic())))
+
+    def is_alive(self):
+        return not self.terminated and time.monotonic() < self.ends_at
+
+    def terminate(self):
+        self.terminated = True
+
+
+def test_stop_processes_shares_the_timeout():
+    processes = [FakeProcess(f"worker-{i}", 0.2) for i in range(3)]
+    stuck = FakeProcess("worker-3", 60)
+
+    started_at = time.monotonic()
+    stop_processes([*processes, stuck], 0.5)
+
+    # they're waited for at the same time, not one after another
+    assert time.monotonic() - started_at < 0.8
+    assert not any(process.terminated for process in processes)
+    assert stuck.terminated
+
+
+def test_get_partition():
+    assert get_partition(-1001172399514, 4) == get_partition(-1001172399514, 4)
+    assert {get_partition(chat_id, 4) for chat_id in range(100)} == {0, 1, 2, 3}
+    assert 0 <= get_partition("token", 4) < 4
+
+
+class TestRedisTransport:
+    def test_close_stops_receivers(self, connect_redis, redis_url, make_update):
+        async def scenario():
+            redis = await connect_redis()
+            # left by a transport that has been restarted since
+            stale = RedisTransport(redis, redis_url, 1)
+            await stale.close()
+
+            transport = RedisTransport(redis, redis_url, 1)
+            await transport.send(0, {"update": make_update(1, 1)})
+            await transport.close()
+            receiver = transport.receiver(0)
+            items = []
+            while (item := await asyncio.wait_for(receiver.receive(), 5)) is not None:
+                items.append(item)
+            return items
+
+        assert asyncio.run(scenario()) == [{"update": make_update(1, 1)}]
+
+
+def test_get_chat_id(make_update):
+    assert get_chat_id(make_update(1, 5)) == 5
+    callback_query = {"id": "1", "from": {"id": 7}, "data": "vote:1"}
+    message = {"chat": {"id": 5}}
+    assert get_chat_id({"callback_query": {**callback_query, "message": message}}) == 5
+    # a button of an inline message
+    inline = {**callback_query, "inline_message_id": "abc"}
+    assert get_chat_id({"callback_query": inline}) == 7
+    assert get_chat_id({"update_id": 1, "poll": {}}) is None